@@ -0,0 +1,54 @@
+import gc
+import time
+import tracemalloc
+from fixtures import load_dump
+from domain_model import Catalog_Model
+
+COLLECTIONS = ("t_rd", "t_ps", "t_rc")
+
+
+# Bytes still allocated once build() returns, everything the result refers to is counted
+def retained(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+def load_dicts():
+    return {name: load_dump(name) for name in COLLECTIONS}
+
+
+def load_model():
+    dicts = load_dicts()
+    model = Catalog_Model(dicts["t_rd"], dicts["t_ps"], dicts["t_rc"])
+    # Only the model stays, like in the GUI once the loader's cursors are gone
+    del dicts
+    return model
+
+
+def main():
+    dicts, dict_bytes, dict_peak, dict_t = retained(load_dicts)
+    model, model_bytes, model_peak, model_t = retained(load_model)
+
+    # Same relics either way
+    for relic in load_dump("t_rc"):
+        doc = model.relic_doc(model.relics[relic["relic_name"]])
+        assert [r["part_url"] for r in doc["relic_detail"]["part_rewards"]] == \
+               [r["part_url"] for r in relic["relic_detail"]["part_rewards"]]
+
+    shared = sum(len(relic.rewards) for relic in model.relics.values())
+    print(f"{len(model.sets)} sets, {len(model.parts)} parts, {len(model.relics)} relics, {shared} reward slots")
+    print(f"dicts: {dict_bytes / 1024:8.1f} KiB retained, {dict_peak / 1024:8.1f} KiB peak, {dict_t * 1000:.1f} ms")
+    print(f"model: {model_bytes / 1024:8.1f} KiB retained, {model_peak / 1024:8.1f} KiB peak, {model_t * 1000:.1f} ms "
+          f"({dict_bytes / model_bytes:.1f}x smaller)")
+    del dicts
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+from fixtures import ROOT, compare_to_dumps, compare_embedded_prices
+
+RESULTS = os.path.join(ROOT, "benchmarks", "results", "end_to_end.jsonl")
+MODES = ("cold", "warm", "incremental")
+STAGES = ("load_raw_and_price", "load_prime_sets", "load_relics", "load_leaderboards")
+DB_NAME = "bench_db"
+STATE_COLLECTIONS = ("t_rd", "t_ps", "t_rc", "t_ri", "t_cj", "t_lb")
+
+# cold:        empty store, empty HTTP cache
+# warm:        empty store, HTTP cache filled by the cold run
+# incremental: store and cache from the warm run, a share of the prices moved and went stale
+
+
+def open_storage(kind, mode, state_dir):
+    from storage import Memory_Storage, Mongo_Storage
+    if kind == "memory":
+        return Memory_Storage(DB_NAME, dump_dir=state_dir, load=mode == "incremental", dumped=STATE_COLLECTIONS)
+    storage = Mongo_Storage(db_name=DB_NAME)
+    if mode != "incremental":
+        storage.client.drop_database(DB_NAME)
+    return storage
+
+
+def db_ops(kind, storage):
+    if kind == "memory":
+        return sum(collection.ops for collection in storage.collections.values())
+    counters = storage.db.command("serverStatus")["opcounters"]
+    return sum(counters[key] for key in ("insert", "query", "update", "delete", "getmore"))
+
+
+async def mock_call(api_base, path, payload=None):
+    root = api_base.rsplit("/v1", 1)[0]
+    async with aiohttp.ClientSession() as session:
+        if payload is None:
+            async with session.get(root + path) as resp:
+                return await resp.json()
+        async with session.post(root + path, json=payload) as resp:
+            return await resp.json()
+
+
+# Ages a share of t_rd past its ttl and moves those prices on the mock, like a later scheduled run would find.
+# Their cached statistics are still fresh, the loader has to revalidate them itself.
+async def prepare_incremental(database, dfc_options, fraction, seed):
+    names = sorted(doc["url_name"] for doc in database.raw_collection.find({}, {"url_name": 1}))
+    names = random.Random(seed).sample(names, int(len(names) * fraction))
+    await mock_call(dfc_options["api_base"], "/__drift", {"names": names})
+    database.raw_collection.update_many({"url_name": {"$in": names}}, {"$set": {"epoch_t": 0}})
+    return len(names)
+
+
+async def run_child(args):
+    sys.path.insert(0, ROOT)
+    from load_optimized import Initialize_Database, Database_Upload
+
+    storage = open_storage(args.storage, args.mode, args.state_dir)
+    database = Initialize_Database(storage)
+    dfc_options = {"api_base": args.api_base, "cache_path": os.path.join(args.state_dir, "http_cache.sqlite"),
+                   "rate": args.rate, "burst": args.burst, "concurrency": args.concurrency, "database": database}
+    drifted = 0
+    if args.mode == "incremental":
+        drifted = await prepare_incremental(database, dfc_options, args.drift, args.seed)
+
+    await mock_call(args.api_base, "/__reset", {})
+    ops_before = db_ops(args.storage, storage)
+    start = time.perf_counter()
+    upload = Database_Upload(**dfc_options)
+    await upload.instantiate_DFC()
+    # Pushes moved prices on into t_ps/t_rc
+    upload.init_DFC.toggle_price_ps(True)
+    upload.init_DFC.toggle_price_rc(True)
+    stage_t = {}
+    try:
+        for stage in STAGES:
+            stage_start = time.perf_counter()
+            await getattr(upload, stage)()
+            stage_t[stage] = round(time.perf_counter() - stage_start, 3)
+    finally:
+        await upload.init_DFC.close()
+    wall = time.perf_counter() - start
+    served = await mock_call(args.api_base, "/__stats")
+
+    result = {
+        "mode": args.mode,
+        "storage": args.storage,
+        "wall_s": round(wall, 3),
+        "requests": served.get("total", 0),
+        "req_per_s": round(served.get("total", 0) / wall, 1),
+        "rate_limited": served.get("rate_limited", 0),
+        "server_errors": served.get("errors", 0),
+        "not_modified": served.get("not_modified", 0),
+        "db_ops": db_ops(args.storage, storage) - ops_before,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages_s": stage_t,
+        "cache": upload.init_DFC.cache_stats(),
+        "drifted": drifted,
+        "documents": {name: database.db[name].count_documents({}) for name in ("t_rd", "t_ps", "t_rc", "t_lb")},
+        # Counts alone pass on corrupted documents, ids and rewards are compared with the dumps
+        # The incremental run moves prices through propagate_set_prices/propagate_relic_prices
+        "mismatches": compare_to_dumps(database) + compare_embedded_prices(database),
+    }
+    # Drifted items are still fresh in the HTTP cache, serving them from it would keep the old prices
+    changed = len(upload.init_DFC.changed_prices or {})
+    if changed < drifted:
+        result["mismatches"].append(f"{changed} of {drifted} drifted prices reached t_rd")
+    result["http_p95_s"] = {h["endpoint"]: h["p95"] for h in upload.metrics.snapshot()["histograms"]
+                            if h["name"] == "http_request_seconds" and h["status"] == 200}
+    upload.export_metrics(os.path.join(os.path.dirname(RESULTS), "metrics", args.mode))
+    if args.storage == "memory":
+        storage.dump()
+    print(json.dumps(result))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def previous_results():
+    last = {}
+    if os.path.exists(RESULTS):
+        with open(RESULTS) as f:
+            for line in f:
+                result = json.loads(line)
+                last[(result["storage"], result["mode"])] = result
+    return last
+
+
+def compare(result, before):
+    if before is None:
+        return ""
+    deltas = []
+    for key in ("wall_s", "req_per_s", "db_ops", "peak_rss_mb"):
+        if before.get(key):
+            deltas.append(f"{key} {100 * (result[key] - before[key]) / before[key]:+.1f}%")
+    return f"  vs {before.get('commit') or 'previous'}: " + ", ".join(deltas)
+
+
+def wait_for_server(api_base, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            asyncio.run(mock_call(api_base, "/__stats"))
+            return
+        except aiohttp.ClientError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Mock server at {api_base} did not come up")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold, warm and incremental Database_Upload runs against the mock market")
+    parser.add_argument("--storage", choices=("memory", "mongo"), default="memory")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--port", type=int, default=8931)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--rate-limit", type=float, default=None, help="mock server requests/s before 429")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=200.0, help="client rate limit, requests/s")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--drift", type=float, default=0.1, help="share of prices moved before the incremental run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true")
+    # Internal: one mode in its own process, so peak RSS is per run
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--state-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--api-base", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_child(args))
+        return
+
+    api_base = f"http://127.0.0.1:{args.port}/v1"
+    server_cmd = [sys.executable, os.path.join(ROOT, "benchmarks", "mock_market.py"), "--port", str(args.port),
+                  "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+                  "--seed", str(args.seed)]
+    if args.rate_limit:
+        server_cmd += ["--rate-limit", str(args.rate_limit)]
+    server = subprocess.Popen(server_cmd)
+    state_dir = tempfile.mkdtemp(prefix="relic_bench_")
+    previous = previous_results()
+    commit = git_commit()
+    try:
+        wait_for_server(api_base)
+        for mode in args.modes.split(","):
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", "--mode", mode, "--state-dir", state_dir,
+                   "--api-base", api_base, "--storage", args.storage, "--rate", str(args.rate), "--burst", str(args.burst),
+                   "--concurrency", str(args.concurrency), "--drift", str(args.drift), "--seed", str(args.seed)]
+            child = subprocess.run(cmd, capture_output=True, text=True)
+            if child.returncode != 0:
+                print(child.stdout + child.stderr)
+                raise RuntimeError(f"{mode} run failed")
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            if result["mismatches"]:
+                print("\n".join(result["mismatches"]))
+                raise RuntimeError(f"{mode} run stored documents that differ from the dumps")
+            result.update({"t": time.time(), "commit": commit, "latency": args.latency, "rate": args.rate,
+                           "rate_limit": args.rate_limit, "error_rate": args.error_rate})
+            print(f"{mode:<12} {result['wall_s']:>8.2f} s  {result['requests']:>5} req  {result['req_per_s']:>7.1f} req/s  "
+                  f"{result['db_ops']:>6} db ops  {result['peak_rss_mb']:>6.1f} MB"
+                  + compare(result, previous.get((args.storage, mode))))
+            if not args.no_save:
+                os.makedirs(os.path.dirname(RESULTS), exist_ok=True)
+                with open(RESULTS, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
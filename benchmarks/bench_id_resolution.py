@@ -0,0 +1,40 @@
+import time
+from fixtures import load_dump
+from catalog import build_id_lookup, resolve_sources
+
+
+def nested_join(items, sources):
+    return [(name_.split(",")[0], rarity)
+            for ppn_source, rarity in sources
+            for name_, id_ in items
+            if id_ in ppn_source]
+
+
+def main(repeat=3):
+    raw = load_dump("t_rd")
+    relic_ids = {relic["relic_name"]: relic["relic_id"] for relic in load_dump("t_rc")}
+    items = [(doc["url_name"], doc["item_id"]) for doc in raw]
+
+    # Drop sources per part, as /dropsources returns them: (relic_id, rarity)
+    part_sources = [[(relic_ids[relic], rarity) for relic, rarity in part["ppn_source_and_rarity"] if relic in relic_ids]
+                    for prime_set in load_dump("t_ps") for part in prime_set["parts_in_set"]]
+    print(f"{len(items)} catalog items, {len(part_sources)} parts, {sum(map(len, part_sources))} drop sources")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        expected = [nested_join(items, sources) for sources in part_sources]
+    nested_t = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        id_to_name = build_id_lookup(items)
+        resolved = [resolve_sources(id_to_name, sources) for sources in part_sources]
+    lookup_t = (time.perf_counter() - start) / repeat
+
+    assert resolved == expected
+    print(f"nested substring join: {nested_t * 1000:.2f} ms")
+    print(f"id lookup join:        {lookup_t * 1000:.2f} ms ({nested_t / lookup_t:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import time
+import numpy as np
+from fixtures import load_dump
+from load_optimized import Data_Fetch_Conditions
+from price_estimator import Price_Estimator
+
+
+# Full-catalog batch of statistics payloads around a known true price, with thin hours and troll listings
+def synthetic_batch(n, rng, outlier_rate=0.03):
+    truth = rng.uniform(2, 300, n)
+    batch = []
+    for price in truth:
+        windows = []
+        for points, volume_mean in ((90, 20), (48, 3)):
+            count = int(rng.integers(points // 3, points + 1))
+            prices = price * np.exp(rng.normal(0, 0.08, count))
+            volumes = rng.poisson(volume_mean, count)
+            trolls = rng.random(count) < outlier_rate
+            prices[trolls] *= rng.choice([0.05, 20.0], trolls.sum())
+            volumes[trolls] = 1
+            windows.append([{"avg_price": round(float(p), 2), "volume": int(v)} for p, v in zip(prices, volumes)])
+        batch.append({"payload": {"statistics_closed": {"90days": windows[0]}, "statistics_live": {"48hours": windows[1]}}})
+    return truth, batch
+
+
+def main(repeat=5):
+    n = len(load_dump("t_rd"))
+    truth, batch = synthetic_batch(n, np.random.default_rng(0))
+    # Only the averaging is measured, no database or session is opened
+    dfc = Data_Fetch_Conditions.__new__(Data_Fetch_Conditions)
+    estimator = Price_Estimator()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        means = [dfc.process_statistics(result) for result in batch]
+    mean_t = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        estimates = estimator.estimate(batch)
+    estimate_t = (time.perf_counter() - start) / repeat
+
+    print(f"{n} payloads, {sum(len(r['payload']['statistics_closed']['90days']) + len(r['payload']['statistics_live']['48hours']) for r in batch)} points")
+    print(f"unweighted mean: {mean_t * 1000:7.2f} ms ({n / mean_t:,.0f} payloads/s)")
+    print(f"batch estimator: {estimate_t * 1000:7.2f} ms ({n / estimate_t:,.0f} payloads/s)")
+    for key, index in (("90d", 0), ("48h", 1)):
+        mean_error = np.median([abs(m[index] - t) / t for m, t in zip(means, truth)])
+        estimate_error = np.median([abs(e[f"est_{key}"] - t) / t for e, t in zip(estimates, truth)])
+        confidence = np.mean([e[f"conf_{key}"] for e in estimates])
+        print(f"{key}: median relative error {mean_error:.3f} mean vs {estimate_error:.3f} estimate, mean confidence {confidence:.2f}")
+
+
+if __name__ == "__main__":
+    main()
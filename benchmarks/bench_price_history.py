@@ -0,0 +1,71 @@
+import shutil
+import tempfile
+import time
+import numpy as np
+from fixtures import load_dump
+from price_history import Price_History
+
+DAY = 86400
+
+
+def iso(t):
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000+00:00", time.gmtime(t))
+
+
+# 90 daily and 48 hourly points ending at end_t, prices on a per-item random walk
+def payload(rng, base, end_t):
+    daily = base * np.exp(np.cumsum(rng.normal(0, 0.03, 90)))
+    hourly = daily[-1] * np.exp(np.cumsum(rng.normal(0, 0.01, 48)))
+    closed = [{"datetime": iso(end_t - (89 - i) * DAY), "volume": int(rng.integers(1, 50)), "avg_price": round(float(p), 2)}
+              for i, p in enumerate(daily)]
+    live = [{"datetime": iso(end_t - (47 - i) * 3600), "volume": int(rng.integers(0, 8)), "avg_price": round(float(p), 2),
+             "order_type": "sell"} for i, p in enumerate(hourly)]
+    return {"payload": {"statistics_closed": {"90days": closed}, "statistics_live": {"48hours": live}}}
+
+
+def timed(label, run, repeat=20):
+    run()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = run()
+    print(f"{label:<28} {(time.perf_counter() - start) / repeat * 1000:8.2f} ms")
+    return result
+
+
+def main(refreshes=4):
+    names = [doc["url_name"] for doc in load_dump("t_rd")]
+    rng = np.random.default_rng(0)
+    base = {name: float(rng.uniform(2, 200)) for name in names}
+    directory = tempfile.mkdtemp(prefix="relic_history_")
+    try:
+        history = Price_History(directory)
+        end_t = int(time.time()) // DAY * DAY - refreshes * 90 * DAY
+        payloads = 0
+        start = time.perf_counter()
+        for _ in range(refreshes):
+            end_t += 90 * DAY
+            for name in names:
+                history.record(name, payload(rng, base[name], end_t))
+                payloads += 1
+        history.flush()
+        append_t = time.perf_counter() - start
+        print(f"{len(history)} items, {payloads} payloads appended in {append_t:.2f} s ({payloads / append_t:.0f}/s, payload generation included)")
+
+        start = time.perf_counter()
+        history = Price_History(directory)
+        print(f"reopen: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        timed("mean 30d", lambda: history.mean(30))
+        timed("vwap 30d", lambda: history.vwap(30))
+        timed("volatility 30d", lambda: history.volatility(30))
+        timed("volatility 24h (hourly)", lambda: history.volatility(24, "hourly"))
+        timed("rolling mean 7d, full year", lambda: history.rolling_mean(7))
+        ranked = timed("rank by momentum 7d/30d", lambda: history.rank(history.momentum(7, 30), top=10))
+        for name, score in ranked[:5]:
+            print(f"  {name:<40} {score:+.3f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import time
+from fixtures import load_dump
+from relic_ev import Relic_EV_Engine, REFINEMENTS, RARITY_CHANCE, RARITIES
+
+
+def naive_ev(relic, refinement, price_field="price_48h"):
+    rewards = relic["relic_detail"]["part_rewards"]
+    counts = {rarity: sum(reward["rarity"] == rarity for reward in rewards) for rarity in RARITIES}
+    f = REFINEMENTS.index(refinement)
+    return sum(RARITY_CHANCE[f, RARITIES.index(reward["rarity"])] / counts[reward["rarity"]] * (reward.get(price_field) or 0)
+               for reward in rewards)
+
+
+def main(repeat=200):
+    relics = load_dump("t_rc")
+
+    start = time.perf_counter()
+    engine = Relic_EV_Engine(relics)
+    build_t = time.perf_counter() - start
+
+    for relic in relics[:50]:
+        for refinement in REFINEMENTS:
+            assert abs(engine.relic_ev(relic["relic_name"])[refinement]["plat"] - naive_ev(relic, refinement)) < 1e-9
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        engine.compute()
+    compute_t = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        engine.sorted_relics("plat", "radiant", era="Axi")
+    sort_t = (time.perf_counter() - start) / repeat
+
+    part_id = next(iter(engine.part_slots))
+    start = time.perf_counter()
+    for i in range(repeat):
+        engine.update_prices({part_id: i})
+    update_t = (time.perf_counter() - start) / repeat
+
+    print(f"{len(relics)} relics x {len(REFINEMENTS)} refinements")
+    print(f"build matrices:      {build_t * 1000:.2f} ms")
+    print(f"full EV pass:        {compute_t * 1000:.3f} ms")
+    print(f"sort + era filter:   {sort_t * 1000:.3f} ms")
+    print(f"single price update: {update_t * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import random
+import sys
+import time
+from fixtures import ROOT, load_dump
+from trade_chat import Trade_Chat_Parser, Chat_Catalog
+
+CORPUS = os.path.join(ROOT, "benchmarks", "trade_chat_corpus.txt")
+CHATTER = ["anyone selling aya?", "LF radshare axi, 3/4", "thx", "h", "any1 got a spare forma bp", "gg"]
+RIVENS = ["Glaive Acri-Deciata", "Torid Argi-Satitis", "Rubico Crita-Visitis", "Kuva Bramma Toxi-Hexacron"]
+REFINEMENTS = ["", "", "int ", "exc ", "flaw ", "rad "]
+
+
+def chat_name(url_name):
+    name = url_name.replace("_", " ").title()
+    return name.replace(" Blueprint", "") if random.random() < 0.3 and "Prime " in name else name
+
+
+def chat_price(price):
+    if price >= 1000 and random.random() < 0.7:
+        return f"{price // 1000}k{price % 1000 // 100 or ''}"
+    return random.choice([f"{price}p", f"{price}", f"~{price}", f"{price}pl", f"{price}-{price + 5}p"])
+
+
+# Deterministic corpus in the shape of trade chat, names from the t_rd dump
+def make_corpus(n=5000, seed=7):
+    random.seed(seed)
+    names = [doc["url_name"] for doc in load_dump("t_rd")]
+    lines = []
+    for i in range(n):
+        if random.random() < 0.2:
+            lines.append(f"[{i // 60 % 24:02d}:{i % 60:02d}] Tenno{i % 97}: {random.choice(CHATTER)}")
+            continue
+        parts = []
+        for intent in random.sample(["WTB", "WTS", "WTT"], random.randint(1, 2)):
+            parts.append(intent)
+            for _ in range(random.randint(1, 4)):
+                if random.random() < 0.1:
+                    parts.append(f"[{random.choice(RIVENS)}] {chat_price(random.randint(2, 30) * 100)}")
+                elif random.random() < 0.15:
+                    parts.append(f"[Aya] ({random.randint(1, 8)}:{random.randint(10, 40)}p)")
+                else:
+                    parts.append(f"[{chat_name(random.choice(names))}] {random.choice(REFINEMENTS)}"
+                                 f"{chat_price(random.randint(1, 150))}")
+        lines.append(f"[{i // 60 % 24:02d}:{i % 60:02d}] Tenno{i % 97}: " + " ".join(parts))
+    return lines
+
+
+def main(total_lines=500_000):
+    if "--write" in sys.argv or not os.path.exists(CORPUS):
+        with open(CORPUS, "w") as f:
+            f.write("\n".join(make_corpus()) + "\n")
+    with open(CORPUS) as f:
+        corpus = f.read().splitlines()
+    lines = corpus * (total_lines // len(corpus))
+
+    parser = Trade_Chat_Parser(Chat_Catalog(doc["url_name"] for doc in load_dump("t_rd")))
+    start = time.perf_counter()
+    offers = 0
+    resolved = 0
+    for offer in parser.stream(lines):
+        offers += 1
+        resolved += offer["url_name"] is not None
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(lines)} lines, {offers} offers, {resolved / max(offers, 1):.1%} resolved against t_rd")
+    print(f"{elapsed:.2f} s, {len(lines) / elapsed:,.0f} lines/s, {offers / elapsed:,.0f} offers/s")
+
+
+if __name__ == "__main__":
+    main()
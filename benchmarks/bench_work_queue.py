@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from fixtures import ROOT, load_dump, compare_to_dumps, compare_embedded_prices
+from bench_end_to_end import mock_call, wait_for_server
+
+DB_NAME = "bench_queue_db"
+
+# Coordinator and N workers against the mock market. With memory storage the workers are threads
+# sharing one Memory_Storage, with mongo they are separate `work_queue.py worker` processes.
+# --kill-after stops one worker without ack or fail, its leased jobs come back once the lease expires.
+
+
+class Thread_Worker(threading.Thread):
+    def __init__(self, worker):
+        super().__init__(daemon=True)
+        self.worker = worker
+        self.loop = None
+        self.task = None
+        self.stats = None
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        self.task = self.loop.create_task(self.worker.run())
+        try:
+            self.stats = self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            self.stats = "killed"
+        finally:
+            self.loop.close()
+
+    # Like a crashed process: the task stops mid-batch, nothing is acked
+    def kill(self):
+        self.loop.call_soon_threadsafe(self.task.cancel)
+
+
+def start_workers(args, api_base, database, cache_dir):
+    from work_queue import Queue_Worker
+    workers = []
+    for i in range(args.workers):
+        dfc_options = {"api_base": api_base, "rate": args.rate, "burst": args.burst, "concurrency": args.concurrency,
+                       "cache_path": None}
+        if args.storage == "memory":
+            worker = Thread_Worker(Queue_Worker(database, f"worker-{i}", args.batch, 0.2, args.lease, **dfc_options))
+            worker.start()
+        else:
+            worker = subprocess.Popen([sys.executable, os.path.join(ROOT, "work_queue.py"), "worker", "--db-name", DB_NAME,
+                                       "--api-base", api_base, "--rate", str(args.rate), "--burst", str(args.burst),
+                                       "--concurrency", str(args.concurrency), "--batch", str(args.batch),
+                                       "--lease", str(args.lease)], stdout=subprocess.PIPE, text=True)
+        workers.append(worker)
+    return workers
+
+
+# prime_set jobs leased before one of their statistics jobs was done
+def early_sets(database, limit=10):
+    done = {job["job"]: job["done_t"] for job in database.work_queue_collection.find({"kind": "statistics", "status": "done"})}
+    problems = []
+    for job in database.work_queue_collection.find({"kind": "prime_set"}):
+        if job["status"] != "done":
+            problems.append(f"{job['job']} ended {job['status']}")
+        elif any(name not in done or done[name] > job["done_t"] for name in job["after"]):
+            problems.append(f"{job['job']} finished before its statistics jobs")
+    return problems[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lease-based crawl with N workers against the mock market")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--storage", choices=("memory", "mongo"), default="memory")
+    parser.add_argument("--port", type=int, default=8932)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--rate", type=float, default=50.0, help="requests/s per worker")
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--lease", type=float, default=5.0)
+    parser.add_argument("--kill-after", type=float, default=None, help="seconds before one worker is killed")
+    args = parser.parse_args()
+
+    from storage import Memory_Storage, Mongo_Storage
+    from load_optimized import Initialize_Database
+    from work_queue import Crawl_Coordinator
+
+    api_base = f"http://127.0.0.1:{args.port}/v1"
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "benchmarks", "mock_market.py"), "--port", str(args.port),
+                               "--latency", str(args.latency)])
+    cache_dir = tempfile.mkdtemp(prefix="relic_queue_")
+    try:
+        wait_for_server(api_base)
+        if args.storage == "memory":
+            storage = Memory_Storage(DB_NAME, dump_dir=cache_dir, load=False)
+        else:
+            storage = Mongo_Storage(db_name=DB_NAME)
+            storage.client.drop_database(DB_NAME)
+        database = Initialize_Database(storage)
+        database.ensure_indexes()
+
+        start = time.perf_counter()
+        workers = start_workers(args, api_base, database, cache_dir)
+        coordinator = Crawl_Coordinator(database, poll_interval=0.2, lease_seconds=args.lease, api_base=api_base, cache_path=None)
+        killer = None
+        if args.kill_after is not None:
+            victim = workers[0]
+            killer = threading.Timer(args.kill_after, victim.kill)
+            killer.start()
+        report = asyncio.run(coordinator.run())
+        wall = time.perf_counter() - start
+        for worker in workers:
+            if args.storage == "memory":
+                worker.join()
+            else:
+                worker.wait()
+        served = asyncio.run(mock_call(api_base, "/__stats"))
+
+        reclaimed = database.work_queue_collection.count_documents({"attempts": {"$gt": 1}})
+        expected_sets = len(load_dump("t_ps"))
+        expected_relics = len(load_dump("t_rc"))
+        sets = database.prime_sets_collection.count_documents({})
+        relics = database.relics_collection.count_documents({})
+        print(f"{args.workers} workers ({args.storage}), {args.rate:.0f} req/s each: {wall:.2f} s, {served.get('total', 0)} requests")
+        for kind, counts in report.items():
+            print(f"  {kind:<12} {counts}")
+        print(f"  reclaimed after lease expiry: {reclaimed}")
+        if args.storage == "memory":
+            for worker in workers:
+                print(f"  {worker.worker.worker_id}: {worker.stats}")
+        print(f"  t_ps {sets}/{expected_sets}, t_rc {relics}/{expected_relics}")
+        assert sets == expected_sets and relics == expected_relics
+        mismatches = compare_to_dumps(database) + compare_embedded_prices(database) + early_sets(database)
+        for mismatch in mismatches:
+            print(f"  mismatch: {mismatch}")
+        assert not mismatches
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
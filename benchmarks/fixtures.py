@@ -0,0 +1,61 @@
+import os
+import sys
+from bson import json_util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_dump(name):
+    with open(os.path.join(ROOT, f"optimized_db.{name}.json")) as f:
+        return json_util.loads(f.read())
+
+
+# Differences between a loaded database and the shipped dumps: set and part ids, relic rewards
+def compare_to_dumps(database, limit=10):
+    problems = []
+    expected_sets = load_dump("t_ps")
+    set_rows = {doc["url_name"]: doc["item_id"] for doc in database.raw_collection.find(
+        {"url_name": {"$in": [expected["set_url"] for expected in expected_sets]}}, {"url_name": 1, "item_id": 1})}
+    stored_sets = {doc["set_url"]: doc for doc in database.prime_sets_collection.find()}
+    for expected in expected_sets:
+        stored = stored_sets.get(expected["set_url"])
+        if stored is None:
+            problems.append(f"t_ps: {expected['set_url']} missing")
+            continue
+        if stored["set_id"] != expected["set_id"] or stored["set_id"] != set_rows.get(expected["set_url"]):
+            problems.append(f"t_ps: {expected['set_url']} set_id {stored['set_id']}, expected {expected['set_id']}")
+        if sorted(part["item_id"] for part in stored["parts_in_set"]) != sorted(part["item_id"] for part in expected["parts_in_set"]):
+            problems.append(f"t_ps: {expected['set_url']} parts_in_set ids differ")
+
+    stored_relics = {doc["relic_name"]: doc for doc in database.relics_collection.find()}
+    for expected in load_dump("t_rc"):
+        stored = stored_relics.get(expected["relic_name"])
+        if stored is None:
+            problems.append(f"t_rc: {expected['relic_name']} missing")
+            continue
+        rewards = lambda doc: sorted((r["part_url"], r.get("part_id"), r["rarity"]) for r in doc["relic_detail"]["part_rewards"])
+        if stored["relic_id"] != expected["relic_id"] or rewards(stored) != rewards(expected):
+            problems.append(f"t_rc: {expected['relic_name']} rewards differ")
+    return problems[:limit] if limit else problems
+
+
+# Prices embedded in t_ps/t_rc that differ from the t_rd row they were copied from, e.g. after a delta run
+def compare_embedded_prices(database, limit=10):
+    prices = {doc["item_id"]: (doc.get("price_90d"), doc.get("price_48h"))
+              for doc in database.raw_collection.find({}, {"item_id": 1, "price_90d": 1, "price_48h": 1})}
+    problems = []
+    for prime_set in database.prime_sets_collection.find():
+        embedded = (prime_set["price_set"]["set_p90d"], prime_set["price_set"]["set_p48h"])
+        if embedded != prices.get(prime_set["set_id"]):
+            problems.append(f"t_ps: {prime_set['set_url']} price_set {embedded}, t_rd {prices.get(prime_set['set_id'])}")
+        for part in prime_set["parts_in_set"]:
+            embedded = (part["price"]["price_90"], part["price"]["price_48"])
+            if embedded != prices.get(part["item_id"]):
+                problems.append(f"t_ps: {part['item_url']} price {embedded}, t_rd {prices.get(part['item_id'])}")
+    for relic in database.relics_collection.find():
+        embedded = (relic["relic_detail"]["relic_p90d"], relic["relic_detail"]["relic_p48h"])
+        if embedded != prices.get(relic["relic_id"]):
+            problems.append(f"t_rc: {relic['relic_name']} price {embedded}, t_rd {prices.get(relic['relic_id'])}")
+    return problems[:limit] if limit else problems
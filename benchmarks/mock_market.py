@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+from aiohttp import web
+from fixtures import load_dump
+
+# Local stand-in for api.warframe.market/v1, payloads are rebuilt from the optimized_db dumps.
+# /__stats, /__reset and /__drift are for the harness and are not counted as requests.
+
+
+def statistics_payload(price_90d, price_48h, epoch_t):
+    day = time.strftime("%Y-%m-%dT00:00:00.000+00:00", time.gmtime(epoch_t))
+    closed = [{"datetime": day, "volume": 10, "min_price": price_90d, "max_price": price_90d, "avg_price": price_90d,
+               "median": price_90d, "moving_avg": price_90d, "id": f"c{i}"} for i in range(90)]
+    live = [{"datetime": day, "volume": 3, "min_price": price_48h, "max_price": price_48h, "avg_price": price_48h,
+             "median": price_48h, "order_type": "sell", "id": f"l{i}"} for i in range(48)]
+    return {"payload": {"statistics_closed": {"48hours": [], "90days": closed},
+                        "statistics_live": {"48hours": live, "90days": []}}}
+
+
+class Mock_Market():
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit=None, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.tokens = rate_limit or 0
+        self.refill_t = time.monotonic()
+        self.requests = Counter()
+        self.epoch_t = time.time()
+
+        raw = load_dump("t_rd")
+        self.items = [{"id": doc["item_id"], "url_name": doc["url_name"],
+                       "item_name": doc["url_name"].replace("_", " ").title(),
+                       "thumb": f"items/images/en/thumbs/{doc['url_name']}.png"} for doc in raw]
+        self.prices = {doc["url_name"]: (doc.get("price_90d") or 0, doc.get("price_48h") or 0) for doc in raw}
+        relic_ids = {doc["url_name"]: doc["item_id"] for doc in raw}
+
+        # items_in_set and drop sources per url_name, from t_ps
+        self.sets = {}
+        self.dropsources = {}
+        for prime_set in load_dump("t_ps"):
+            parts = [{"id": part["item_id"], "url_name": part["item_url"], "ducats": part["ducats"],
+                      "trading_tax": part["trading_tax"], "quantity_for_set": part["quantity_for_set"],
+                      "set_root": False, "en": {"item_name": part["item_name"]}} for part in prime_set["parts_in_set"]]
+            root = {"id": prime_set["set_id"], "url_name": prime_set["set_url"],
+                    "ducats": sum(part["ducats"] for part in parts), "trading_tax": sum(part["trading_tax"] for part in parts),
+                    "quantity_for_set": 1, "set_root": True, "en": {"item_name": prime_set["set_url"].replace("_", " ").title()}}
+            # The live API lists the parts first and the set root last
+            items_in_set = parts + [root]
+            self.sets[prime_set["set_url"]] = items_in_set
+            self.dropsources[prime_set["set_url"]] = []
+            for part in prime_set["parts_in_set"]:
+                self.sets[part["item_url"]] = items_in_set
+                self.dropsources[part["item_url"]] = [
+                    {"relic": relic_ids[relic], "rarity": rarity, "type": "relic", "item": part["item_id"]}
+                    for relic, rarity in part["ppn_source_and_rarity"] if relic in relic_ids]
+
+    # Moves the price of a share of the catalog (or the given items), returns what changed
+    def drift(self, fraction=0.1, factor=1.1, names=None, seed=None):
+        rng = random.Random(seed)
+        names = names or rng.sample(sorted(self.prices), int(len(self.prices) * fraction))
+        for name in names:
+            price_90d, price_48h = self.prices[name]
+            self.prices[name] = (round(price_90d * factor, 2), round(price_48h * factor, 2))
+        self.epoch_t = time.time()
+        return names
+
+    def respond(self, request, payload):
+        body = json.dumps(payload)
+        etag = '"' + hashlib.md5(body.encode()).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            self.requests["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(text=body, content_type="application/json", headers={"ETag": etag})
+
+    def take_token(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate_limit, self.tokens + (now - self.refill_t) * self.rate_limit)
+        self.refill_t = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    @web.middleware
+    async def faults(self, request, handler):
+        if request.path.startswith("/__"):
+            return await handler(request)
+        self.requests["total"] += 1
+        if self.rate_limit and not self.take_token():
+            self.requests["rate_limited"] += 1
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.rng.random() * self.jitter)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.requests["errors"] += 1
+            return web.Response(status=503)
+        return await handler(request)
+
+    async def items_list(self, request):
+        self.requests["items"] += 1
+        return self.respond(request, {"payload": {"items": self.items}})
+
+    async def item(self, request):
+        name = request.match_info["name"]
+        if name not in self.sets:
+            raise web.HTTPNotFound()
+        self.requests["item"] += 1
+        return self.respond(request, {"payload": {"item": {"id": self.sets[name][0]["id"], "items_in_set": self.sets[name]}}})
+
+    async def statistics(self, request):
+        name = request.match_info["name"]
+        if name not in self.prices:
+            raise web.HTTPNotFound()
+        self.requests["statistics"] += 1
+        return self.respond(request, statistics_payload(*self.prices[name], self.epoch_t))
+
+    async def item_dropsources(self, request):
+        name = request.match_info["name"]
+        if name not in self.dropsources:
+            raise web.HTTPNotFound()
+        self.requests["dropsources"] += 1
+        payload = {"payload": {"dropsources": self.dropsources[name]}}
+        if request.query.get("include") == "item":
+            payload["include"] = {"item": {"id": self.sets[name][0]["id"], "items_in_set": self.sets[name]}}
+        return self.respond(request, payload)
+
+    async def stats(self, request):
+        return web.json_response(dict(self.requests))
+
+    async def reset(self, request):
+        self.requests.clear()
+        return web.json_response({})
+
+    async def drift_handler(self, request):
+        body = await request.json() if request.can_read_body else {}
+        names = self.drift(body.get("fraction", 0.1), body.get("factor", 1.1), body.get("names"), body.get("seed"))
+        return web.json_response({"names": names})
+
+    def app(self):
+        app = web.Application(middlewares=[self.faults])
+        app.router.add_get("/v1/items", self.items_list)
+        app.router.add_get("/v1/items/{name}", self.item)
+        app.router.add_get("/v1/items/{name}/statistics", self.statistics)
+        app.router.add_get("/v1/items/{name}/dropsources", self.item_dropsources)
+        app.router.add_get("/__stats", self.stats)
+        app.router.add_post("/__reset", self.reset)
+        app.router.add_post("/__drift", self.drift_handler)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the warframe.market v1 API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8931)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds, uniformly")
+    parser.add_argument("--rate-limit", type=float, default=None, help="requests/s before answering 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    market = Mock_Market(args.latency, args.jitter, args.rate_limit, args.error_rate, args.seed)
+    web.run_app(market.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
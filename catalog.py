@@ -0,0 +1,71 @@
+# Shared lookups over the /items catalog, built once per crawl
+
+
+def build_id_lookup(items):
+    return {_id: name for name, _id in items}
+
+
+def resolve_sources(id_to_name, sources):
+    return [(id_to_name[relic_id], rarity) for relic_id, rarity in sources if relic_id in id_to_name]
+
+
+SET_SUFFIX = "_prime_set"
+RELIC_SUFFIX = "_relic"
+CATEGORIES = ("set", "part", "relic", "other")
+
+
+# A prime part has "prime_" after at least one character, not as kavasa_prime_ and not as the _prime_set suffix
+def is_prime_part(url_name):
+    i = url_name.find("prime_", 1)
+    while i != -1:
+        rest = url_name[i + 6:]
+        if rest and rest != "set" and not url_name[:i].endswith("kavasa_"):
+            return True
+        i = url_name.find("prime_", i + 1)
+    return False
+
+
+# url_name -> (category, set_prefix, relic_era, relic_code), one pass of string checks per name
+def classify(url_name):
+    if url_name.endswith(SET_SUFFIX) and len(url_name) > len(SET_SUFFIX):
+        return "set", url_name[:-len(SET_SUFFIX)], None, None
+    # Requiem relics are not void relics
+    if url_name.endswith(RELIC_SUFFIX) and not url_name.startswith("r") and len(url_name) > len(RELIC_SUFFIX) + 1:
+        era, _, code = url_name[:-len(RELIC_SUFFIX)].partition("_")
+        return "relic", None, era.capitalize(), code or None
+    if is_prime_part(url_name):
+        return "part", url_name.partition("_prime_")[0], None, None
+    return "other", None, None, None
+
+
+# The /items catalog classified once, downstream filters are dict lookups
+class Catalog():
+    def __init__(self, items):
+        self.items = list(items)
+        self.classes = {}
+        self.by_category = {category: [] for category in CATEGORIES}
+        # set prefix -> the set and its parts
+        self.members = {}
+        for name, _id in self.items:
+            fields = self.classes[name] = classify(name)
+            self.by_category[fields[0]].append((name, _id))
+            if fields[1] is not None:
+                self.members.setdefault(fields[1], []).append((name, _id))
+
+    # Sets, parts and relics in /items order
+    def filtered(self):
+        return [(name, _id) for name, _id in self.items if self.classes[name][0] != "other"]
+
+    def category(self, url_name):
+        return self.classes[url_name][0] if url_name in self.classes else classify(url_name)[0]
+
+    def set_prefix(self, url_name):
+        return self.classes[url_name][1] if url_name in self.classes else classify(url_name)[1]
+
+    def count(self, category):
+        return len(self.by_category[category])
+
+    # Stored on each t_rd document, indexed for the per-set and per-category queries
+    def fields(self, url_name):
+        category, set_prefix, relic_era, relic_code = self.classes.get(url_name) or classify(url_name)
+        return {"category": category, "set_prefix": set_prefix, "relic_era": relic_era, "relic_code": relic_code}
@@ -0,0 +1,44 @@
+import logging
+import time
+from storage import UpdateOne
+
+CHECKPOINT = "__stage__"
+logger = logging.getLogger(__name__)
+
+
+# Records which keys of a stage are committed, so an interrupted crawl resumes at the remaining tail
+class Crawl_Journal():
+    def __init__(self, collection):
+        self.collection = collection
+
+    def status(self, stage):
+        checkpoint = self.collection.find_one({"stage": stage, "key": CHECKPOINT})
+        return checkpoint["status"] if checkpoint else None
+
+    # Starts a stage, or resumes it if the last run died halfway; returns the keys already committed
+    def begin(self, stage):
+        if self.status(stage) == "started":
+            done = self.completed(stage)
+            logger.info("Resuming %s: %d already committed", stage, len(done))
+            return done
+        self.collection.delete_many({"stage": stage})
+        self.collection.insert_one({"stage": stage, "key": CHECKPOINT, "status": "started", "epoch_t": time.time()})
+        return set()
+
+    def completed(self, stage):
+        return {doc["key"] for doc in self.collection.find({"stage": stage}, {"key": 1}) if doc["key"] != CHECKPOINT}
+
+    # Only call once the keys' results are written
+    def record(self, stage, keys):
+        now = time.time()
+        ops = [UpdateOne({"stage": stage, "key": key}, {"$set": {"epoch_t": now}}, upsert=True) for key in keys]
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+    def finish(self, stage):
+        self.collection.delete_many({"stage": stage, "key": {"$ne": CHECKPOINT}})
+        self.collection.update_one({"stage": stage, "key": CHECKPOINT},
+                                   {"$set": {"status": "complete", "epoch_t": time.time()}}, upsert=True)
+
+    def is_complete(self, stage):
+        return self.status(stage) == "complete"
@@ -2,15 +2,17 @@
 #WTB [Aya] (6:25p, rad 6:35p) WTS [Glaive Acri-Deciata] [Glaive Acri-Exicron] [Glaive Crita-Tempitis] ~900 [Glaive Croni-Visitis] [Glaive Croni-Acricron] 1k2 ~ 1k8
 
 import cProfile
+import logging
 import pstats
 import asyncio
 import aiohttp
-import test_data_str
+import load_optimized
 
+# Point RELIC_API_BASE at benchmarks/mock_market.py to profile without the live API
 async def main():
 
-    test = test_data_str.Data_Fetch_Conditions()
-    test_load = test_data_str.Database_Upload()
+    test = load_optimized.Data_Fetch_Conditions()
+    test_load = load_optimized.Database_Upload()
     await test.async_init(aiohttp.ClientSession())
     await test_load.instantiate_DFC() 
 
@@ -35,8 +37,7 @@ async def main():
     await test_load.load_prime_sets()
     await test_load.load_relics()
     await test.close()
-    await test.close()
-    await test.close()
+    await test_load.init_DFC.close()
 
 
     print(f"After: Test raw not corrupted: {test_load.init_DFC.rd_not_corrupted}")
@@ -50,6 +51,7 @@ async def main():
 
     print(f"After: Test price fully updated: {test_load.init_DFC.price_updated}")
 
+logging.basicConfig(level=logging.INFO)
 profiler = cProfile.Profile()
 profiler.enable()
 asyncio.run(main())
@@ -0,0 +1,159 @@
+import sys
+
+FORMA_URL = "forma_blueprint"
+
+# In-memory catalog for the GUI process. Strings are interned, every part exists once and relics
+# hold references to it, so a relic's rewards cost a tuple instead of six copied dicts.
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Part():
+    __slots__ = ("item_id", "url_name", "item_name", "ducats", "trading_tax", "quantity_for_set",
+                 "price_90d", "price_48h", "prime_set", "sources")
+
+    def __init__(self, item_id, url_name, item_name=None, ducats=0, trading_tax=0, quantity_for_set=1,
+                 price_90d=None, price_48h=None, prime_set=None):
+        self.item_id = intern(item_id)
+        self.url_name = intern(url_name)
+        self.item_name = item_name
+        self.ducats = ducats
+        self.trading_tax = trading_tax
+        self.quantity_for_set = quantity_for_set
+        self.price_90d = price_90d
+        self.price_48h = price_48h
+        self.prime_set = prime_set
+        # ((Relic, rarity), ...), filled in once the relics are loaded
+        self.sources = ()
+
+    def __repr__(self):
+        return f"Part({self.url_name})"
+
+
+class Prime_Set():
+    __slots__ = ("set_id", "url_name", "ducats", "trading_tax", "price_90d", "price_48h", "parts")
+
+    def __init__(self, set_id, url_name, ducats=0, trading_tax=0, price_90d=None, price_48h=None):
+        self.set_id = intern(set_id)
+        self.url_name = intern(url_name)
+        self.ducats = ducats
+        self.trading_tax = trading_tax
+        self.price_90d = price_90d
+        self.price_48h = price_48h
+        self.parts = ()
+
+    def __repr__(self):
+        return f"Prime_Set({self.url_name})"
+
+
+class Relic():
+    __slots__ = ("relic_id", "url_name", "era", "price_90d", "price_48h", "rewards")
+
+    def __init__(self, relic_id, url_name, price_90d=None, price_48h=None):
+        self.relic_id = intern(relic_id)
+        self.url_name = intern(url_name)
+        self.era = intern(url_name.split("_", 1)[0].capitalize())
+        self.price_90d = price_90d
+        self.price_48h = price_48h
+        # ((Part, rarity), ...), the forma slot points at the shared FORMA part
+        self.rewards = ()
+
+    def __repr__(self):
+        return f"Relic({self.url_name})"
+
+
+FORMA = Part(FORMA_URL, FORMA_URL, "Forma Blueprint")
+
+
+class Catalog_Model():
+    # raw_docs, set_docs, relic_docs: iterables of t_rd, t_ps and t_rc documents
+    def __init__(self, raw_docs=(), set_docs=(), relic_docs=()):
+        self.sets = {}
+        self.parts = {}
+        self.relics = {}
+        # item_id -> Prime_Set, Part or Relic
+        self.by_id = {}
+
+        # t_rd holds the latest prices, the copies embedded in t_ps/t_rc can lag behind
+        prices = {doc["item_id"]: (doc.get("price_90d"), doc.get("price_48h")) for doc in raw_docs}
+
+        for doc in set_docs:
+            set_price = prices.get(doc["set_id"]) or (doc["price_set"]["set_p90d"], doc["price_set"]["set_p48h"])
+            prime_set = Prime_Set(doc["set_id"], doc["set_url"], doc.get("ducats", 0), doc.get("trading_tax", 0), *set_price)
+            parts = []
+            for part_doc in doc["parts_in_set"]:
+                part_price = prices.get(part_doc["item_id"]) or (part_doc["price"]["price_90"], part_doc["price"]["price_48"])
+                part = Part(part_doc["item_id"], part_doc["item_url"], part_doc.get("item_name"), part_doc["ducats"],
+                            part_doc["trading_tax"], part_doc["quantity_for_set"], *part_price, prime_set=prime_set)
+                self.add(self.parts, part, part.url_name, part.item_id)
+                parts.append(part)
+            prime_set.parts = tuple(parts)
+            self.add(self.sets, prime_set, prime_set.url_name, prime_set.set_id)
+
+        sources = {}
+        for doc in relic_docs:
+            detail = doc["relic_detail"]
+            relic_price = prices.get(doc["relic_id"]) or (detail.get("relic_p90d"), detail.get("relic_p48h"))
+            relic = Relic(doc["relic_id"], doc["relic_name"], *relic_price)
+            rewards = []
+            for reward in detail.get("part_rewards", []):
+                rarity = intern(reward["rarity"])
+                if reward["part_url"] == FORMA_URL:
+                    rewards.append((FORMA, rarity))
+                    continue
+                part = self.parts.get(reward["part_url"])
+                # A reward whose set is missing from t_ps still gets one shared part
+                if part is None:
+                    part = Part(reward["part_id"], reward["part_url"], ducats=reward.get("ducats", 0),
+                                price_90d=reward.get("price_90d"), price_48h=reward.get("price_48h"))
+                    self.add(self.parts, part, part.url_name, part.item_id)
+                rewards.append((part, rarity))
+                sources.setdefault(part, []).append((relic, rarity))
+            relic.rewards = tuple(rewards)
+            self.add(self.relics, relic, relic.url_name, relic.relic_id)
+
+        for part, part_sources in sources.items():
+            part.sources = tuple(part_sources)
+
+    def add(self, table, obj, url_name, item_id):
+        table[url_name] = obj
+        self.by_id[item_id] = obj
+
+    @classmethod
+    def from_database(cls, database):
+        return cls(database.raw_collection.find({}, {"item_id": 1, "price_90d": 1, "price_48h": 1}),
+                   database.prime_sets_collection.find(),
+                   database.relics_collection.find())
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, url_name):
+        return self.sets.get(url_name) or self.parts.get(url_name) or self.relics.get(url_name)
+
+    # item_id -> (price_90d, price_48h), as in Data_Fetch_Conditions.changed_prices. One write per
+    # item reaches every set and relic that refers to it.
+    def update_prices(self, changed):
+        updated = 0
+        for item_id, (price_90d, price_48h) in changed.items():
+            obj = self.by_id.get(item_id)
+            if obj is not None:
+                obj.price_90d = price_90d
+                obj.price_48h = price_48h
+                updated += 1
+        return updated
+
+    # A t_rc-shaped document, for code that still expects the Mongo layout
+    def relic_doc(self, relic):
+        rewards = []
+        for part, rarity in relic.rewards:
+            if part is FORMA:
+                rewards.append({"part_url": FORMA_URL, "rarity": rarity})
+            else:
+                rewards.append({"part_url": part.url_name, "part_id": part.item_id, "ducats": part.ducats,
+                                "rarity": rarity, "price_90d": part.price_90d, "price_48h": part.price_48h})
+        return {"relic_name": relic.url_name, "relic_id": relic.relic_id,
+                "relic_detail": {"relic_p90d": relic.price_90d, "relic_p48h": relic.price_48h,
+                                 "subtypes": "intact, exceptional, flawless, radiant", "part_rewards": rewards}}
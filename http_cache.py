@@ -0,0 +1,154 @@
+import json
+import re
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+HOUR = 3600
+DAY = 86400
+
+# First matching rule wins, a ttl of 0 means "never cache"
+DEFAULT_TTLS = [
+    (re.compile(r"/items/[^/]+/statistics$"), 3 * HOUR),
+    (re.compile(r"/items/[^/]+/dropsources$"), 7 * DAY),
+    (re.compile(r"/items/[^/]+/orders$"), 0),
+    (re.compile(r"/items/[^/]+$"), 7 * DAY),
+    (re.compile(r"/items$"), DAY),
+]
+
+
+class Cache_Entry():
+    __slots__ = ("url", "body", "etag", "last_modified", "fetched_t", "ttl")
+
+    def __init__(self, url, body, etag, last_modified, fetched_t, ttl):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_t = fetched_t
+        self.ttl = ttl
+
+    @property
+    def fresh(self):
+        return time.time() - self.fetched_t < self.ttl
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Response_Cache():
+    def __init__(self, path="http_cache.sqlite", ttls=None, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.max_bytes = max_bytes
+
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                url TEXT PRIMARY KEY,
+                                body TEXT NOT NULL,
+                                etag TEXT,
+                                last_modified TEXT,
+                                fetched_t REAL NOT NULL,
+                                access_t REAL NOT NULL,
+                                size INTEGER NOT NULL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_access_t ON responses (access_t)")
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+    def ttl_for(self, url):
+        parts = urlsplit(url)
+        key = parts.path.rstrip("/")
+        for pattern, ttl in self.ttls:
+            if pattern.search(key):
+                return ttl
+        return 0
+
+    def lookup(self, url):
+        ttl = self.ttl_for(url)
+        if not ttl:
+            return None
+        row = self.conn.execute("SELECT body, etag, last_modified, fetched_t FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.conn.execute("UPDATE responses SET access_t = ? WHERE url = ?", (time.time(), url))
+        entry = Cache_Entry(url, row[0], row[1], row[2], row[3], ttl)
+        if entry.fresh:
+            self.hits += 1
+        else:
+            self.stale += 1
+        return entry
+
+    # Headers for a conditional request against a stale entry
+    def validators(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, url, body, headers):
+        if not self.ttl_for(url):
+            return
+        now = time.time()
+        size = len(body)
+        old = self.conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+        self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (url, body, headers.get("ETag"), headers.get("Last-Modified"), now, now, size))
+        self.total_bytes += size - (old[0] if old else 0)
+        self.evict()
+
+    # 304 Not Modified: keep the body, restart its ttl
+    def refresh(self, url, headers):
+        self.revalidated += 1
+        now = time.time()
+        self.conn.execute("""UPDATE responses SET fetched_t = ?, access_t = ?,
+                                etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+                             WHERE url = ?""",
+                          (now, now, headers.get("ETag"), headers.get("Last-Modified"), url))
+
+    # Least recently used entries go first
+    def evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute("SELECT url, size FROM responses ORDER BY access_t LIMIT 64").fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                self.conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.total_bytes -= size
+                self.evictions += 1
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    # Marks entries stale so the next lookup revalidates them, the body and validators are kept
+    def expire(self, urls):
+        self.conn.executemany("UPDATE responses SET fetched_t = 0 WHERE url = ?", [(url,) for url in urls])
+
+    def clear(self):
+        self.conn.execute("DELETE FROM responses")
+        self.total_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bytes": self.total_bytes
+        }
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,74 @@
+from storage import UpdateOne, DeleteMany
+from relic_ev import Relic_EV_Engine, REFINEMENTS, ERAS, METRICS
+
+BOARD_ERAS = ("All",) + ERAS
+
+
+def board_key(era, metric, refinement):
+    return f"{era}:{metric}:{refinement}"
+
+
+# Materialized (era, metric, refinement) rankings in t_lb, one document per rank
+class Relic_Leaderboard():
+    def __init__(self, database):
+        self.collection = database.leaderboard_collection
+        self.database = database
+
+    def build(self, engine):
+        boards = {}
+        for refinement in REFINEMENTS:
+            for metric in METRICS:
+                values = None if metric == "name" else engine.values(metric, refinement)
+                for era in BOARD_ERAS:
+                    order = engine.ranking(metric, refinement, era)
+                    boards[board_key(era, metric, refinement)] = [
+                        (engine.names[row], engine.relic_ids[row], None if values is None else round(float(values[row]), 4))
+                        for row in order]
+        return boards
+
+    # Writes only the ranks whose relic or value moved since the last refresh
+    def refresh(self, engine=None):
+        engine = engine or Relic_EV_Engine.from_database(self.database)
+        boards = self.build(engine)
+
+        # board -> {rank: (relic_name, value)}
+        current = {}
+        for doc in self.collection.find({}, {"board": 1, "rank": 1, "relic_name": 1, "value": 1}):
+            current.setdefault(doc["board"], {})[doc["rank"]] = (doc["relic_name"], doc["value"])
+        bulk_ops = []
+        for board, rows in boards.items():
+            era, metric, refinement = board.split(":")
+            ranks = current.get(board, {})
+            for rank, (relic_name, relic_id, value) in enumerate(rows):
+                if ranks.get(rank) == (relic_name, value):
+                    continue
+                bulk_ops.append(UpdateOne({"board": board, "rank": rank},
+                                          {"$set": {"era": era, "metric": metric, "refinement": refinement,
+                                                    "relic_name": relic_name, "relic_id": relic_id, "value": value}},
+                                          upsert=True))
+            # Boards that shrank drop their tail
+            if max(ranks, default=-1) >= len(rows):
+                bulk_ops.append(DeleteMany({"board": board, "rank": {"$gte": len(rows)}}))
+        if bulk_ops:
+            self.collection.bulk_write(bulk_ops, ordered=False)
+        return len(bulk_ops)
+
+    # Empty, or ranking other relics than t_rc holds, e.g. t_rc loaded by a run that never got to t_lb
+    def stale(self):
+        relics = {doc["relic_name"] for doc in self.database.relics_collection.find({}, {"relic_name": 1})}
+        ranked = {doc["relic_name"] for doc in self.collection.find({"board": board_key("All", "name", "intact")},
+                                                                    {"relic_name": 1})}
+        return ranked != relics
+
+    def page(self, era="All", metric="name", refinement="intact", page=0, page_size=50):
+        start = page * page_size
+        return list(self.collection.find({"board": board_key(era, metric, refinement),
+                                          "rank": {"$gte": start, "$lt": start + page_size}},
+                                         {"_id": 0, "rank": 1, "relic_name": 1, "value": 1},
+                                         sort=[("rank", 1)]))
+
+    def top(self, era="All", metric="plat", refinement="intact", k=10):
+        return self.page(era, metric, refinement, 0, k)
+
+    def size(self, era="All", metric="name", refinement="intact"):
+        return self.collection.count_documents({"board": board_key(era, metric, refinement)})
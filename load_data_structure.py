@@ -1,9 +1,9 @@
 import requests
-import re
-from pymongo import MongoClient
+from storage import default_storage
+from http_cache import Response_Cache
+from catalog import Catalog, build_id_lookup, resolve_sources
 
-client = MongoClient("localhost", 27017)
-db = client["test_static_data"]
+db = default_storage("test_static_data")
 prime_parts_collection = db["t_ppc"]
 relics_collection = db["t_rc"]
 relic_rewards = db["t_rr"]
@@ -11,10 +11,20 @@ raw_data = db["t_rd"]
 
 session = requests.Session()
 headers = {"Content-Type": "application/json"}
+cache = Response_Cache()
 
 def safe_get(url, **kwargs):
+    entry = cache.lookup(url)
+    if entry is not None and entry.fresh:
+        return entry.json()
     try:
-        return session.get(url, headers=headers, **kwargs).json()
+        resp = session.get(url, headers={**headers, **cache.validators(entry)}, **kwargs)
+        if resp.status_code == 304 and entry is not None:
+            cache.refresh(url, resp.headers)
+            return entry.json()
+        if resp.status_code == 200:
+            cache.store(url, resp.text, resp.headers)
+        return resp.json()
     except requests.RequestException as e:
         print(f"Request failed: {e}")
         return None
@@ -29,6 +39,8 @@ if items_data:
         raw_data.insert_many(items_data["payload"]["items"])
 else:
     item_info = []
+id_to_name = build_id_lookup(item_info)
+catalog = Catalog(item_info)
 
 
 def get_items_price(item_name):
@@ -67,7 +79,7 @@ def get_relic_detail(ppn):
 def main():
     for item_name, item_id in item_info:
 
-        if re.match(r".+(?<!kavasa_)prime_(?!set$).+$", item_name):
+        if catalog.category(item_name) == "part":
             prices90, prices48 = get_items_price(item_name)
             
             prices_90days = round(sum(prices90)/len(prices90), 2) if prices90 else 0
@@ -77,11 +89,7 @@ def main():
             thumb_url = get_thumb(item_name)
             ppn_sources = get_relic_detail(item_name)
 
-            ppn_sources_and_rarity = [(relic_ppn_name, part_rarity) 
-                                        for ppn_source, part_rarity in ppn_sources
-                                        for name_, id_ in item_info 
-                                        for relic_ppn_name in name_.split(",") 
-                                        if id_ in ppn_source]
+            ppn_sources_and_rarity = resolve_sources(id_to_name, ppn_sources)
             nested_ppn_sources = {relic_ppn_name: part_rarity for relic_ppn_name, part_rarity in ppn_sources_and_rarity}
 
             prime_parts_collection.insert_one({"item_id": item_id, 
@@ -94,7 +102,7 @@ def main():
                                                 })
             
 
-        if re.match(r"^(?<!requiem_)[^r].+_relic$", item_name):
+        if catalog.category(item_name) == "relic":
             prices90, prices48 = get_items_price(item_name)
             
             prices_90days = round(sum(prices90)/len(prices90), 2) if prices90 else 0
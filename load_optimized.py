@@ -1,34 +1,144 @@
 
 import pprint
+import os
 import aiohttp
 import asyncio
-import re
-from pymongo import MongoClient
-from pymongo import UpdateOne, InsertOne
+import json
+import logging
 import time
+from rate_limiter import Rate_Limiter, DEFAULT_RATE, DEFAULT_BURST
+from http_cache import Response_Cache
+from price_scheduler import Price_Refresh_Scheduler, PRICE_TTL
+from relic_index import Relic_Index
+from catalog import Catalog, build_id_lookup, resolve_sources
+from storage import default_storage, UpdateOne, UpdateMany, InsertOne
+from crawl_journal import Crawl_Journal
+from leaderboard import Relic_Leaderboard
+from metrics import Metrics, SIZE_BUCKETS, endpoint, traced
+from price_estimator import Price_Estimator
+
+logger = logging.getLogger(__name__)
+
+# RELIC_API_BASE points the loader at another host, e.g. the benchmark mock server
+API_BASE = os.environ.get("RELIC_API_BASE", "https://api.warframe.market/v1")
 
 class Initialize_Database():
-    def __init__(self, client=MongoClient("mongodb://localhost:27017/")):
-        self.client = client
-        self.db = self.client["optimized_db"]
+    # storage is a Mongo_Storage or Memory_Storage, picked from RELIC_STORAGE when not given
+    def __init__(self, storage=None):
+        self.storage = storage or default_storage()
+        self.db = self.storage
         self.prime_sets_collection = self.db["t_ps"]
         self.relics_collection = self.db["t_rc"]
         self.raw_collection = self.db["t_rd"]
+        self.relic_index_collection = self.db["t_ri"]
+        self.journal_collection = self.db["t_cj"]
+        self.leaderboard_collection = self.db["t_lb"]
+        self.work_queue_collection = self.db["t_wq"]
+
+    # (collection, key, unique)
+    indexes = [
+        ("t_rd", "item_id", True),
+        ("t_rd", "url_name", True),
+        ("t_rd", "category", False),
+        ("t_rd", "set_prefix", False),
+        ("t_ps", "set_id", True),
+        ("t_ps", "parts_in_set.item_id", False),
+        ("t_rc", "relic_id", True),
+        ("t_rc", "relic_detail.part_rewards.part_id", False),
+        ("t_ri", "relic_url", True),
+        ("t_cj", [("stage", 1), ("key", 1)], True),
+        ("t_lb", [("board", 1), ("rank", 1)], True),
+        ("t_wq", "job", True),
+        ("t_wq", [("kind", 1), ("status", 1)], False),
+    ]
+
+    def ensure_indexes(self):
+        for collection, key, unique in self.indexes:
+            self.db[collection].create_index(key, unique=unique)
+
+    # Representative loader queries, none of them should fall back to a collection scan
+    def check_query_plans(self):
+        queries = [
+            ("t_rd", {"item_id": {"$in": [""]}}),
+            ("t_rd", {"url_name": {"$in": [""]}}),
+            ("t_rd", {"set_prefix": {"$in": [""]}}),
+            ("t_rd", {"category": "relic"}),
+            ("t_ps", {"set_id": ""}),
+            ("t_ps", {"parts_in_set.item_id": ""}),
+            ("t_rc", {"relic_id": {"$in": [""]}}),
+            ("t_ri", {"relic_url": ""}),
+        ]
+        collscans = []
+        for collection, query in queries:
+            plan = self.db[collection].find(query).explain()["queryPlanner"]["winningPlan"]
+            if "COLLSCAN" in self.plan_stages(plan):
+                collscans.append((collection, query))
+        return collscans
+
+    # Rewrite the embedded set/part and relic prices from t_rd
+    def refresh_set_prices(self):
+        self.storage.refresh_set_prices()
+
+    def refresh_relic_prices(self):
+        self.storage.refresh_relic_prices()
+
+    # Delta mode: rewrite only the embedded prices of items in changed {item_id: (price_90d, price_48h)}
+    def propagate_set_prices(self, changed):
+        bulk_ops = []
+        for item_id, (price_90d, price_48h) in changed.items():
+            bulk_ops.append(UpdateOne({"set_id": item_id},
+                                      {"$set": {"price_set": {"set_p90d": price_90d, "set_p48h": price_48h}}}))
+            bulk_ops.append(UpdateMany({"parts_in_set.item_id": item_id},
+                                       {"$set": {"parts_in_set.$[part].price": {"price_90": price_90d, "price_48": price_48h}}},
+                                       array_filters=[{"part.item_id": item_id}]))
+        if bulk_ops:
+            self.prime_sets_collection.bulk_write(bulk_ops, ordered=False)
+        return len(bulk_ops)
+
+    def propagate_relic_prices(self, changed):
+        bulk_ops = []
+        for item_id, (price_90d, price_48h) in changed.items():
+            bulk_ops.append(UpdateOne({"relic_id": item_id},
+                                      {"$set": {"relic_detail.relic_p90d": price_90d, "relic_detail.relic_p48h": price_48h}}))
+            bulk_ops.append(UpdateMany({"relic_detail.part_rewards.part_id": item_id},
+                                       {"$set": {"relic_detail.part_rewards.$[reward].price_90d": price_90d,
+                                                 "relic_detail.part_rewards.$[reward].price_48h": price_48h}},
+                                       array_filters=[{"reward.part_id": item_id}]))
+        if bulk_ops:
+            self.relics_collection.bulk_write(bulk_ops, ordered=False)
+        return len(bulk_ops)
+
+    def plan_stages(self, plan):
+        stages = set()
+        if isinstance(plan, dict):
+            if "stage" in plan:
+                stages.add(plan["stage"])
+            for value in plan.values():
+                stages |= self.plan_stages(value)
+        elif isinstance(plan, list):
+            for value in plan:
+                stages |= self.plan_stages(value)
+        return stages
 
 class Data_Fetch_Conditions():
-    def __init__(self):
-        self.not_set_pattern = re.compile(r".+(?<!kavasa_)prime_(?!set$).+$")
-        self.set_pattern = re.compile(r"^(.+)_prime_set$")
-        self.relic_pattern = re.compile(r"^(?<!requiem_)[^r].+_relic$")
-
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, concurrency=6, host_limits=None, max_retries=3,
+                 cache_path="http_cache.sqlite", price_ttl=PRICE_TTL, refresh_budget=None, database=None, api_base=None, metrics=None):
         # Asycn stuffs
-        self.sema = asyncio.BoundedSemaphore(3)
-        self.delay = 0.7
+        self.api_base = (api_base or API_BASE).rstrip("/")
+        self.metrics = metrics or Metrics()
+        self.concurrency = concurrency
+        self.sema = asyncio.BoundedSemaphore(concurrency)
+        self.rate_limiter = Rate_Limiter(rate, burst, host_limits)
+        self.max_retries = max_retries
+        self.cache = Response_Cache(cache_path) if cache_path else None
         self.session = None
         self.filtered_data = None
+        self.catalog = None
+        self.id_to_name = {}
 
         # DBs
-        self.database = Initialize_Database()
+        self.database = database or Initialize_Database()
+        self.journal = Crawl_Journal(self.database.journal_collection)
 
         # Set flags
         self.ps_not_corrupted = True
@@ -41,33 +151,44 @@ class Data_Fetch_Conditions():
         self.price_updated = True
         self.api_status = True
 
+        # Per-item price staleness
+        self.scheduler = Price_Refresh_Scheduler(ttl=price_ttl, budget=refresh_budget)
+        self.price_docs = {}
+        self.stale_items = []
+        self.stale_count = 0
+        # item_id -> (price_90d, price_48h) of prices that moved this run, None until statistics are fetched
+        self.changed_prices = None
+
         # Price update for ps and rc?
         self.toggle_pu_ps = False
         self.toggle_pu_rc = False
 
     async def async_init(self, session):
         self.session = session
-        self.items_data = await self.fetch_one("https://api.warframe.market/v1/items")
+        self.database.ensure_indexes()
+        self.items_data = await self.fetch_one(f"{self.api_base}/items")
         self.raw_data = [(item["url_name"], item["id"]) for item in self.items_data["payload"]["items"]]
-        self.filtered_data = [
-            (name, _id) for (name, _id) in self.raw_data 
-            if self.set_pattern.match(name) or self.not_set_pattern.match(name) or self.relic_pattern.match(name)
-        ]
+        # Every url_name is classified once, the stages below look the category up
+        self.catalog = Catalog(self.raw_data)
+        self.filtered_data = self.catalog.filtered()
+        self.id_to_name = build_id_lookup(self.filtered_data)
+        self.backfill_catalog_fields()
         # Update the flags with values from data_check
         await self.data_check()
         return self
 
+    # t_rd rows written before the catalog fields existed get them once
+    def backfill_catalog_fields(self):
+        missing = [doc["url_name"] for doc in self.database.raw_collection.find({"category": {"$exists": False}}, {"url_name": 1})]
+        if missing:
+            self.database.raw_collection.bulk_write(
+                [UpdateOne({"url_name": name}, {"$set": self.catalog.fields(name)}) for name in missing], ordered=False)
+
     # Check if databases are updated and set manual toggle for price update 
     async def data_check(self):
-        ps_count = relic_count = pp_count = 0
-
-        for item_name, _ in self.filtered_data:
-            if self.set_pattern.match(item_name):
-                ps_count += 1
-            elif self.relic_pattern.match(item_name):
-                relic_count += 1
-            elif self.not_set_pattern.match(item_name):
-                pp_count += 1
+        ps_count = self.catalog.count("set")
+        relic_count = self.catalog.count("relic")
+        pp_count = self.catalog.count("part")
             
         raw_count = ps_count + relic_count + pp_count
         num_ps_db = self.database.prime_sets_collection.count_documents({})
@@ -79,7 +200,6 @@ class Data_Fetch_Conditions():
         # Check rd DB
         if num_rd_db != raw_count:
             self.rd_not_corrupted = False
-            self.price_updated = False
             self.rd_not_missing = num_rd_db != 0
         
         # Check ps DB
@@ -92,9 +212,13 @@ class Data_Fetch_Conditions():
             self.rc_not_corrupted = False
             self.rc_not_missing = num_rc_db != 0
 
-        # Check price (can be set manually)
-        num_epoch_time = self.database.raw_collection.find_one(sort=[("epoch_t", -1)])["epoch_t"] if self.rd_not_corrupted else 0
-        if self.epoch_time - num_epoch_time > 86400:
+        # Check price per item (can be set manually)
+        self.price_docs = {doc["item_id"]: doc for doc in self.database.raw_collection.find(
+            {}, {"item_id": 1, "price_90d": 1, "price_48h": 1, "epoch_t": 1})}
+        stale_items = self.scheduler.stale(self.filtered_data, self.price_docs, self.epoch_time)
+        self.stale_count = len(stale_items)
+        self.stale_items = stale_items if self.scheduler.budget is None else stale_items[:self.scheduler.budget]
+        if stale_items:
             self.price_updated = False
 
     def set_price_updated(self, value):
@@ -112,13 +236,64 @@ class Data_Fetch_Conditions():
         return results
 
     async def fetch_one(self, url):
-        async with self.sema:  
-            await asyncio.sleep(self.delay)
-            async with self.session.get(url) as resp:
-                return await resp.json()
+        path = endpoint(url)
+        entry = self.cache.lookup(url) if self.cache else None
+        if entry is not None and entry.fresh:
+            self.metrics.inc("http_cache_total", endpoint=path, result="hit")
+            return entry.json()
+        if self.cache:
+            self.metrics.inc("http_cache_total", endpoint=path, result="miss" if entry is None else "stale")
+        headers = self.cache.validators(entry) if self.cache else {}
+
+        for attempt in range(self.max_retries + 1):
+            # Wait for a token before taking a concurrency slot
+            with self.metrics.timed("rate_limit_wait_seconds", endpoint=path):
+                await self.rate_limiter.acquire(url)
+            wait_start = time.perf_counter()
+            async with self.sema:
+                self.metrics.observe("semaphore_wait_seconds", time.perf_counter() - wait_start, endpoint=path)
+                request_start = time.perf_counter()
+                try:
+                    async with self.session.get(url, headers=headers) as resp:
+                        if resp.status == 429 or resp.status >= 500:
+                            self.rate_limiter.backoff(url, resp.headers.get("Retry-After"))
+                            if attempt < self.max_retries:
+                                self.metrics.inc("http_retries_total", endpoint=path, status=resp.status)
+                                continue
+                            resp.raise_for_status()
+                        self.rate_limiter.success(url)
+
+                        if resp.status == 304 and entry is not None:
+                            self.metrics.observe("http_request_seconds", time.perf_counter() - request_start, endpoint=path, status=304)
+                            self.cache.refresh(url, resp.headers)
+                            return entry.json()
+                        body = await resp.text()
+                        self.metrics.observe("http_request_seconds", time.perf_counter() - request_start, endpoint=path, status=resp.status)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status = getattr(e, "status", type(e).__name__)
+                    self.metrics.inc("http_errors_total", endpoint=path, status=status)
+                    # Timeouts and dropped connections back off and retry like a 429/5xx, a 429/5xx
+                    # raised here is already out of retries
+                    if attempt < self.max_retries and not isinstance(e, aiohttp.ClientResponseError):
+                        self.rate_limiter.backoff(url)
+                        self.metrics.inc("http_retries_total", endpoint=path, status=status)
+                        continue
+                    raise
+                if self.cache and resp.status == 200:
+                    self.cache.store(url, body, resp.headers)
+                with self.metrics.timed("json_decode_seconds", endpoint=path):
+                    return json.loads(body)
+
+    def throughput_report(self):
+        return self.rate_limiter.report()
+            
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else {}
             
     async def close(self):
         await self.session.close()
+        if self.cache:
+            self.cache.close()
             
     def calculate_average_price(self, stats):
         prices = [stat["avg_price"] for stat in stats if stat["avg_price"] is not None]
@@ -134,7 +309,7 @@ class Data_Fetch_Conditions():
     async def get_relic_detail(self, gen): #Generator
         try:
             for ppn in gen:
-                data = self.fetch_all(f"https://api.warframe.market/v1/items/{ppn}/dropsources")
+                data = self.fetch_all(f"{self.api_base}/items/{ppn}/dropsources")
                 relic_source = data["payload"]["dropsources"]
                 
                 yield [(relic_id, relic_data["rarity"]) 
@@ -146,369 +321,387 @@ class Data_Fetch_Conditions():
         
 
 class Database_Upload():
-    def __init__(self):
+    def __init__(self, metrics=None, **dfc_options):
         self.init_DFC = None
+        # Shared with Data_Fetch_Conditions, export with export_metrics()
+        self.metrics = metrics or Metrics()
+        # Forwarded to Data_Fetch_Conditions (rate limits, cache, refresh budget, database)
+        self.dfc_options = dfc_options
+        # Optional Search_Index kept up to date as sets and relics are written
+        self.search_index = None
+        # Optional Price_History, every statistics payload is appended before it is averaged
+        self.price_history = None
+        # Robust estimates written next to price_90d/price_48h, None to skip them
+        self.estimator = Price_Estimator()
+        # Optional callback(stage, done, total)
+        self.progress = None
+
+    def report(self, stage, done, total):
+        if self.progress is not None:
+            self.progress(stage, done, total)
+
+    # loader.prom for a Prometheus textfile collector, loader_metrics.jsonl for the spans
+    def export_metrics(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.metrics.write_prometheus(os.path.join(directory, "loader.prom"))
+        self.metrics.write_json_lines(os.path.join(directory, "loader_metrics.jsonl"))
         
     async def instantiate_DFC(self):
         session = aiohttp.ClientSession()
-        dfc = Data_Fetch_Conditions()
+        dfc = Data_Fetch_Conditions(metrics=self.metrics, **self.dfc_options)
         self.init_DFC = await dfc.async_init(session)
 
+    # Bounded queue in, results reduced as they complete, unordered bulk writes flushed every flush_size docs
+    async def stream_statistics(self, items, stage="statistics", flush_size=200, flush_interval=2.0, queue_size=64):
+        # Skip what an interrupted run already committed
+        done_keys = self.init_DFC.journal.begin(stage)
+        items = [(name, _id) for name, _id in items if name not in done_keys]
+
+        if self.init_DFC.changed_prices is None:
+            self.init_DFC.changed_prices = {}
+
+        work = asyncio.Queue(maxsize=queue_size)
+        done = asyncio.Queue(maxsize=queue_size)
+        workers = self.init_DFC.concurrency
+
+        async def produce():
+            for item in items:
+                await work.put((item, time.perf_counter()))
+            for _ in range(workers):
+                await work.put(None)
+
+        async def fetch():
+            while (queued := await work.get()) is not None:
+                item, queued_t = queued
+                self.metrics.observe("queue_wait_seconds", time.perf_counter() - queued_t, stage=stage)
+                name, _id = item
+                try:
+                    result = await self.init_DFC.fetch_one(f"{self.init_DFC.api_base}/items/{name}/statistics")
+                    if self.price_history is not None:
+                        self.price_history.record(name, result)
+                    await done.put((item, (self.init_DFC.process_statistics(result), result)))
+                except Exception as e:
+                    await done.put((item, e))
+            await done.put(None)
+
+        tasks = [asyncio.create_task(produce())] + [asyncio.create_task(fetch()) for _ in range(workers)]
+        written = failed = processed = 0
+        # (item_id, fields) and the payloads they came from, estimated and written a batch at a time
+        updates = []
+        payloads = []
+        last_flush = time.monotonic()
+        remaining = workers
+        try:
+            while remaining:
+                entry = await done.get()
+                if entry is None:
+                    remaining -= 1
+                    continue
+                (name, _id), result = entry
+                processed += 1
+                self.report(stage, processed, len(items))
+                if isinstance(result, Exception):
+                    logger.warning("%s: %s: %r", stage, name, result)
+                    self.metrics.inc("fetch_errors_total", stage=stage)
+                    failed += 1
+                    continue
+
+                (price_90d, price_48h), payload = result
+                old = self.init_DFC.price_docs.get(_id)
+                if old is None or (old.get("price_90d"), old.get("price_48h")) != (price_90d, price_48h):
+                    self.init_DFC.changed_prices[_id] = (price_90d, price_48h)
+                updates.append((_id, self.statistics_fields(name, price_90d, price_48h)))
+                payloads.append(payload)
+                if len(updates) >= flush_size or time.monotonic() - last_flush > flush_interval:
+                    written += self.flush_statistics(stage, updates, payloads)
+                    updates = []
+                    payloads = []
+                    last_flush = time.monotonic()
+
+            if updates:
+                written += self.flush_statistics(stage, updates, payloads)
+            if self.price_history is not None:
+                self.price_history.flush()
+            # With failures the stage stays "started", the next run fetches only what is missing
+            if not failed:
+                self.init_DFC.journal.finish(stage)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return written, failed
+
+    def statistics_fields(self, name, price_90d, price_48h):
+        return {
+                "url_name": name,
+                "price_90d": price_90d,
+                "price_48h": price_48h,
+                "epoch_t": self.init_DFC.epoch_time,
+                **self.init_DFC.catalog.fields(name)
+        }
+
+    def flush_statistics(self, stage, updates, payloads):
+        written = self.write_statistics(updates, payloads)
+        self.init_DFC.journal.record(stage, [fields["url_name"] for _, fields in updates])
+        return written
+
+    # Upserts on item_id, writing the same batch twice leaves t_rd as it was
+    def write_statistics(self, updates, payloads):
+        if self.estimator is not None:
+            with self.metrics.timed("estimate_seconds"):
+                estimates = self.estimator.estimate(payloads)
+            for (_, fields), estimate in zip(updates, estimates):
+                fields.update(estimate)
+        bulk_ops = [UpdateOne({"item_id": _id}, {"$set": fields}, upsert=True) for _id, fields in updates]
+        with self.metrics.timed("bulk_write_seconds", collection="t_rd"):
+            self.init_DFC.database.raw_collection.bulk_write(bulk_ops, ordered=False)
+        self.metrics.observe("bulk_write_docs", len(bulk_ops), SIZE_BUCKETS, collection="t_rd")
+        return len(bulk_ops)
+
+    @traced("raw_and_price")
     async def load_raw_and_price(self):
         if not self.init_DFC.rd_not_corrupted:
             filtered_raw = [(name, _id) for name, _id in self.init_DFC.filtered_data]
 
             if self.init_DFC.rd_not_missing:
-                existing_data = [raw["url_name"] for raw in self.init_DFC.database.raw_collection.find()]
+                existing_data = {raw["url_name"] for raw in self.init_DFC.database.raw_collection.find({}, {"url_name": 1})}
                 filtered_raw = [(name, _id) for name, _id in filtered_raw if name not in existing_data]
 
-            urls = [(name, f"https://api.warframe.market/v1/items/{name}/statistics") for name, _id in filtered_raw]
-            results = await self.init_DFC.fetch_all(urls)
-
-            updates = []
-            bulk_ops = []
-            for result in results:
-                if isinstance(result, Exception):
-                    print(f"Error: {repr(result)}")
-                price_90d, price_48h = self.init_DFC.process_statistics(result)
-                updates.append((price_90d, price_48h))
-
-            for (name, _id), (price_90d, price_48h) in zip(filtered_raw, updates):
-                new_data = {
-                    "url_name": name,
-                    "price_90d": price_90d,
-                    "price_48h": price_48h,
-                    "epoch_t": self.init_DFC.epoch_time
-                }
-                if not self.init_DFC.rd_not_missing:
-                    existing_item = self.init_DFC.database.raw_collection.find_one({"item_id": _id})
-                    if existing_item is None:
-                        bulk_ops.append(InsertOne({"item_id": _id, **new_data}))
-                    else:
-                        bulk_ops.append(UpdateOne({"item_id": _id}, {"$set": new_data}))
-
-            if bulk_ops:
-                self.init_DFC.database.raw_collection.bulk_write(bulk_ops)
-
-            self.init_DFC.rd_not_corrupted = True
-            self.init_DFC.rd_not_missing = True
-            self.init_DFC.price_updated = True
+            _, failed = await self.stream_statistics(filtered_raw, stage="raw")
+            # The later stages read t_rd, they are told it is complete only when it is
+            if failed:
+                logger.warning("raw: %d items failed, t_rd stays incomplete until the next run", failed)
+            else:
+                self.init_DFC.rd_not_corrupted = True
+                self.init_DFC.rd_not_missing = True
         
         if not self.init_DFC.price_updated:
-            urls = [f"https://api.warframe.market/v1/items/{name}/statistics" for name, _id in self.init_DFC.filtered_data]
-            results = await self.init_DFC.fetch_all(urls)
-
-            updates = []
-            for result in results:
-                if isinstance(result, Exception):
-                    print(f"Error: {repr(result)}")
-                    continue
-                price_90d, price_48h = self.init_DFC.process_statistics(result)
-                updates.append((price_90d, price_48h))
-
-            bulk_ops = [UpdateOne({"item_id": _id}, 
-                                {"$set": {
-                                        "url_name": name,
-                                        "price_90d": price_90d, 
-                                        "price_48h": price_48h, 
-                                        "epoch_t": self.init_DFC.epoch_time
-            }}) for (name, _id), (price_90d, price_48h) in zip(self.init_DFC.filtered_data, updates)]
-            
-            self.init_DFC.database.raw_collection.bulk_write(bulk_ops)                                                     
-            self.init_DFC.price_updated = True                                                       
+            # Only items past their ttl, most volatile/valuable first, capped by the run budget
+            refresh = self.init_DFC.stale_items or self.init_DFC.scheduler.select(
+                self.init_DFC.filtered_data, self.init_DFC.price_docs, self.init_DFC.epoch_time, force=True)
+            # The scheduler can pick items younger than the statistics cache ttl (min_ttl, forced runs),
+            # expired entries are revalidated with a conditional request instead of served as they are
+            if self.init_DFC.cache:
+                self.init_DFC.cache.expire([f"{self.init_DFC.api_base}/items/{name}/statistics" for name, _ in refresh])
+            written, failed = await self.stream_statistics(refresh)
+            if failed:
+                logger.warning("statistics: %d items failed, they stay stale until the next run", failed)
+
+            # Items left over by the budget or failed fetches stay stale until the next run
+            self.init_DFC.stale_count = max(0, self.init_DFC.stale_count - written)
+            self.init_DFC.stale_items = []
+            self.init_DFC.price_updated = self.init_DFC.stale_count == 0
     
 
+    @traced("prime_sets")
     async def load_prime_sets(self):
         if not self.init_DFC.ps_not_corrupted:
-            filtered_raw = {(name, _id) for name, _id in self.init_DFC.filtered_data if self.init_DFC.set_pattern.match(name)}
+            catalog = self.init_DFC.catalog
+            filtered_raw = set(catalog.by_category["set"])
 
             if self.init_DFC.ps_not_missing:
-                existing_sets = {set["set_url"]: set for set in self.init_DFC.database.prime_sets_collection.find()}
+                existing_sets = {set["set_url"] for set in self.init_DFC.database.prime_sets_collection.find({}, {"set_url": 1})}
                 filtered_raw = {(name, _id) for name, _id in filtered_raw if name not in existing_sets}
 
+            # Sets committed by an interrupted run are skipped
+            done_sets = self.init_DFC.journal.begin("prime_sets")
             name_set = set()
             for name, _id in filtered_raw:
-                match = self.init_DFC.set_pattern.match(name)
-                name_set.add(match.group(1))
+                if catalog.set_prefix(name) not in done_sets:
+                    name_set.add(catalog.set_prefix(name))
             
-            bulk_ops = []
-            for name in name_set:
-                temp_list = []
-                temp_data = {}
-                part_agg = self.init_DFC.database.raw_collection.aggregate([{
-                                                '$match': {
-                                                    'url_name': re.compile(rf"^{name}_")
-                                                }
-                                            }])
-                lists = list(part_agg)
-                urls = [(part["url_name"], f"https://api.warframe.market/v1/items/{part['url_name']}/dropsources?include=item")
+            # One read of every set and part row on the set_prefix index
+            parts_by_set = {name: [] for name in name_set}
+            for part in self.init_DFC.database.raw_collection.find({"set_prefix": {"$in": list(name_set)}}):
+                parts_by_set[part["set_prefix"]].append(part)
+
+            failed_sets = 0
+            for i, set_name in enumerate(name_set, 1):
+                self.report("prime_sets", i, len(name_set))
+                lists = parts_by_set[set_name]
+                urls = [(part["url_name"], f"{self.init_DFC.api_base}/items/{part['url_name']}/dropsources?include=item")
                     for part in lists]
-                results = await self.init_DFC.fetch_all(urls)
-
-                price_info = [(part["price_90d"], part["price_48h"]) for part in lists] 
+                with self.metrics.timed("set_fetch_seconds"):
+                    results = await self.init_DFC.fetch_all(urls)
+
+                # An incomplete set is not written, the next run picks it up again
+                errors = [result for result in results if isinstance(result, Exception)]
+                if errors:
+                    logger.warning("prime set %s: %r", set_name, errors[0])
+                    failed_sets += 1
+                    continue
 
-                for (name, _), result, (p_90, p_48) in zip(urls, results, price_info):
-                    relic_sources_info = [(relic_id, relic_data["rarity"]) 
-                        for relic_data in result["payload"]["dropsources"] 
-                        for relic_id in relic_data["relic"].split(",")]
+                aggregate_start = time.perf_counter()
+                temp_data = self.set_document(urls, results, lists)
+                self.metrics.observe("set_aggregate_seconds", time.perf_counter() - aggregate_start)
+                # A set without its root or with a part missing from t_rd is not written or journaled
+                if not self.set_complete(results, temp_data):
+                    logger.warning("prime set %s: incomplete t_rd rows", set_name)
+                    failed_sets += 1
+                    continue
+                # Committed set by set so a crash only loses the set in flight
+                with self.metrics.timed("bulk_write_seconds", collection="t_ps"):
+                    self.init_DFC.database.prime_sets_collection.insert_one({"set_id": temp_data["set_id"], **temp_data})
+                if self.search_index is not None:
+                    self.search_index.add_set(temp_data)
+                self.init_DFC.journal.record("prime_sets", [set_name])
 
-                    ppn_sources_and_rarity = [
-                    (name_.split(",")[0], part_rarity)
-                    for ppn_source, part_rarity in relic_sources_info
-                    for name_, id_ in self.init_DFC.filtered_data
-                        if id_ in ppn_source]
-                    
-                    parts_in_set_list = result["include"]["item"]["items_in_set"]
-
-                    for part in parts_in_set_list:
-                        if name == part["url_name"]:
-                            if self.init_DFC.not_set_pattern.match(name):
-                                temp_list.append({
-                                    "item_url": name,
-                                    "ducats": part["ducats"],
-                                    "item_id": part["id"],
-                                    "trading_tax": part["trading_tax"],
-                                    "quantity_for_set": part["quantity_for_set"],
-                                    "item_name": part["en"]["item_name"],
-                                    "price": {"price_90": p_90, "price_48": p_48},
-                                    "ppn_source_and_rarity": ppn_sources_and_rarity})      
-                                       
-                    if self.init_DFC.set_pattern.match(name):
-                        temp_data = {
-                                "set_url": name,
-                                "ducats": part["ducats"],
-                                "set_id": part["id"],
-                                "trading_tax": part["trading_tax"],
-                                "price_set": {"set_p90d": p_90,
-                                            "set_p48h": p_48},
-                                "parts_in_set": temp_list
-                        }
-                if temp_data:
-                    bulk_ops.append(InsertOne({"set_id": part["id"], **temp_data}))
-            if bulk_ops:
-                self.init_DFC.database.prime_sets_collection.bulk_write(bulk_ops)
+            if failed_sets:
+                return
+            self.init_DFC.journal.finish("prime_sets")
 
         self.init_DFC.ps_not_corrupted = True
         self.init_DFC.ps_not_missing = True
 
         if self.init_DFC.toggle_pu_ps:
-            pipeline = [
-                {
-                    '$lookup': {
-                        'from': 't_rd', 
-                        'localField': 'set_id', 
-                        'foreignField': 'item_id', 
-                        'as': 'set_price_info'
-                    }
-                }, {
-                    '$unwind': {
-                        'path': '$set_price_info',
-                        'preserveNullAndEmptyArrays': True
-                    }
-                }, {
-                    '$addFields': {
-                        'price_set': {
-                            'set_p90d': '$set_price_info.price_90d', 
-                            'set_p48h': '$set_price_info.price_48h'
-                        }
-                    }
-                }, {
-                    '$unwind': '$parts_in_set'
-                }, {
-                    '$lookup': {
-                        'from': 't_rd', 
-                        'localField': 'parts_in_set.item_id', 
-                        'foreignField': 'item_id', 
-                        'as': 'parts_in_set.price_info'
-                    }
-                }, {
-                    '$unwind': {
-                        'path': '$parts_in_set.price_info',
-                        'preserveNullAndEmptyArrays': True
-                    }
-                }, {
-                    '$addFields': {
-                        'parts_in_set.price': {
-                            'price_90': '$parts_in_set.price_info.price_90d', 
-                            'price_48': '$parts_in_set.price_info.price_48h'
-                        }
-                    }
-                }, {
-                    '$group': {
-                        '_id': '$_id', 
-                        'set_url': {
-                            '$first': '$set_url'
-                        }, 
-                        'set_id': {
-                            '$first': '$set_id'
-                        }, 
-                        'price_set': {
-                            '$first': '$price_set'
-                        }, 
-                        'parts_in_set': {
-                            '$push': '$parts_in_set'
-                        }
-                    }
-                }, {
-                    '$project': {
-                        'parts_in_set.price_info': 0
-                    }
-                }]
-            
-            updated_ps = self.init_DFC.database.prime_sets_collection.aggregate(pipeline)
-            bulk_operations = [
-                UpdateOne(
-                    {"_id": doc["_id"]},
-                    {"$set": doc}
-                ) for doc in updated_ps
-            ]
-            self.init_DFC.database.prime_sets_collection.bulk_write(bulk_operations)
+            # Only the prices that moved this run, a full rebuild when nothing was fetched
+            with self.metrics.span("set_prices", changed=len(self.init_DFC.changed_prices or ())):
+                if self.init_DFC.changed_prices is not None:
+                    self.init_DFC.database.propagate_set_prices(self.init_DFC.changed_prices)
+                else:
+                    self.init_DFC.database.refresh_set_prices()
                 
             
-    async def load_relics(self):
+    # The t_ps document of one set from its parts' t_rd rows and their dropsources?include=item payloads,
+    # {} when the set row itself is missing
+    def set_document(self, urls, results, lists):
+        catalog = self.init_DFC.catalog
+        temp_list = []
+        temp_data = {}
+        price_info = [(part["price_90d"], part["price_48h"]) for part in lists] 
+
+        for (name, _), result, (p_90, p_48) in zip(urls, results, price_info):
+            relic_sources_info = [(relic_id, relic_data["rarity"]) 
+                for relic_data in result["payload"]["dropsources"] 
+                for relic_id in relic_data["relic"].split(",")]
+
+            ppn_sources_and_rarity = resolve_sources(self.init_DFC.id_to_name, relic_sources_info)
+            
+            parts_in_set_list = result["include"]["item"]["items_in_set"]
+
+            for part in parts_in_set_list:
+                if name == part["url_name"]:
+                    if catalog.category(name) == "part":
+                        temp_list.append({
+                            "item_url": name,
+                            "ducats": part["ducats"],
+                            "item_id": part["id"],
+                            "trading_tax": part["trading_tax"],
+                            "quantity_for_set": part["quantity_for_set"],
+                            "item_name": part["en"]["item_name"],
+                            "price": {"price_90": p_90, "price_48": p_48},
+                            "ppn_source_and_rarity": ppn_sources_and_rarity})      
+                               
+            if catalog.category(name) == "set":
+                # The set root can sit anywhere in items_in_set, never take it from the loop variable
+                root = next((item for item in parts_in_set_list if item["url_name"] == name), None)
+                if root is None:
+                    continue
+                temp_data = {
+                        "set_url": name,
+                        "ducats": root["ducats"],
+                        "set_id": root["id"],
+                        "trading_tax": root["trading_tax"],
+                        "price_set": {"set_p90d": p_90,
+                                    "set_p48h": p_48},
+                        "parts_in_set": temp_list
+                }
+        return temp_data
+
+    # Every part the API lists in items_in_set has a t_rd row, and so an entry in parts_in_set
+    def set_complete(self, results, prime_set):
+        if not prime_set:
+            return False
+        catalog = self.init_DFC.catalog
+        listed = {item["url_name"] for result in results for item in result["include"]["item"]["items_in_set"]
+                  if catalog.category(item["url_name"]) == "part"}
+        return listed <= {part["item_url"] for part in prime_set["parts_in_set"]}
+
+    def flush_relics(self, relic_docs):
+        with self.metrics.timed("bulk_write_seconds", collection="t_rc"):
+            self.init_DFC.database.relics_collection.bulk_write([InsertOne(doc) for doc in relic_docs], ordered=False)
+        self.metrics.observe("bulk_write_docs", len(relic_docs), SIZE_BUCKETS, collection="t_rc")
+        self.init_DFC.journal.record("relics", [doc["relic_name"] for doc in relic_docs])
+        if self.search_index is not None:
+            for doc in relic_docs:
+                self.search_index.add_relic(doc)
+
+    def relic_document(self, relic_index, relic_name, relic_id, relic_doc):
+        relic_p90d = relic_doc.get("price_90d")
+        relic_p48h = relic_doc.get("price_48h")
+
+        reward_list = relic_index.rewards(relic_name)
+
+        return {"relic_id": relic_id,
+                "relic_name": relic_name,
+                "relic_detail": {
+                "relic_p90d": relic_p90d, 
+                "relic_p48h": relic_p48h, 
+                "subtypes": "intact, exceptional, flawless, radiant",
+                "part_rewards": reward_list
+                }
+            }
+
+    @traced("relics")
+    async def load_relics(self, flush_size=100):
         if not self.init_DFC.rc_not_corrupted:
-            filtered_raw = {(name, _id) for name, _id in self.init_DFC.filtered_data if self.init_DFC.relic_pattern.match(name)}
+            # Relic rewards come from t_ps, building them from a partial t_ps would store incomplete relics
+            if not self.init_DFC.ps_not_corrupted:
+                logger.warning("Prime sets are incomplete, relics are not loaded until they are")
+                return
+            # Relic prices come from t_rd, a relic without its row would be stored without them
+            if not self.init_DFC.rd_not_corrupted:
+                logger.warning("t_rd is incomplete, relics are not loaded until it is")
+                return
+
+            filtered_raw = set(self.init_DFC.catalog.by_category["relic"])
 
             if self.init_DFC.rc_not_missing:
-                existing_relics = {relic["relic_url"]: relic for relic in self.init_DFC.database.relics_collection.find()}
+                existing_relics = {relic["relic_name"] for relic in self.init_DFC.database.relics_collection.find({}, {"relic_name": 1})}
                 filtered_raw = {(name, _id) for name, _id in filtered_raw if name not in existing_relics}
 
-            bulk_ops = []
-            for relic_name, relic_id in filtered_raw:
-                relic_doc = self.init_DFC.database.raw_collection.find_one({"item_id": relic_id})
+            done_relics = self.init_DFC.journal.begin("relics")
+            filtered_raw = {(name, _id) for name, _id in filtered_raw if name not in done_relics}
 
-                relic_p90d = relic_doc.get("price_90d")
-                relic_p48h = relic_doc.get("price_48h")
-                
+            # One pass over t_ps instead of a full scan per relic
+            relic_index = Relic_Index(self.init_DFC.database)
+            with self.metrics.span("relic_index"):
+                relic_index.rebuild()
 
-                reward_list = [({  
-                        "part_url": part["item_url"],
-                        "part_id": part["item_id"],
-                        "ducats": part["ducats"],
-                        "rarity": part_rarity,
-                        "price_90d": part["price"]["price_90"],
-                        "price_48h": part["price"]["price_48"]
-                        })
-                    for prime_set in self.init_DFC.database.prime_sets_collection.find()
-                    for part in prime_set["parts_in_set"]
-                    for relic_source, part_rarity in part.get("ppn_source_and_rarity", [])
-                    if relic_name in relic_source
-                    ]
-
-                if len(reward_list) == 5:
-                    rarity_counts = {'common': 0, 'uncommon': 0}
-                    for rarity in reward_list:
-                        if rarity["rarity"] in rarity_counts:
-                            rarity_counts[rarity["rarity"]] += 1
-
-                    if rarity_counts['common'] < 3:
-                        reward_list.append({"part_url": "forma_blueprint",
-                                            "rarity": "common"})
-                    elif rarity_counts['uncommon'] < 2:
-                        reward_list.append({"part_url": "forma_blueprint",
-                                            "rarity": "uncommon"})
-        
-                new_data = {"relic_name": relic_name,
-                            "relic_id": relic_id,
-                            "relic_detail": {
-                            "relic_p90d": relic_p90d, 
-                            "relic_p48h": relic_p48h, 
-                            "subtypes": "intact, exceptional, flawless, radiant",
-                            "part_rewards": reward_list
-                            }
-                        }
-                if new_data:
-                    bulk_ops.append(InsertOne({"relic_id": relic_id, **new_data}))
-            if bulk_ops:
-                self.init_DFC.database.relics_collection.bulk_write(bulk_ops)
+            relic_docs = {doc["item_id"]: doc for doc in self.init_DFC.database.raw_collection.find(
+                {"item_id": {"$in": [relic_id for _, relic_id in filtered_raw]}})}
+
+            relic_batch = []
+            missing = 0
+            for i, (relic_name, relic_id) in enumerate(filtered_raw, 1):
+                # Left unjournaled, the next run builds it once its t_rd row exists
+                if relic_id not in relic_docs:
+                    missing += 1
+                    continue
+                relic_batch.append(self.relic_document(relic_index, relic_name, relic_id, relic_docs[relic_id]))
+                if len(relic_batch) >= flush_size:
+                    self.flush_relics(relic_batch)
+                    relic_batch = []
+                    self.report("relics", i, len(filtered_raw))
+            if relic_batch:
+                self.flush_relics(relic_batch)
+            if missing:
+                logger.warning("relics: %d without a t_rd row, left for the next run", missing)
+                return
+            self.init_DFC.journal.finish("relics")
 
         self.init_DFC.rc_not_corrupted = True
         self.init_DFC.rc_not_missing = True    
 
         if self.init_DFC.toggle_pu_rc:
-            pipeline = [
-                    {
-                        '$lookup': {
-                            'from': 't_rd', 
-                            'localField': 'relic_id', 
-                            'foreignField': 'item_id', 
-                            'as': 'relic_price_info'
-                        }
-                    }, {
-                        '$unwind': {
-                            'path': '$relic_price_info', 
-                            'preserveNullAndEmptyArrays': True
-                        }
-                    }, {
-                        '$addFields': {
-                            'relic_detail.relic_p90d': '$relic_price_info.price_90d', 
-                            'relic_detail.relic_p48h': '$relic_price_info.price_48h'
-                        }
-                    }, {
-                        '$addFields': {
-                            'filtered_part_rewards': {
-                                '$filter': {
-                                    'input': '$relic_detail.part_rewards', 
-                                    'as': 'part', 
-                                    'cond': {
-                                        '$ifNull': [
-                                            '$$part.part_id', False
-                                        ]
-                                    }
-                                }
-                            }
-                        }
-                    }, {
-                        '$lookup': {
-                            'from': 't_rd', 
-                            'localField': 'filtered_part_rewards.part_id', 
-                            'foreignField': 'item_id', 
-                            'as': 'relic_price_info'
-                        }
-                    }, {
-                        '$addFields': {
-                            'relic_detail.part_rewards': {
-                                '$map': {
-                                    'input': '$relic_detail.part_rewards', 
-                                    'as': 'part', 
-                                    'in': {
-                                        '$mergeObjects': [
-                                            '$$part', {
-                                                '$arrayElemAt': [
-                                                    {
-                                                        '$filter': {
-                                                            'input': '$relic_price_info', 
-                                                            'as': 'priceInfo', 
-                                                            'cond': {
-                                                                '$eq': [
-                                                                    '$$priceInfo.item_id', '$$part.part_id'
-                                                                ]
-                                                            }
-                                                        }
-                                                    }, 0
-                                                ]
-                                            }
-                                        ]
-                                    }
-                                }
-                            }
-                        }
-                    }, {
-                        '$project': {
-                            'relic_detail.part_rewards._id': 0, 
-                            'relic_detail.part_rewards.item_id': 0, 
-                            'relic_detail.part_rewards.url_name': 0, 
-                            'relic_detail.part_rewards.epoch_t': 0, 
-                            'filtered_part_rewards': 0, 
-                            'relic_price_info': 0
-                        }
-                    }
-                ]        
-            updated_ps = self.init_DFC.database.relics_collection.aggregate(pipeline)
-            bulk_operations = [
-                UpdateOne(
-                    {"_id": doc["_id"]},
-                    {"$set": doc}
-                ) for doc in updated_ps
-            ]
-            self.init_DFC.database.relics_collection.bulk_write(bulk_operations)
+            with self.metrics.span("relic_prices", changed=len(self.init_DFC.changed_prices or ())):
+                if self.init_DFC.changed_prices is not None:
+                    self.init_DFC.database.propagate_relic_prices(self.init_DFC.changed_prices)
+                else:
+                    self.init_DFC.database.refresh_relic_prices()
+
+    # Keeps the per-era leaderboards in t_lb in step with t_rc after a load or price refresh
+    @traced("leaderboards")
+    async def load_leaderboards(self):
+        leaderboard = Relic_Leaderboard(self.init_DFC.database)
+        if self.init_DFC.changed_prices or leaderboard.stale():
+            leaderboard.refresh()
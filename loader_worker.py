@@ -0,0 +1,117 @@
+import asyncio
+import os
+import queue
+import threading
+import aiohttp
+from load_optimized import Database_Upload, Data_Fetch_Conditions, API_BASE
+from price_history import Price_History
+
+STAGES = [
+    ("Prices", "load_raw_and_price"),
+    ("Prime sets", "load_prime_sets"),
+    ("Relics", "load_relics"),
+    ("Leaderboards", "load_leaderboards"),
+]
+
+
+# Stands in for a Search_Index on the worker side, new entries are applied by the Tk thread
+class Index_Relay():
+    def __init__(self, worker):
+        self.worker = worker
+
+    def add_set(self, prime_set):
+        self.worker.post("index_set", prime_set)
+
+    def add_relic(self, relic):
+        self.worker.post("index_relic", relic)
+
+
+# Runs the Database_Upload stages on an asyncio loop in its own thread.
+# Messages for the Tk thread go through a queue.Queue polled with after():
+#   ("progress", fraction, text), ("stage_done", label), ("index_set", doc), ("index_relic", doc),
+#   ("done", None), ("cancelled", None), ("error", exception)
+class Loader_Worker(threading.Thread):
+    def __init__(self, messages=None, **upload_options):
+        super().__init__(daemon=True)
+        self.messages = messages or queue.Queue()
+        self.upload_options = upload_options
+        self.loop = None
+        self.task = None
+        self.cancel_requested = threading.Event()
+
+    def post(self, kind, *payload):
+        self.messages.put((kind,) + payload)
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.task = self.loop.create_task(self.load())
+            self.loop.run_until_complete(self.task)
+            self.post("done", None)
+        except asyncio.CancelledError:
+            self.post("cancelled", None)
+        except Exception as e:
+            self.post("error", e)
+        finally:
+            self.loop.close()
+
+    async def load(self):
+        upload = Database_Upload(**self.upload_options)
+        upload.search_index = Index_Relay(self)
+        if os.environ.get("RELIC_HISTORY_DIR"):
+            upload.price_history = Price_History(os.environ["RELIC_HISTORY_DIR"])
+        await upload.instantiate_DFC()
+        try:
+            for i, (label, stage) in enumerate(STAGES):
+                if self.cancel_requested.is_set():
+                    raise asyncio.CancelledError()
+                # Progress inside a stage is scaled into that stage's share of the bar
+                upload.progress = lambda _, done, total, i=i, label=label: self.post(
+                    "progress", (i + done / max(total, 1)) / len(STAGES), f"{label}: {done}/{total}")
+                self.post("progress", i / len(STAGES), label)
+                await getattr(upload, stage)()
+                self.post("stage_done", label)
+        finally:
+            await upload.init_DFC.close()
+            if os.environ.get("RELIC_METRICS_DIR"):
+                upload.export_metrics(os.environ["RELIC_METRICS_DIR"])
+
+    # Safe to call from the Tk thread
+    def cancel(self):
+        self.cancel_requested.set()
+        if self.loop is not None and self.task is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.task.cancel)
+
+
+# Fetches order book snapshots off the Tk thread, the books themselves are only touched by the Tk thread:
+#   ("orders", url_name, orders), ("done", None), ("error", exception)
+class Order_Fetch_Worker(threading.Thread):
+    def __init__(self, url_names, messages=None, api_base=API_BASE, **dfc_options):
+        super().__init__(daemon=True)
+        self.url_names = list(url_names)
+        self.messages = messages or queue.Queue()
+        self.api_base = api_base
+        self.dfc_options = dfc_options
+
+    def post(self, kind, *payload):
+        self.messages.put((kind,) + payload)
+
+    def run(self):
+        try:
+            asyncio.run(self.fetch())
+            self.post("done", None)
+        except Exception as e:
+            self.post("error", e)
+
+    async def fetch(self):
+        # Orders are never cached, no sqlite file is opened for them unless a cache_path is given
+        dfc = Data_Fetch_Conditions(**{"cache_path": None, **self.dfc_options})
+        dfc.session = aiohttp.ClientSession()
+        try:
+            async def fetch_one(url_name):
+                result = await dfc.fetch_one(f"{self.api_base}/items/{url_name}/orders")
+                self.post("orders", url_name, result["payload"]["orders"])
+
+            await asyncio.gather(*(fetch_one(url_name) for url_name in self.url_names))
+        finally:
+            await dfc.close()
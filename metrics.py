@@ -0,0 +1,159 @@
+import functools
+import json
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+PREFIX = "relic_"
+# Seconds, from a fast cache hit up to a request stuck behind retries
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 500, 1000, 5000)
+ITEM_SEGMENT = re.compile(r"/items/[^/]+")
+
+
+# /v1/items/frost_prime_set/statistics -> /items/{name}/statistics, so labels stay low-cardinality
+def endpoint(url):
+    path = urlsplit(url).path.rstrip("/")
+    path = path[path.find("/items"):] if "/items" in path else path
+    return ITEM_SEGMENT.sub("/items/{name}", path)
+
+
+class Histogram():
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # Upper bound of the bucket holding the q-th observation
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+# Counters, histograms and spans for one loader run. Every update is a dict lookup and an add,
+# cheap next to the requests and writes being measured.
+class Metrics():
+    def __init__(self, max_spans=10_000):
+        self.counters = {}
+        self.histograms = {}
+        self.spans = deque(maxlen=max_spans)
+        self.started_t = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    @contextmanager
+    def timed(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # A named stretch of the run, kept for the trace and folded into stage_seconds
+    @contextmanager
+    def span(self, name, **attrs):
+        start_t = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.observe("stage_seconds", duration, stage=name)
+            self.spans.append({"type": "span", "name": name, "start_t": start_t, "duration": duration,
+                               "error": error, **attrs})
+
+    def snapshot(self):
+        return {
+            "type": "metrics",
+            "t": time.time(),
+            "started_t": self.started_t,
+            "counters": [{"name": name, **dict(labels), "value": value} for (name, labels), value in self.counters.items()],
+            "histograms": [{"name": name, **dict(labels), "count": h.count, "sum": round(h.sum, 6),
+                            "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99)}
+                           for (name, labels), h in self.histograms.items()],
+        }
+
+    def to_prometheus(self):
+        lines = []
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for (key, labels), value in self.counters.items():
+                if key == name:
+                    lines.append(f"{PREFIX}{name}{format_labels(labels)} {value}")
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (key, labels), h in self.histograms.items():
+                if key != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(h.buckets + (float("inf"),), h.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{PREFIX}{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{format_labels(labels)} {h.sum}")
+                lines.append(f"{PREFIX}{name}_count{format_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    # Written whole and renamed, so a node_exporter textfile collector never reads half a file
+    def write_prometheus(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+    # Appends the finished spans and one metrics snapshot, spans are written once
+    def write_json_lines(self, path):
+        with open(path, "a") as f:
+            while self.spans:
+                f.write(json.dumps(self.spans.popleft()) + "\n")
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+# Wraps an async Database_Upload stage in a span on self.metrics
+def traced(stage):
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            with self.metrics.span(stage):
+                return await method(self, *args, **kwargs)
+        return wrapper
+    return decorator
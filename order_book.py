@@ -0,0 +1,199 @@
+import asyncio
+import heapq
+import itertools
+
+ONLINE = ("ingame", "online")
+SIDES = ("buy", "sell")
+
+
+# warframe.market order -> the fields the book keeps, None for orders hidden by their owner
+def parse_order(order):
+    if not order.get("visible", True):
+        return None
+    user = order.get("user", {})
+    return {"id": order["id"], "side": order["order_type"], "price": order["platinum"],
+            "quantity": order.get("quantity", 1), "user": user.get("ingame_name"), "status": user.get("status", "offline")}
+
+
+# Entries of a heap in order without popping it, the first k cost O(k log k)
+def ordered(heap):
+    frontier = [(heap[0], 0)] if heap else []
+    while frontier:
+        entry, i = heapq.heappop(frontier)
+        yield entry
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+
+
+# Buy and sell heaps for one item. Removed or changed orders stay in the heaps and are skipped
+# when they reach the top, so add/remove are O(log n) and best bid/ask is O(1) amortized.
+# Price levels work the same way: a level that empties stays in its heap until depth() meets it.
+class Order_Book():
+    def __init__(self, url_name):
+        self.url_name = url_name
+        self.orders = {}
+        self.seq = itertools.count()
+        # (side, online_only) -> heap of (key, seq, order_id), key is the price for asks and -price for bids
+        self.heaps = {(side, online): [] for side in SIDES for online in (False, True)}
+        # (side, online_only) -> {price: quantity}
+        self.levels = {(side, online): {} for side in SIDES for online in (False, True)}
+        # (side, online_only) -> heap of level keys, same sign as the order heaps
+        self.level_heaps = {(side, online): [] for side in SIDES for online in (False, True)}
+
+    def __len__(self):
+        return len(self.orders)
+
+    def views(self, order):
+        return [(order["side"], False), (order["side"], True)] if order["status"] in ONLINE else [(order["side"], False)]
+
+    def add(self, order):
+        if order["id"] in self.orders:
+            self.remove(order["id"])
+        order = dict(order, seq=next(self.seq))
+        self.orders[order["id"]] = order
+        key = order["price"] if order["side"] == "sell" else -order["price"]
+        for view in self.views(order):
+            heapq.heappush(self.heaps[view], (key, order["seq"], order["id"]))
+            levels = self.levels[view]
+            if order["price"] not in levels:
+                levels[order["price"]] = 0
+                heapq.heappush(self.level_heaps[view], key)
+            levels[order["price"]] += order["quantity"]
+
+    def remove(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        for view in self.views(order):
+            levels = self.levels[view]
+            levels[order["price"]] -= order["quantity"]
+            if levels[order["price"]] <= 0:
+                del levels[order["price"]]
+        self.compact()
+        return order
+
+    def set_status(self, order_id, status):
+        order = self.orders.get(order_id)
+        if order is not None and order["status"] != status:
+            self.add(dict(order, status=status))
+
+    def live(self, entry, online):
+        order = self.orders.get(entry[2])
+        return order is not None and order["seq"] == entry[1] and (not online or order["status"] in ONLINE)
+
+    def best(self, side, online=False):
+        heap = self.heaps[(side, online)]
+        while heap and not self.live(heap[0], online):
+            heapq.heappop(heap)
+        return self.orders[heap[0][2]] if heap else None
+
+    def best_bid(self, online=False):
+        return self.best("buy", online)
+
+    def best_ask(self, online=False):
+        return self.best("sell", online)
+
+    def spread(self, online=False):
+        bid, ask = self.best_bid(online), self.best_ask(online)
+        return ask["price"] - bid["price"] if bid and ask else None
+
+    # Top price levels as (price, quantity), best first
+    def depth(self, side, levels=5, online=False):
+        prices = self.levels[(side, online)]
+        heap = self.level_heaps[(side, online)]
+        sign = 1 if side == "sell" else -1
+        if levels <= 0:
+            return []
+        while heap and sign * heap[0] not in prices:
+            heapq.heappop(heap)
+        best = []
+        # A level emptied and opened again has two keys in the heap
+        for key in ordered(heap):
+            price = sign * key
+            if price in prices and (not best or best[-1][0] != price):
+                best.append((price, prices[price]))
+                if len(best) == levels:
+                    break
+        return best
+
+    # Best orders first, for the sellers/buyers panels
+    def top(self, side, n=10, online=False):
+        live = (entry for entry in ordered(self.heaps[(side, online)]) if self.live(entry, online))
+        return [self.orders[entry[2]] for entry in itertools.islice(live, n)]
+
+    # Heaps are rebuilt once stale entries outnumber live ones
+    def compact(self):
+        for (side, online), heap in self.heaps.items():
+            if len(heap) > 2 * len(self.orders) + 64:
+                heap[:] = [entry for entry in heap if self.live(entry, online)]
+                heapq.heapify(heap)
+        for (side, online), heap in self.level_heaps.items():
+            prices = self.levels[(side, online)]
+            if len(heap) > 2 * len(prices) + 64:
+                heap[:] = [price if side == "sell" else -price for price in prices]
+                heapq.heapify(heap)
+
+
+# One Order_Book per tracked item, fed by /items/{name}/orders snapshots and incremental events
+class Order_Books():
+    def __init__(self):
+        self.books = {}
+        # user -> {(url_name, order_id)}, so a status change reaches every order of that user
+        self.user_orders = {}
+
+    def __getitem__(self, url_name):
+        return self.books[url_name]
+
+    def __contains__(self, url_name):
+        return url_name in self.books
+
+    def book(self, url_name):
+        if url_name not in self.books:
+            self.books[url_name] = Order_Book(url_name)
+        return self.books[url_name]
+
+    # Replaces the item's book with a fresh snapshot (the "orders" list of the API payload)
+    def load(self, url_name, orders):
+        old = self.books.pop(url_name, None)
+        if old is not None:
+            for order in old.orders.values():
+                self.user_orders.get(order["user"], set()).discard((url_name, order["id"]))
+        book = self.book(url_name)
+        for order in orders:
+            self.add(url_name, order)
+        return book
+
+    def add(self, url_name, order):
+        order = parse_order(order) if "order_type" in order else order
+        if order is None:
+            return
+        self.book(url_name).add(order)
+        self.user_orders.setdefault(order["user"], set()).add((url_name, order["id"]))
+
+    def remove(self, url_name, order_id):
+        order = self.book(url_name).remove(order_id)
+        if order is not None:
+            self.user_orders.get(order["user"], set()).discard((url_name, order_id))
+
+    def set_user_status(self, user, status):
+        for url_name, order_id in self.user_orders.get(user, ()):
+            self.books[url_name].set_status(order_id, status)
+
+    # {"type": "add", "item", "order"} / {"type": "remove", "item", "order_id"} / {"type": "status", "user", "status"}
+    def apply(self, event):
+        kind = event["type"]
+        if kind == "add":
+            self.add(event["item"], event["order"])
+        elif kind == "remove":
+            self.remove(event["item"], event["order_id"])
+        elif kind == "status":
+            self.set_user_status(event["user"], event["status"])
+        else:
+            raise ValueError(f"Unknown order event {kind}")
+
+    # fetch_one: Data_Fetch_Conditions.fetch_one, or anything with the same signature
+    async def refresh(self, fetch_one, url_names, api_base="https://api.warframe.market/v1"):
+        results = await asyncio.gather(*(fetch_one(f"{api_base}/items/{url_name}/orders") for url_name in url_names))
+        for url_name, result in zip(url_names, results):
+            self.load(url_name, result["payload"]["orders"])
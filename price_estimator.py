@@ -0,0 +1,88 @@
+import numpy as np
+
+# field suffix -> (payload section, window), next to price_90d/price_48h in t_rd
+WINDOWS = {
+    "90d": ("statistics_closed", "90days"),
+    "48h": ("statistics_live", "48hours"),
+}
+# MAD of a normal sample is 0.6745 sigma
+MAD_SIGMA = 1.4826
+
+
+# Volume-weighted median, rows of (n, m) prices with zero weight where there is no point
+def weighted_median(prices, weights):
+    order = np.argsort(np.where(weights > 0, prices, np.inf), axis=1)
+    prices = np.take_along_axis(prices, order, axis=1)
+    cumulative = np.cumsum(np.take_along_axis(weights, order, axis=1), axis=1)
+    half = cumulative[:, -1:] / 2
+    idx = np.argmax(cumulative >= half, axis=1)
+    median = prices[np.arange(len(prices)), idx]
+    return np.where(cumulative[:, -1] > 0, median, np.nan)
+
+
+# A whole batch of statistics payloads at once. Per item and window: the volume-weighted median is the
+# center, points further than clip robust sigmas (MAD based) are dropped, the rest give a volume-weighted
+# mean. Confidence in [0, 1] falls with few points, thin volume and a wide spread.
+class Price_Estimator():
+    def __init__(self, clip=3.0, min_scale=0.05, points_half=10, volume_half=20):
+        self.clip = clip
+        # Scale floor as a share of the median, so a flat series does not clip every tick
+        self.min_scale = min_scale
+        # Effective points / total volume at which their share of the confidence is 0.5
+        self.points_half = points_half
+        self.volume_half = volume_half
+
+    # Lists of statistics entries -> (n, longest) price and volume matrices, NaN/0 padded
+    def matrices(self, stats_lists):
+        lengths = np.fromiter((len(stats) for stats in stats_lists), dtype=np.int64, count=len(stats_lists))
+        width = max(int(lengths.max(initial=0)), 1)
+        prices = np.full((len(stats_lists), width), np.nan)
+        volumes = np.zeros((len(stats_lists), width))
+        if lengths.sum():
+            rows = np.repeat(np.arange(len(stats_lists)), lengths)
+            cols = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            prices[rows, cols] = np.array([stat.get("avg_price") for stats in stats_lists for stat in stats], dtype=np.float64)
+            volumes[rows, cols] = np.array([stat.get("volume") or 0 for stats in stats_lists for stat in stats], dtype=np.float64)
+        return prices, volumes
+
+    def estimate_window(self, stats_lists):
+        prices, volumes = self.matrices(stats_lists)
+        valid = ~np.isnan(prices)
+        # Items without any volume figures weigh their points equally
+        weights = np.where(valid, volumes, 0)
+        unweighted = weights.sum(axis=1) == 0
+        weights[unweighted] = valid[unweighted]
+
+        median = weighted_median(prices, weights)
+        deviation = np.abs(prices - median[:, None])
+        mad = weighted_median(np.where(valid, deviation, 0), weights)
+        scale = np.maximum(MAD_SIGMA * mad, self.min_scale * np.abs(median))
+        with np.errstate(invalid="ignore"):
+            kept = valid & (deviation <= self.clip * scale[:, None])
+        weights = np.where(kept, weights, 0)
+        filled = np.where(kept, prices, 0)
+
+        total = weights.sum(axis=1)
+        has = total > 0
+        safe_total = np.where(has, total, 1)
+        price = np.where(has, (weights * filled).sum(axis=1) / safe_total, median)
+        spread = np.sqrt((weights * (filled - price[:, None]) ** 2).sum(axis=1) / safe_total)
+        effective = np.where(has, total ** 2 / np.maximum((weights ** 2).sum(axis=1), 1e-12), 0)
+        volume = np.where(kept, volumes, 0).sum(axis=1)
+
+        confidence = effective / (effective + self.points_half)
+        confidence *= np.where(unweighted, 0.5, volume / (volume + self.volume_half))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            confidence /= 1 + np.where(price > 0, spread / price, 0)
+        return {"price": price, "confidence": np.where(has, confidence, 0), "volume": volume,
+                "points": kept.sum(axis=1), "clipped": (valid & ~kept).sum(axis=1)}
+
+    # Statistics payloads -> one dict per payload: est_90d, conf_90d, est_48h, conf_48h
+    def estimate(self, results):
+        fields = [{} for _ in results]
+        for suffix, (section, window) in WINDOWS.items():
+            estimates = self.estimate_window([result["payload"][section][window] for result in results])
+            for doc, price, confidence in zip(fields, estimates["price"], estimates["confidence"]):
+                doc[f"est_{suffix}"] = None if np.isnan(price) else round(float(price), 2)
+                doc[f"conf_{suffix}"] = round(float(confidence), 3)
+        return fields
@@ -0,0 +1,195 @@
+import json
+import os
+from datetime import datetime
+import numpy as np
+from numpy.lib.format import open_memmap
+
+# series -> (payload section, window, points kept per item)
+SERIES = {
+    "daily": ("statistics_closed", "90days", 365),
+    "hourly": ("statistics_live", "48hours", 24 * 14),
+}
+COLUMNS = {"t": np.int64, "price": np.float32, "volume": np.float32}
+EMPTY = {"t": 0, "price": np.nan, "volume": 0}
+
+
+# Per-item price history in memory-mapped .npy files, one (items, points) matrix per series and column.
+# Rows are right-aligned: the newest point of every item is in the last column, so "the last n points"
+# is one slice over the whole catalog and every query below is a handful of NumPy reductions.
+class Price_History():
+    def __init__(self, directory, rows=256):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.names_path = os.path.join(directory, "names.json")
+        self.names = []
+        if os.path.exists(self.names_path):
+            with open(self.names_path) as f:
+                self.names = json.load(f)
+        self.rows = {name: row for row, name in enumerate(self.names)}
+        self.columns = {}
+        for series, (_, _, capacity) in SERIES.items():
+            for column, dtype in COLUMNS.items():
+                path = self.path(series, column)
+                if os.path.exists(path):
+                    self.columns[(series, column)] = open_memmap(path, mode="r+")
+                else:
+                    self.columns[(series, column)] = self.create(path, dtype, (max(rows, len(self.names)), capacity), column)
+        # The same few dozen timestamps repeat across every item's payload
+        self.parsed_t = {}
+
+    def path(self, series, column):
+        return os.path.join(self.directory, f"{series}_{column}.npy")
+
+    def create(self, path, dtype, shape, column):
+        array = open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        array[:] = EMPTY[column]
+        return array
+
+    def __len__(self):
+        return len(self.names)
+
+    def capacity(self, series):
+        return self.columns[(series, "t")].shape[1]
+
+    # Doubles the row count, the files are copied once and swapped in
+    def grow(self):
+        for series, column in list(self.columns):
+            # The old map is dropped before the rename, Windows refuses to replace a mapped file
+            old = self.columns.pop((series, column))
+            path = self.path(series, column)
+            new = self.create(f"{path}.tmp.npy", old.dtype, (old.shape[0] * 2, old.shape[1]), column)
+            new[:old.shape[0]] = old
+            new.flush()
+            del new, old
+            os.replace(f"{path}.tmp.npy", path)
+            self.columns[(series, column)] = open_memmap(path, mode="r+")
+
+    def row(self, url_name):
+        row = self.rows.get(url_name)
+        if row is None:
+            row = self.rows[url_name] = len(self.names)
+            self.names.append(url_name)
+            if row >= self.columns[("daily", "t")].shape[0]:
+                self.grow()
+        return row
+
+    def timestamp(self, text):
+        t = self.parsed_t.get(text)
+        if t is None:
+            t = self.parsed_t[text] = int(datetime.fromisoformat(text).timestamp())
+        return t
+
+    # Statistics entries -> sorted (t, price, volume). Entries sharing a timestamp (the live buy and
+    # sell rows of one hour) become one volume-weighted point.
+    def points(self, stats):
+        merged = {}
+        for stat in stats:
+            price = stat.get("avg_price")
+            if price is None:
+                continue
+            volume = stat.get("volume") or 0
+            t = self.timestamp(stat["datetime"])
+            point = merged.get(t)
+            if point is None:
+                merged[t] = [price * volume, volume, price, 1]
+            else:
+                point[0] += price * volume
+                point[1] += volume
+                point[2] += price
+                point[3] += 1
+        times = sorted(merged)
+        prices = [merged[t][0] / merged[t][1] if merged[t][1] else merged[t][2] / merged[t][3] for t in times]
+        return times, prices, [merged[t][1] for t in times]
+
+    # Adds the points newer than the item's last one, the last point itself is overwritten since
+    # the current hour/day is still filling up. Returns the number of new points.
+    def append(self, series, url_name, stats):
+        times, prices, volumes = self.points(stats)
+        if not times:
+            return 0
+        row = self.row(url_name)
+        t_row = self.columns[(series, "t")][row]
+        price_row = self.columns[(series, "price")][row]
+        volume_row = self.columns[(series, "volume")][row]
+        last = t_row[-1]
+        if last in times:
+            i = times.index(last)
+            price_row[-1] = prices[i]
+            volume_row[-1] = volumes[i]
+        start = next((i for i, t in enumerate(times) if t > last), len(times))
+        new = min(len(times) - start, len(t_row))
+        if not new:
+            return 0
+        for array, values in ((t_row, times), (price_row, prices), (volume_row, volumes)):
+            array[:-new] = array[new:]
+            array[-new:] = values[-new:]
+        return new
+
+    # One /items/{name}/statistics payload into both series
+    def record(self, url_name, result):
+        added = 0
+        for series, (section, window, _) in SERIES.items():
+            added += self.append(series, url_name, result["payload"][section][window])
+        return added
+
+    def flush(self):
+        for array in self.columns.values():
+            array.flush()
+        with open(f"{self.names_path}.tmp", "w") as f:
+            json.dump(self.names, f)
+        os.replace(f"{self.names_path}.tmp", self.names_path)
+
+    # (price, volume) of the last n points of every item, NaN price where an item has fewer
+    def window(self, n, series="daily"):
+        rows = len(self.names)
+        return self.columns[(series, "price")][:rows, -n:], self.columns[(series, "volume")][:rows, -n:]
+
+    def mean(self, n, series="daily"):
+        prices, _ = self.window(n, series)
+        valid = ~np.isnan(prices)
+        return divide(np.where(valid, prices, 0).sum(axis=1, dtype=np.float64), valid.sum(axis=1))
+
+    # Mean over every n-point window, shape (items, points - n + 1)
+    def rolling_mean(self, n, series="daily"):
+        prices, _ = self.window(self.capacity(series), series)
+        valid = ~np.isnan(prices)
+        sums = np.cumsum(np.where(valid, prices, 0), axis=1, dtype=np.float64)
+        counts = np.cumsum(valid, axis=1)
+        sums = np.concatenate([np.zeros((len(prices), 1)), sums], axis=1)
+        counts = np.concatenate([np.zeros((len(prices), 1), dtype=counts.dtype), counts], axis=1)
+        return divide(sums[:, n:] - sums[:, :-n], counts[:, n:] - counts[:, :-n])
+
+    # Volume-weighted average price over the last n points
+    def vwap(self, n, series="daily"):
+        prices, volumes = self.window(n, series)
+        valid = ~np.isnan(prices)
+        weights = np.where(valid, volumes, 0).astype(np.float64)
+        return divide((np.where(valid, prices, 0) * weights).sum(axis=1), weights.sum(axis=1))
+
+    # Standard deviation of the log returns between consecutive points of the last n
+    def volatility(self, n, series="daily"):
+        prices, _ = self.window(n + 1, series)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = np.diff(np.log(prices.astype(np.float64)), axis=1)
+        valid = np.isfinite(returns)
+        count = valid.sum(axis=1)
+        returns = np.where(valid, returns, 0)
+        mean = divide(returns.sum(axis=1), count)
+        variance = divide((np.where(valid, returns - mean[:, None], 0) ** 2).sum(axis=1), count - 1)
+        return np.sqrt(variance)
+
+    # Short mean over long mean, minus one: > 0 when an item trades above its longer-run price
+    def momentum(self, short=7, long=30, series="daily"):
+        return divide(self.mean(short, series), self.mean(long, series)) - 1
+
+    # [(url_name, score)] best first, items without a score are left out
+    def rank(self, scores, top=None):
+        order = np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind="stable")
+        order = order[~np.isnan(scores[order])]
+        return [(self.names[row], float(scores[row])) for row in order[:top]]
+
+
+# Element-wise a / b, NaN where b is 0
+def divide(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    return np.divide(a, b, out=np.full(a.shape, np.nan), where=np.asarray(b) > 0)
@@ -0,0 +1,51 @@
+import math
+import time
+
+PRICE_TTL = 86400
+
+
+class Price_Refresh_Scheduler():
+    def __init__(self, ttl=PRICE_TTL, min_ttl=3 * 3600, budget=None, volatility_weight=4.0):
+        self.ttl = ttl
+        self.min_ttl = min_ttl
+        # Max statistics requests per run, None means unlimited
+        self.budget = budget
+        self.volatility_weight = volatility_weight
+
+    def divergence(self, doc):
+        p90 = doc.get("price_90d") or 0
+        p48 = doc.get("price_48h") or 0
+        return abs(p48 - p90) / max(p90, 1)
+
+    # Volatile items get a shorter ttl, down to min_ttl
+    def ttl_for(self, doc):
+        return max(self.min_ttl, self.ttl / (1 + self.volatility_weight * self.divergence(doc)))
+
+    def priority(self, doc, now):
+        overdue = (now - doc.get("epoch_t", 0)) / self.ttl_for(doc)
+        value = max(doc.get("price_90d") or 0, doc.get("price_48h") or 0)
+        return overdue * (1 + self.volatility_weight * self.divergence(doc)) * (1 + math.log1p(value))
+
+    def stale(self, items, docs, now=None):
+        now = time.time() if now is None else now
+        stale_items = []
+        for name, _id in items:
+            doc = docs.get(_id)
+            # Items missing from t_rd are inserted by the load path, not refreshed here
+            if doc is None:
+                continue
+            if now - doc.get("epoch_t", 0) > self.ttl_for(doc):
+                stale_items.append((self.priority(doc, now), name, _id))
+        stale_items.sort(key=lambda item: item[0], reverse=True)
+        return [(name, _id) for _, name, _id in stale_items]
+
+    # force=True ranks every known item, used when a refresh is requested manually
+    def select(self, items, docs, now=None, force=False):
+        now = time.time() if now is None else now
+        if force:
+            ranked = sorted(((self.priority(docs[_id], now), name, _id) for name, _id in items if _id in docs),
+                            key=lambda item: item[0], reverse=True)
+            selected = [(name, _id) for _, name, _id in ranked]
+        else:
+            selected = self.stale(items, docs, now)
+        return selected if self.budget is None else selected[:self.budget]
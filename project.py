@@ -1,17 +1,23 @@
 import customtkinter as ctk
+import logging
 import requests
 import re
 import pandas as pd
 import time
 import numpy as np
 import matplotlib.pyplot as plt
-from pymongo import MongoClient
+from load_optimized import Initialize_Database
+from relic_ev import Relic_EV_Engine, REFINEMENTS
+from relic_sim import Squad_Simulator, POLICIES, SQUAD_SIZE
+from leaderboard import Relic_Leaderboard
+from search_index import Search_Index
+from loader_worker import Loader_Worker, Order_Fetch_Worker
+from order_book import Order_Books
+from virtual_list import Virtual_List, Paged_Source
+import queue
 
-client = MongoClient("localhost", 27017)
-db = client["static_data"]  
-prime_parts_collection = db["prime_parts_collection"]
-relics_collection = db["relics_collection"]
-relic_rewards = db["relic_rewards"]
+SORT_METRICS = {"Name": "name", "Platinum Profit": "plat", "Ducat Profit": "ducats"}
+logger = logging.getLogger(__name__)
 
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
@@ -31,6 +37,17 @@ class LoadAPI:
         self.csv_status = False
         self.api_status = False
 
+        # Order books for the items looked at so far, the panels render from these
+        self.order_books = Order_Books()
+        self.order_messages = queue.Queue()
+        self.order_worker = None
+        self.selected_item = None
+        # Clicked while a fetch was running, fetched once it finishes
+        self.pending_item = None
+        self.main_pages.btn_orders.configure(command=self.fetch_orders)
+        self.main_pages.check_online.configure(command=lambda: self.load_order(self.selected_item))
+        self.sidebar.frm_relic_list.command = self.select_row
+
         
     def load_relic(self):
         ...
@@ -38,8 +55,66 @@ class LoadAPI:
     def load_pages(self, item_name):
         ...
     
-    def load_order(self, order):
-        ...
+    # A click on a relic or search result in the sidebar shows its orders
+    def select_row(self, row):
+        url_name = row.get("relic_name") or row.get("key")
+        self.main_pages.entry_item.delete(0, "end")
+        self.main_pages.entry_item.insert(0, url_name)
+        self.fetch_orders()
+
+    def fetch_orders(self):
+        url_name = self.main_pages.entry_item.get().strip().lower().replace(" ", "_")
+        if not url_name:
+            return
+        self.selected_item = url_name
+        # Already tracked items render straight from the book
+        if url_name in self.order_books:
+            self.load_order(url_name)
+        if self.order_worker is not None and self.order_worker.is_alive():
+            self.pending_item = url_name
+            return
+        self.start_order_fetch(url_name)
+
+    def start_order_fetch(self, url_name):
+        self.order_worker = Order_Fetch_Worker([url_name], self.order_messages, database=self.app.database)
+        self.order_worker.start()
+        self.app.after(50, self.poll_orders)
+
+    def poll_orders(self):
+        finished = False
+        while True:
+            try:
+                kind, *payload = self.order_messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "orders":
+                url_name, orders = payload
+                self.order_books.load(url_name, orders)
+                if url_name == self.selected_item:
+                    self.load_order(url_name)
+            elif kind == "error":
+                self.main_pages.lbl_market.configure(text=f"Could not load orders: {payload[0]!r}")
+                finished = True
+            else:
+                finished = True
+        if not finished:
+            self.app.after(50, self.poll_orders)
+        elif self.pending_item is not None:
+            url_name, self.pending_item = self.pending_item, None
+            self.start_order_fetch(url_name)
+
+    def load_order(self, url_name):
+        if url_name is None or url_name not in self.order_books:
+            return
+        book = self.order_books[url_name]
+        online = bool(self.main_pages.check_online.get())
+        bid, ask = book.best_bid(online), book.best_ask(online)
+        lines = [url_name.replace("_", " ").title(),
+                 f"Best bid: {bid['price'] if bid else '-'}p   Best ask: {ask['price'] if ask else '-'}p"]
+        for side, label in (("sell", "Sell depth"), ("buy", "Buy depth")):
+            lines.append(f"{label}: " + ", ".join(f"{price}p x{quantity}" for price, quantity in book.depth(side, 5, online)))
+        self.main_pages.lbl_market.configure(text="\n".join(lines))
+        self.events.show_sellers(book.top("sell", len(self.events.lbl_sellers), online))
     
     def load_events(self, info):
         ...
@@ -58,6 +133,11 @@ class App(ctk.CTk):
         self.grid_rowconfigure((0, 1), weight=1)
         self.grid_rowconfigure((2, 3), weight=0)
 
+        # Mongo by default, RELIC_STORAGE=memory runs from the optimized_db dumps
+        self.database = Initialize_Database()
+        # The relic list pages through t_lb by (board, rank)
+        self.database.ensure_indexes()
+
 class SideBar(App):
     def __init__(self, master):
         self.frm_sidebar = ctk.CTkFrame(master, width=200, corner_radius=5)
@@ -65,25 +145,45 @@ class SideBar(App):
 
         #Frame - Sidebar - Relic types
         self.option_relic_types = ctk.CTkComboBox(self.frm_sidebar, corner_radius=5,
-                                                            values=["All", "Lith", "Meso", "Neo", "Axi"])
+                                                            values=["All", "Lith", "Meso", "Neo", "Axi"], command=self.render_relics)
         self.option_relic_types.grid(row=0, column=0, sticky="nsew")
         self.option_relic_types.set("All")
         
         #Frame - Sidebar - Relic choice
         relic_choice_var = ctk.StringVar(value="Name")
         self.option_relic_choice = ctk.CTkComboBox(self.frm_sidebar, corner_radius=5,
-                                                            values=["Name", "Platinum Profit", "Ducat Profit"], variable=relic_choice_var)
+                                                            values=["Name", "Platinum Profit", "Ducat Profit"], variable=relic_choice_var,
+                                                            command=self.render_relics)
         self.option_relic_choice.grid(row=0, column=1, sticky="nsew")
         self.option_relic_choice.set("Name")
         
         #Frame - Sidebar - Load relic test
-        self.frm_relic_list = ctk.CTkScrollableFrame(self.frm_sidebar, corner_radius=5)
+        self.frm_sidebar.grid_rowconfigure(1, weight=1)
+        self.frm_relic_list = Virtual_List(self.frm_sidebar, corner_radius=5)
         self.frm_relic_list.grid(row=1, column=0, columnspan=2, sticky="nsew")
-        LoadAPI.load_relic(self.frm_relic_list)
+        self.leaderboard = Relic_Leaderboard(master.database)
+        # A t_lb left behind by an interrupted load is rebuilt before the first render
+        if self.leaderboard.stale():
+            self.leaderboard.refresh()
+        self.refinement = "intact"
+        self.page_size = 100
+        self.render_relics()
+
+    # Filter/sort changes swap the list's source, rows are read from the leaderboard a page at a time as they scroll in
+    def render_relics(self, *_):
+        era, metric = self.option_relic_types.get(), SORT_METRICS[self.option_relic_choice.get()]
+        source = Paged_Source(lambda page, page_size: self.leaderboard.page(era, metric, self.refinement, page, page_size),
+                              self.leaderboard.size(era, metric, self.refinement), self.page_size)
+        self.frm_relic_list.set_data(source, format_row=lambda row: row["relic_name"] if row["value"] is None
+                                     else f"{row['relic_name']}  {row['value']:.2f}")
+
+    def show_search(self, results):
+        self.frm_relic_list.set_data(results, format_row=lambda result: f"{result['label']}  ({result['kind']})")
 
 
 class MainPages(App):
     def __init__(self, master):
+        self.database = master.database
         self.pageview = ctk.CTkTabview(master, width=500)
         self.pageview.grid(row=0, column=1, sticky="nsew", padx=(20, 10))
         self.pageview.add("Relic")
@@ -92,6 +192,75 @@ class MainPages(App):
         self.pageview.add("Settings")
         self.pageview._segmented_button.grid(sticky="ew")
 
+        #Page - Simulations
+        self.simulator = None
+        self.sim_future = None
+        tab_sim = self.pageview.tab("Simulations")
+        tab_sim.grid_columnconfigure((0, 1), weight=1)
+        self.entry_squad = ctk.CTkEntry(tab_sim, placeholder_text="Squad relics, e.g. axi_h3_relic, neo_s5_relic")
+        self.entry_squad.grid(row=0, column=0, columnspan=2, padx=10, pady=(10, 5), sticky="ew")
+        self.option_refinement = ctk.CTkComboBox(tab_sim, corner_radius=5, values=[r.capitalize() for r in REFINEMENTS])
+        self.option_refinement.grid(row=1, column=0, padx=10, pady=5, sticky="ew")
+        self.option_refinement.set("Radiant")
+        self.option_policy = ctk.CTkComboBox(tab_sim, corner_radius=5, values=[p.capitalize() for p in POLICIES])
+        self.option_policy.grid(row=1, column=1, padx=10, pady=5, sticky="ew")
+        self.option_policy.set("Plat")
+        self.btn_simulate = ctk.CTkButton(tab_sim, text="Simulate", command=self.start_simulation)
+        self.btn_simulate.grid(row=2, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        self.lbl_simulation = ctk.CTkLabel(tab_sim, text="", justify="left")
+        self.lbl_simulation.grid(row=3, column=0, columnspan=2, padx=10, pady=5, sticky="w")
+
+        #Page - Market
+        tab_market = self.pageview.tab("Market")
+        tab_market.grid_columnconfigure(0, weight=1)
+        self.entry_item = ctk.CTkEntry(tab_market, placeholder_text="Item, e.g. axi_h3_relic")
+        self.entry_item.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="ew")
+        self.btn_orders = ctk.CTkButton(tab_market, text="Load orders")
+        self.btn_orders.grid(row=0, column=1, padx=10, pady=(10, 5))
+        self.check_online = ctk.CTkCheckBox(tab_market, text="Online only")
+        self.check_online.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky="w")
+        self.check_online.select()
+        self.lbl_market = ctk.CTkLabel(tab_market, text="", justify="left")
+        self.lbl_market.grid(row=2, column=0, columnspan=2, padx=10, pady=5, sticky="w")
+
+    def start_simulation(self):
+        squad = [name.strip() for name in self.entry_squad.get().split(",") if name.strip()]
+        if not squad:
+            return
+        # A single relic means a radshare
+        if len(squad) == 1:
+            squad = squad * SQUAD_SIZE
+        if self.simulator is None:
+            self.simulator = Squad_Simulator(Relic_EV_Engine.from_database(self.database))
+        try:
+            self.simulator.tables(squad, "intact")
+        except (KeyError, ValueError) as e:
+            self.lbl_simulation.configure(text=f"Invalid squad: {e}")
+            return
+
+        self.sim_future = self.simulator.submit(squad, self.option_refinement.get().lower(),
+                                                self.option_policy.get().lower(), trials=2_000_000)
+        self.btn_simulate.configure(state="disabled")
+        self.lbl_simulation.configure(text="Simulating...")
+        self.pageview.after(50, self.poll_simulation)
+
+    # The simulation runs off the Tk main loop, poll until it is done
+    def poll_simulation(self):
+        if not self.sim_future.done():
+            self.pageview.after(50, self.poll_simulation)
+            return
+        self.btn_simulate.configure(state="normal")
+        try:
+            result = self.sim_future.result()
+        except Exception as e:
+            self.lbl_simulation.configure(text=f"Simulation failed: {e!r}")
+            return
+        plat, ducats = result["plat"], result["ducats"]
+        self.lbl_simulation.configure(text=(
+            f"{result['trials']:,} runs\n"
+            f"Plat per player: {plat['mean']:.2f} (95% CI {plat['ci'][0]:.2f} - {plat['ci'][1]:.2f})\n"
+            f"Ducats per player: {ducats['mean']:.2f} (95% CI {ducats['ci'][0]:.2f} - {ducats['ci'][1]:.2f})"))
+
 
 class Events(App):
     def __init__(self, master):
@@ -111,11 +280,29 @@ class Events(App):
         #Frame - Events - Sellers
         self.frm_relic_seller = ctk.CTkScrollableFrame(self.frm_events, corner_radius=5)
         self.frm_relic_seller.grid(row=2, column=0, padx=(10, 10), pady=(10, 10), sticky="nsew")
+        self.lbl_sellers = [ctk.CTkLabel(self.frm_relic_seller, text="", anchor="w") for _ in range(10)]
+        for i, label in enumerate(self.lbl_sellers):
+            label.grid(row=i, column=0, sticky="ew")
+
+    def show_sellers(self, orders):
+        for i, label in enumerate(self.lbl_sellers):
+            label.configure(text=f"{orders[i]['price']}p x{orders[i]['quantity']}  {orders[i]['user']}" if i < len(orders) else "")
 
 class SearchBar(App):
-    def __init__(self, master):
+    def __init__(self, master, sidebar):
+        self.sidebar = sidebar
+        self.search_index = Search_Index.from_database(master.database)
         self.frm_search_bar = ctk.CTkEntry(master, placeholder_text="Relic Name or Prime Part", corner_radius=5)
         self.frm_search_bar.grid(row=2, column=1, padx=(20, 10), pady=(10, 0), sticky="nsew")
+        self.frm_search_bar.bind("<KeyRelease>", self.on_key)
+
+    # Searched on every keystroke, an empty box restores the leaderboard
+    def on_key(self, _event=None):
+        text = self.frm_search_bar.get()
+        if not text.strip():
+            self.sidebar.render_relics()
+            return
+        self.sidebar.show_search(self.search_index.search(text, limit=30))
 
 class DeleteCell(App):
     def __init__(self, master):
@@ -126,23 +313,79 @@ class ProgressBar(App):
     def __init__(self, master):
         self.bar_reload_bar = ctk.CTkProgressBar(master, height=26, corner_radius=5)
         self.bar_reload_bar.grid(row=3, column=1, padx=(20, 10), sticky="ew")
+        self.bar_reload_bar.set(0)
+        # Outcome of the last reload, empty while none has failed
+        self.lbl_reload_status = ctk.CTkLabel(master, text="", anchor="w")
+        self.lbl_reload_status.grid(row=4, column=1, padx=(20, 10), sticky="ew")
 
 class ReloadAPI(App):
-    def __init__(self, master):
-        self.btn_reload_api = ctk.CTkButton(master, text="Reload App", fg_color="transparent", border_width=2, text_color=("gray10", "#DCE4EE"))
+    def __init__(self, master, progress_bar, sidebar, search_bar):
+        self.master = master
+        self.progress_bar = progress_bar
+        self.sidebar = sidebar
+        self.search_bar = search_bar
+        self.worker = None
+        self.messages = queue.Queue()
+
+        self.btn_reload_api = ctk.CTkButton(master, text="Reload App", fg_color="transparent", border_width=2, text_color=("gray10", "#DCE4EE"),
+                                            command=self.toggle_reload)
         self.btn_reload_api.grid(row=3, column=2, padx=(10, 15), pady=(10, 10), sticky="nsew")
 
+    # Starts the loader in the background, or cancels the running one
+    def toggle_reload(self):
+        if self.worker is not None and self.worker.is_alive():
+            self.worker.cancel()
+            self.btn_reload_api.configure(text="Cancelling...", state="disabled")
+            return
+        self.worker = Loader_Worker(self.messages, database=self.master.database)
+        self.worker.start()
+        self.btn_reload_api.configure(text="Cancel")
+        self.progress_bar.bar_reload_bar.set(0)
+        self.progress_bar.lbl_reload_status.configure(text="")
+        self.master.after(16, self.poll)
+
+    # Drains the worker's messages once per frame, the Tk thread never waits on the loader
+    def poll(self):
+        finished = False
+        while True:
+            try:
+                kind, *payload = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                self.progress_bar.bar_reload_bar.set(payload[0])
+            elif kind == "index_set":
+                self.search_bar.search_index.add_set(payload[0])
+            elif kind == "index_relic":
+                self.search_bar.search_index.add_relic(payload[0])
+            elif kind == "stage_done" and payload[0] in ("Relics", "Leaderboards"):
+                self.sidebar.render_relics()
+            elif kind in ("done", "cancelled", "error"):
+                if kind == "error":
+                    error = payload[0]
+                    logger.warning("Reload failed", exc_info=(type(error), error, error.__traceback__))
+                    self.progress_bar.lbl_reload_status.configure(text=f"Reload failed: {error!r}")
+                if kind == "done":
+                    self.progress_bar.bar_reload_bar.set(1)
+                finished = True
+
+        if finished:
+            self.btn_reload_api.configure(text="Reload App", state="normal")
+        else:
+            self.master.after(16, self.poll)
+
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     app = App()
     sidebar = SideBar(app)
     main_pages = MainPages(app)
     events = Events(app)
-    search_bar = SearchBar(app)
+    search_bar = SearchBar(app, sidebar)
     delete_cell = DeleteCell(app)
     progress_bar = ProgressBar(app)
-    reload = ReloadAPI(app)
+    reload = ReloadAPI(app, progress_bar, sidebar, search_bar)
     a_api = LoadAPI(app, sidebar, main_pages, events, reload)
 
     app.mainloop()
\ No newline at end of file
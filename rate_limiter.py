@@ -0,0 +1,120 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+# warframe.market publishes a limit of 3 requests per second
+DEFAULT_RATE = 3.0
+DEFAULT_BURST = 3
+
+
+def parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# The AIMD floor and step are fractions of the configured rate, so a 3 req/s host and a 1000 req/s
+# local mock both recover in the same number of successful requests
+class Token_Bucket():
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, min_fraction=0.1, increase_fraction=0.01, decrease=0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = rate * min_fraction
+        self.increase = rate * increase_fraction
+        self.decrease = decrease
+
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+        # Throughput stats
+        self.requests = 0
+        self.throttled = 0
+        self.first_t = None
+        self.last_t = None
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # The lock keeps waiters in FIFO order, the sleep happens outside any concurrency slot
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+        now = time.monotonic()
+        if self.first_t is None:
+            self.first_t = now
+        self.last_t = now
+        self.requests += 1
+
+    # AIMD: additive increase on success, multiplicative decrease on 429/5xx
+    def success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def backoff(self, retry_after=None):
+        now = time.monotonic()
+        self._refill(now)
+        self.throttled += 1
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = 0.0
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def report(self):
+        elapsed = (self.last_t - self.first_t) if self.requests > 1 else 0.0
+        return {
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "elapsed_s": round(elapsed, 3),
+            "req_per_s": round((self.requests - 1) / elapsed, 2) if elapsed > 0 else 0.0,
+            "current_rate": round(self.rate, 2),
+            "max_rate": self.max_rate
+        }
+
+
+class Rate_Limiter():
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, host_limits=None):
+        self.rate = rate
+        self.burst = burst
+        # host -> (rate, burst)
+        self.host_limits = dict(host_limits or {})
+        self.buckets = {}
+
+    def bucket(self, url):
+        host = urlsplit(url).hostname or ""
+        if host not in self.buckets:
+            rate, burst = self.host_limits.get(host, (self.rate, self.burst))
+            self.buckets[host] = Token_Bucket(rate, burst)
+        return self.buckets[host]
+
+    async def acquire(self, url):
+        await self.bucket(url).acquire()
+
+    def success(self, url):
+        self.bucket(url).success()
+
+    def backoff(self, url, retry_after=None):
+        self.bucket(url).backoff(parse_retry_after(retry_after))
+
+    def report(self):
+        return {host: bucket.report() for host, bucket in self.buckets.items()}
@@ -0,0 +1,139 @@
+import numpy as np
+
+REFINEMENTS = ("intact", "exceptional", "flawless", "radiant")
+RARITIES = ("common", "uncommon", "rare")
+ERAS = ("Lith", "Meso", "Neo", "Axi")
+SLOTS = 6
+
+# Total chance of each rarity tier per refinement, split evenly over the rewards of that tier
+RARITY_CHANCE = np.array([
+    [0.76, 0.22, 0.02],
+    [0.70, 0.26, 0.04],
+    [0.60, 0.34, 0.06],
+    [0.50, 0.40, 0.10],
+])
+
+METRICS = ("name", "plat", "ducats")
+
+
+def relic_era(relic_name):
+    return relic_name.split("_", 1)[0].capitalize()
+
+
+class Relic_EV_Engine():
+    def __init__(self, relics, price_field="price_48h", forma_price=0.0):
+        self.price_field = price_field
+        self.forma_price = forma_price
+
+        relics = list(relics)
+        n = len(relics)
+        self.names = [relic["relic_name"] for relic in relics]
+        self.row_of = {name: row for row, name in enumerate(self.names)}
+        self.relic_ids = [relic["relic_id"] for relic in relics]
+        self.eras = np.array([relic_era(name) for name in self.names])
+
+        # Reward matrices, one row per relic and one column per reward slot
+        self.plat = np.zeros((n, SLOTS))
+        self.ducats = np.zeros((n, SLOTS))
+        self.rarity = np.full((n, SLOTS), -1, dtype=np.int8)
+        self.relic_price = np.zeros(n)
+        # part_id -> (rows, cols) of every slot holding that part
+        self.part_slots = {}
+
+        slots = {}
+        for row, relic in enumerate(relics):
+            detail = relic["relic_detail"]
+            self.relic_price[row] = detail.get(self.relic_price_field()) or 0
+            for col, reward in enumerate(detail.get("part_rewards", [])[:SLOTS]):
+                self.rarity[row, col] = RARITIES.index(reward["rarity"])
+                if reward["part_url"] == "forma_blueprint":
+                    self.plat[row, col] = forma_price
+                    continue
+                self.plat[row, col] = reward.get(price_field) or 0
+                self.ducats[row, col] = reward.get("ducats") or 0
+                slots.setdefault(reward["part_id"], []).append((row, col))
+        self.part_slots = {part_id: (np.array([r for r, _ in pos]), np.array([c for _, c in pos]))
+                           for part_id, pos in slots.items()}
+
+        self.probs = self.drop_chances(self.rarity)
+        self.name_order = np.argsort(np.array(self.names))
+        self.compute()
+
+    @classmethod
+    def from_database(cls, database, **kwargs):
+        return cls(database.relics_collection.find({}, {"relic_name": 1, "relic_id": 1, "relic_detail": 1}), **kwargs)
+
+    def relic_price_field(self):
+        return "relic_p48h" if self.price_field == "price_48h" else "relic_p90d"
+
+    # (refinement, relic, slot) drop chance, padded slots get 0
+    @staticmethod
+    def drop_chances(rarity):
+        valid = rarity >= 0
+        codes = np.where(valid, rarity, 0)
+        counts = np.stack([(rarity == tier).sum(axis=1) for tier in range(len(RARITIES))], axis=1)
+        per_slot_count = np.take_along_axis(counts, codes.astype(np.intp), axis=1)
+        per_slot_count = np.where(valid, per_slot_count, 1)
+        return np.where(valid, RARITY_CHANCE[:, codes] / per_slot_count, 0.0)
+
+    # Expected plat and ducats for every refinement in one pass, rows limits it to changed relics
+    def compute(self, rows=None):
+        if rows is None:
+            self.ev_plat = np.einsum("frs,rs->fr", self.probs, self.plat)
+            self.ev_ducats = np.einsum("frs,rs->fr", self.probs, self.ducats)
+        else:
+            self.ev_plat[:, rows] = np.einsum("frs,rs->fr", self.probs[:, rows], self.plat[rows])
+            self.ev_ducats[:, rows] = np.einsum("frs,rs->fr", self.probs[:, rows], self.ducats[rows])
+
+    # prices: {part_id: price} in the engine's price_field, returns how many relics changed
+    def update_prices(self, prices):
+        touched = []
+        for part_id, price in prices.items():
+            if part_id in self.part_slots:
+                rows, cols = self.part_slots[part_id]
+                self.plat[rows, cols] = price or 0
+                touched.append(rows)
+        if not touched:
+            return 0
+        rows = np.unique(np.concatenate(touched))
+        self.compute(rows)
+        return len(rows)
+
+    # relic_prices: {relic_name: price}
+    def update_relic_prices(self, relic_prices):
+        for name, price in relic_prices.items():
+            if name in self.row_of:
+                self.relic_price[self.row_of[name]] = price or 0
+
+    def values(self, metric, refinement="intact"):
+        f = REFINEMENTS.index(refinement)
+        if metric == "plat":
+            return self.ev_plat[f] - self.relic_price
+        if metric == "ducats":
+            return self.ev_ducats[f]
+        raise ValueError(f"Unknown metric {metric}")
+
+    # Row indices sorted by metric, optionally limited to one era
+    def ranking(self, metric="name", refinement="intact", era=None, descending=True):
+        if metric == "name":
+            order = self.name_order
+        else:
+            values = self.values(metric, refinement)
+            order = np.argsort(-values if descending else values, kind="stable")
+        if era and era != "All":
+            order = order[self.eras[order] == era]
+        return order
+
+    def sorted_relics(self, metric="name", refinement="intact", era=None, descending=True):
+        order = self.ranking(metric, refinement, era, descending)
+        if metric == "name":
+            return [(self.names[row], None) for row in order]
+        values = self.values(metric, refinement)
+        return [(self.names[row], float(values[row])) for row in order]
+
+    def relic_ev(self, relic_name):
+        row = self.row_of[relic_name]
+        return {refinement: {"plat": float(self.ev_plat[f, row]),
+                             "plat_profit": float(self.ev_plat[f, row] - self.relic_price[row]),
+                             "ducats": float(self.ev_ducats[f, row])}
+                for f, refinement in enumerate(REFINEMENTS)}
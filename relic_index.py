@@ -0,0 +1,69 @@
+import logging
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+def reward_entry(part, rarity):
+    return {
+        "part_url": part["item_url"],
+        "part_id": part["item_id"],
+        "ducats": part["ducats"],
+        "rarity": rarity,
+        "price_90d": part["price"]["price_90"],
+        "price_48h": part["price"]["price_48"]
+    }
+
+
+# A full relic drops 3 common, 2 uncommon and 1 rare, the missing slot is a forma blueprint
+def add_forma(reward_list):
+    if len(reward_list) == 5:
+        rarity_counts = {'common': 0, 'uncommon': 0}
+        for reward in reward_list:
+            if reward["rarity"] in rarity_counts:
+                rarity_counts[reward["rarity"]] += 1
+
+        if rarity_counts['common'] < 3:
+            reward_list.append({"part_url": "forma_blueprint",
+                                "rarity": "common"})
+        elif rarity_counts['uncommon'] < 2:
+            reward_list.append({"part_url": "forma_blueprint",
+                                "rarity": "uncommon"})
+    return reward_list
+
+
+# One pass over t_ps: relic_url -> [(part, rarity)], matched exactly on the relic url
+def build_relic_index(prime_sets):
+    index = defaultdict(list)
+    for prime_set in prime_sets:
+        for part in prime_set["parts_in_set"]:
+            for relic_url, rarity in part.get("ppn_source_and_rarity", []):
+                index[relic_url].append((part, rarity))
+    return index
+
+
+class Relic_Index():
+    def __init__(self, database):
+        self.database = database
+        self.index = {}
+        self.rebuild_time = 0.0
+
+    def rebuild(self):
+        start = time.perf_counter()
+        self.index = build_relic_index(self.database.prime_sets_collection.find())
+
+        # Persist as one document per relic, t_ri.relic_url is a unique index
+        collection = self.database.relic_index_collection
+        collection.delete_many({})
+        docs = [{"relic_url": relic_url, "rewards": [reward_entry(part, rarity) for part, rarity in rewards]}
+                for relic_url, rewards in self.index.items()]
+        if docs:
+            collection.insert_many(docs)
+
+        self.rebuild_time = time.perf_counter() - start
+        logger.info("Relic index rebuilt: %d relics in %.3fs", len(self.index), self.rebuild_time)
+        return self.index
+
+    def rewards(self, relic_url):
+        return add_forma([reward_entry(part, rarity) for part, rarity in self.index.get(relic_url, [])])
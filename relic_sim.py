@@ -0,0 +1,112 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from relic_ev import REFINEMENTS
+
+POLICIES = ("plat", "ducats")
+SQUAD_SIZE = 4
+
+
+# One batch of squad runs: every player cracks their relic, everyone takes the best reward by policy
+def simulate_chunk(cdfs, plat, ducats, policy, trials, seed):
+    rng = np.random.default_rng(seed)
+    draws = rng.random((trials, len(cdfs)))
+    slots = np.empty((trials, len(cdfs)), dtype=np.intp)
+    for player, cdf in enumerate(cdfs):
+        slots[:, player] = np.minimum(np.searchsorted(cdf, draws[:, player], side="right"), len(cdf) - 1)
+
+    players = np.arange(len(cdfs))
+    run_plat = plat[players, slots]
+    run_ducats = ducats[players, slots]
+    # Ties on the policy value are broken by the other currency
+    if policy == "plat":
+        best = np.argmax(run_plat + run_ducats * 1e-6, axis=1)
+    else:
+        best = np.argmax(run_ducats + run_plat * 1e-6, axis=1)
+    rows = np.arange(trials)
+    picked_plat = run_plat[rows, best]
+    picked_ducats = run_ducats[rows, best]
+    return (trials,
+            float(picked_plat.sum()), float(np.square(picked_plat).sum()),
+            float(picked_ducats.sum()), float(np.square(picked_ducats).sum()))
+
+
+def summarize(n, total, total_sq, z):
+    mean = total / n
+    var = max(0.0, total_sq / n - mean * mean) * n / max(1, n - 1)
+    half = z * math.sqrt(var / n)
+    return {"mean": mean, "std": math.sqrt(var), "ci": (mean - half, mean + half)}
+
+
+class Squad_Simulator():
+    def __init__(self, engine, workers=None, parallel_threshold=2_000_000, chunk_size=500_000):
+        self.engine = engine
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_threshold = parallel_threshold
+        self.chunk_size = chunk_size
+        self.background = ThreadPoolExecutor(max_workers=1)
+        self.pool = None
+
+    # Spawned, not forked: runs come from the submit() thread of a process that also runs Tk, a forked
+    # child would copy its locks mid-use. Started once and reused, each spawned worker imports numpy anew.
+    def process_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.background.shutdown()
+
+    # squad: relic names, one per player; refinement: one name or one per player
+    def tables(self, squad, refinement):
+        if not 1 <= len(squad) <= SQUAD_SIZE:
+            raise ValueError(f"A squad has 1 to {SQUAD_SIZE} players, got {len(squad)}")
+        refinements = [refinement] * len(squad) if isinstance(refinement, str) else list(refinement)
+        if len(refinements) != len(squad):
+            raise ValueError("One refinement per player is required")
+
+        rows = np.array([self.engine.row_of[name] for name in squad])
+        refine_idx = np.array([REFINEMENTS.index(r) for r in refinements])
+        probs = self.engine.probs[refine_idx, rows]
+        cdfs = np.cumsum(probs, axis=1)
+        cdfs /= cdfs[:, -1:]
+        return cdfs, self.engine.plat[rows], self.engine.ducats[rows]
+
+    def run(self, squad, refinement="radiant", policy="plat", trials=1_000_000, seed=None, confidence=0.95):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy}")
+        cdfs, plat, ducats = self.tables(squad, refinement)
+
+        chunks = [self.chunk_size] * (trials // self.chunk_size)
+        if trials % self.chunk_size:
+            chunks.append(trials % self.chunk_size)
+        seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+
+        if trials >= self.parallel_threshold and self.workers > 1:
+            parts = list(self.process_pool().map(simulate_chunk, [cdfs] * len(chunks), [plat] * len(chunks),
+                                                 [ducats] * len(chunks), [policy] * len(chunks), chunks, seeds))
+        else:
+            parts = [simulate_chunk(cdfs, plat, ducats, policy, n, s) for n, s in zip(chunks, seeds)]
+
+        n, plat_sum, plat_sq, ducat_sum, ducat_sq = (sum(values) for values in zip(*parts))
+        z = {0.9: 1.6449, 0.95: 1.96, 0.99: 2.5758}.get(confidence, 1.96)
+        return {
+            "squad": list(squad),
+            "refinement": refinement,
+            "policy": policy,
+            "trials": n,
+            "plat": summarize(n, plat_sum, plat_sq, z),
+            "ducats": summarize(n, ducat_sum, ducat_sq, z),
+        }
+
+    def radshare(self, relic_name, policy="plat", trials=1_000_000, seed=None):
+        return self.run([relic_name] * SQUAD_SIZE, "radiant", policy, trials, seed)
+
+    # Runs off the caller's thread (the Tk main loop), poll the returned future with after()
+    def submit(self, *args, **kwargs):
+        return self.background.submit(self.run, *args, **kwargs)
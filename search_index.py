@@ -0,0 +1,136 @@
+import re
+from bisect import bisect_left, insort
+
+KINDS = ("relic", "set", "part")
+TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+# Per query token: exact token, token prefix, then typo-tolerant match
+EXACT, PREFIX, FUZZY = 3.0, 2.0, 1.0
+KIND_BONUS = {"relic": 0.3, "set": 0.2, "part": 0.1}
+
+
+def tokenize(text):
+    return [token for token in TOKEN_SPLIT.split(text.lower()) if token]
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Optimal string alignment distance (adjacent swaps count as one typo), None past limit
+def within_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return None
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return None
+        before, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+class Search_Index():
+    def __init__(self, max_typos=1):
+        self.max_typos = max_typos
+        self.entries = []
+        self.keys = {}
+        # token -> entry ids, sorted token list for prefix ranges, trigram -> tokens for typos
+        self.postings = {}
+        self.tokens = []
+        self.grams = {}
+
+    @classmethod
+    def from_database(cls, database, **kwargs):
+        index = cls(**kwargs)
+        for relic in database.relics_collection.find({}, {"relic_name": 1}):
+            index.add_relic(relic)
+        for prime_set in database.prime_sets_collection.find({}, {"set_url": 1, "parts_in_set.item_url": 1, "parts_in_set.item_name": 1}):
+            index.add_set(prime_set)
+        return index
+
+    def add_relic(self, relic):
+        self.add(relic["relic_name"], "relic")
+
+    def add_set(self, prime_set):
+        self.add(prime_set["set_url"], "set")
+        for part in prime_set.get("parts_in_set", []):
+            self.add(part["item_url"], "part", part.get("item_name"))
+
+    # Adding is incremental, an existing key is left as is
+    def add(self, key, kind, label=None):
+        if key in self.keys:
+            return self.keys[key]
+        entry_id = len(self.entries)
+        label = label or key.replace("_", " ").title()
+        tokens = list(dict.fromkeys(tokenize(key) + tokenize(label)))
+        self.entries.append((key, kind, label, len(tokens)))
+        self.keys[key] = entry_id
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                insort(self.tokens, token)
+                for gram in trigrams(token):
+                    self.grams.setdefault(gram, set()).add(token)
+            self.postings[token].add(entry_id)
+        return entry_id
+
+    def token_matches(self, query_token):
+        scores = {}
+        if query_token in self.postings:
+            for entry_id in self.postings[query_token]:
+                scores[entry_id] = EXACT
+
+        i = bisect_left(self.tokens, query_token)
+        while i < len(self.tokens) and self.tokens[i].startswith(query_token):
+            for entry_id in self.postings[self.tokens[i]]:
+                scores.setdefault(entry_id, PREFIX)
+            i += 1
+
+        # Typos only when nothing matched as typed, candidates share a trigram with the query
+        if not scores and len(query_token) >= 3 and self.max_typos:
+            candidates = set()
+            for gram in trigrams(query_token):
+                candidates |= self.grams.get(gram, set())
+            n = len(query_token)
+            for token in candidates:
+                # Compare against the token's prefixes too, so a typo in a partial word still matches
+                distances = [within_distance(query_token, token[:length], self.max_typos)
+                             for length in range(n - self.max_typos, n + self.max_typos + 1) if length <= len(token)]
+                distances = [d for d in distances if d is not None]
+                if distances:
+                    distance = min(distances)
+                    for entry_id in self.postings[token]:
+                        scores[entry_id] = max(scores.get(entry_id, 0), FUZZY - 0.25 * distance)
+        return scores
+
+    # Every query token has to match, ranked by match quality, kind and entry length
+    def search(self, text, limit=10, kinds=None):
+        query_tokens = tokenize(text)
+        if not query_tokens:
+            return []
+        totals = None
+        for query_token in sorted(set(query_tokens), key=len, reverse=True):
+            scores = self.token_matches(query_token)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {entry_id: totals[entry_id] + score for entry_id, score in scores.items() if entry_id in totals}
+            if not totals:
+                return []
+
+        ranked = []
+        for entry_id, score in totals.items():
+            key, kind, label, n_tokens = self.entries[entry_id]
+            if kinds and kind not in kinds:
+                continue
+            ranked.append((score + KIND_BONUS[kind] - 0.01 * n_tokens, key, kind, label))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [{"key": key, "kind": kind, "label": label, "score": round(score, 3)}
+                for score, key, kind, label in ranked[:limit]]
@@ -0,0 +1,1068 @@
+import functools
+import json
+import os
+import re
+import threading
+from bson import ObjectId, json_util
+import pymongo
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DUMPED_COLLECTIONS = ("t_rd", "t_ps", "t_rc")
+
+_MISSING = object()
+
+
+# Write ops for bulk_write. They are pymongo's own, so a Mongo collection takes them as they are, and
+# keep their arguments as attributes Memory_Collection can read without pymongo's private fields.
+class InsertOne(pymongo.InsertOne):
+    def __init__(self, document):
+        super().__init__(document)
+        self.document = document
+
+
+class ReplaceOne(pymongo.ReplaceOne):
+    def __init__(self, filter, replacement, upsert=False, **kwargs):
+        super().__init__(filter, replacement, upsert=upsert, **kwargs)
+        self.filter = filter
+        self.replacement = replacement
+        self.upsert = upsert
+
+
+class UpdateOne(pymongo.UpdateOne):
+    def __init__(self, filter, update, upsert=False, array_filters=None, **kwargs):
+        super().__init__(filter, update, upsert=upsert, array_filters=array_filters, **kwargs)
+        self.filter = filter
+        self.update = update
+        self.upsert = upsert
+        self.array_filters = array_filters
+
+
+class UpdateMany(pymongo.UpdateMany):
+    def __init__(self, filter, update, upsert=False, array_filters=None, **kwargs):
+        super().__init__(filter, update, upsert=upsert, array_filters=array_filters, **kwargs)
+        self.filter = filter
+        self.update = update
+        self.upsert = upsert
+        self.array_filters = array_filters
+
+
+class DeleteOne(pymongo.DeleteOne):
+    def __init__(self, filter, **kwargs):
+        super().__init__(filter, **kwargs)
+        self.filter = filter
+
+
+class DeleteMany(pymongo.DeleteMany):
+    def __init__(self, filter, **kwargs):
+        super().__init__(filter, **kwargs)
+        self.filter = filter
+
+
+# RELIC_STORAGE=memory runs everything from the optimized_db.*.json dumps, anything else uses mongod
+def default_storage(db_name="optimized_db"):
+    if os.environ.get("RELIC_STORAGE", "mongo").lower() == "memory":
+        return Memory_Storage(db_name)
+    return Mongo_Storage(db_name=db_name)
+
+
+class Mongo_Storage():
+    def __init__(self, client=None, db_name="optimized_db"):
+        self.client = client or MongoClient(os.environ.get("RELIC_MONGO_URI", "mongodb://localhost:27017/"))
+        self.db = self.client[db_name]
+
+    def __getitem__(self, name):
+        return self.db[name]
+
+    def refresh_set_prices(self):
+        pipeline = [
+            {
+                '$lookup': {
+                    'from': 't_rd',
+                    'localField': 'set_id',
+                    'foreignField': 'item_id',
+                    'as': 'set_price_info'
+                }
+            }, {
+                '$unwind': {
+                    'path': '$set_price_info',
+                    'preserveNullAndEmptyArrays': True
+                }
+            }, {
+                '$addFields': {
+                    'price_set': {
+                        'set_p90d': '$set_price_info.price_90d',
+                        'set_p48h': '$set_price_info.price_48h'
+                    }
+                }
+            }, {
+                '$unwind': '$parts_in_set'
+            }, {
+                '$lookup': {
+                    'from': 't_rd',
+                    'localField': 'parts_in_set.item_id',
+                    'foreignField': 'item_id',
+                    'as': 'parts_in_set.price_info'
+                }
+            }, {
+                '$unwind': {
+                    'path': '$parts_in_set.price_info',
+                    'preserveNullAndEmptyArrays': True
+                }
+            }, {
+                '$addFields': {
+                    'parts_in_set.price': {
+                        'price_90': '$parts_in_set.price_info.price_90d',
+                        'price_48': '$parts_in_set.price_info.price_48h'
+                    }
+                }
+            }, {
+                '$group': {
+                    '_id': '$_id',
+                    'set_url': {
+                        '$first': '$set_url'
+                    },
+                    'set_id': {
+                        '$first': '$set_id'
+                    },
+                    'price_set': {
+                        '$first': '$price_set'
+                    },
+                    'parts_in_set': {
+                        '$push': '$parts_in_set'
+                    }
+                }
+            }, {
+                '$project': {
+                    'parts_in_set.price_info': 0
+                }
+            }]
+
+        updated_ps = self.db["t_ps"].aggregate(pipeline)
+        bulk_operations = [
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": doc}
+            ) for doc in updated_ps
+        ]
+        if bulk_operations:
+            self.db["t_ps"].bulk_write(bulk_operations)
+
+    def refresh_relic_prices(self):
+        pipeline = [
+                {
+                    '$lookup': {
+                        'from': 't_rd',
+                        'localField': 'relic_id',
+                        'foreignField': 'item_id',
+                        'as': 'relic_price_info'
+                    }
+                }, {
+                    '$unwind': {
+                        'path': '$relic_price_info',
+                        'preserveNullAndEmptyArrays': True
+                    }
+                }, {
+                    '$addFields': {
+                        'relic_detail.relic_p90d': '$relic_price_info.price_90d',
+                        'relic_detail.relic_p48h': '$relic_price_info.price_48h'
+                    }
+                }, {
+                    '$addFields': {
+                        'filtered_part_rewards': {
+                            '$filter': {
+                                'input': '$relic_detail.part_rewards',
+                                'as': 'part',
+                                'cond': {
+                                    '$ifNull': [
+                                        '$$part.part_id', False
+                                    ]
+                                }
+                            }
+                        }
+                    }
+                }, {
+                    '$lookup': {
+                        'from': 't_rd',
+                        'localField': 'filtered_part_rewards.part_id',
+                        'foreignField': 'item_id',
+                        'as': 'relic_price_info'
+                    }
+                }, {
+                    '$addFields': {
+                        'relic_detail.part_rewards': {
+                            '$map': {
+                                'input': '$relic_detail.part_rewards',
+                                'as': 'part',
+                                'in': {
+                                    '$mergeObjects': [
+                                        '$$part', {
+                                            # Only the prices of the part's t_rd row, missing ones leave the reward as it is
+                                            '$let': {
+                                                'vars': {
+                                                    'price': {
+                                                        '$arrayElemAt': [
+                                                            {
+                                                                '$filter': {
+                                                                    'input': '$relic_price_info',
+                                                                    'as': 'priceInfo',
+                                                                    'cond': {
+                                                                        '$eq': [
+                                                                            '$$priceInfo.item_id', '$$part.part_id'
+                                                                        ]
+                                                                    }
+                                                                }
+                                                            }, 0
+                                                        ]
+                                                    }
+                                                },
+                                                'in': {
+                                                    'price_90d': '$$price.price_90d',
+                                                    'price_48h': '$$price.price_48h'
+                                                }
+                                            }
+                                        }
+                                    ]
+                                }
+                            }
+                        }
+                    }
+                }, {
+                    '$project': {
+                        'filtered_part_rewards': 0,
+                        'relic_price_info': 0
+                    }
+                }
+            ]
+        updated_rc = self.db["t_rc"].aggregate(pipeline)
+        bulk_operations = [
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": doc}
+            ) for doc in updated_rc
+        ]
+        if bulk_operations:
+            self.db["t_rc"].bulk_write(bulk_operations)
+
+
+class Memory_Storage():
+    def __init__(self, db_name="optimized_db", dump_dir=ROOT, load=True, dumped=DUMPED_COLLECTIONS):
+        self.name = db_name
+        self.dump_dir = dump_dir
+        self.dumped = dumped
+        self.collections = {}
+        if load:
+            for name in dumped:
+                path = os.path.join(dump_dir, f"{db_name}.{name}.json")
+                if os.path.exists(path):
+                    with open(path) as f:
+                        docs = json.loads(f.read(), object_hook=object_id_hook)
+                    # Freshly parsed documents are stored as-is, without the defensive copy of insert_one
+                    for doc in docs:
+                        self[name]._store(doc)
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = Memory_Collection(name)
+        return self.collections[name]
+
+    def dump(self, dump_dir=None):
+        for name in self.dumped:
+            path = os.path.join(dump_dir or self.dump_dir, f"{self.name}.{name}.json")
+            with open(path, "w") as f:
+                f.write(json_util.dumps(list(self[name].docs.values()), indent=2))
+
+    def refresh_set_prices(self):
+        prices = {doc["item_id"]: doc for doc in self["t_rd"].docs.values()}
+        for doc in list(self["t_ps"].docs.values()):
+            set_price = prices.get(doc.get("set_id"), {})
+            price_set = {key: set_price[field] for key, field in (("set_p90d", "price_90d"), ("set_p48h", "price_48h"))
+                         if field in set_price}
+            parts = []
+            for part in doc.get("parts_in_set", []):
+                part_price = prices.get(part.get("item_id"), {})
+                parts.append({**part, "price": {key: part_price[field] for key, field in (("price_90", "price_90d"), ("price_48", "price_48h"))
+                                                if field in part_price}})
+            self["t_ps"].update_one({"_id": doc["_id"]}, {"$set": {"price_set": price_set, "parts_in_set": parts}})
+
+    def refresh_relic_prices(self):
+        prices = {doc["item_id"]: doc for doc in self["t_rd"].docs.values()}
+        for doc in list(self["t_rc"].docs.values()):
+            relic_price = prices.get(doc.get("relic_id"), {})
+            changes = {"relic_detail.relic_p90d": relic_price.get("price_90d"),
+                       "relic_detail.relic_p48h": relic_price.get("price_48h")}
+            rewards = []
+            for reward in doc["relic_detail"].get("part_rewards", []):
+                part_price = prices.get(reward.get("part_id"), {})
+                reward = {**reward, **{key: part_price[key] for key in ("price_90d", "price_48h") if key in part_price}}
+                rewards.append(reward)
+            changes["relic_detail.part_rewards"] = rewards
+            self["t_rc"].update_one({"_id": doc["_id"]}, {"$set": changes})
+
+
+class Result():
+    def __init__(self, **counts):
+        self.inserted_id = None
+        self.upserted_id = None
+        self.inserted_count = self.matched_count = self.modified_count = 0
+        self.upserted_count = self.deleted_count = 0
+        self.__dict__.update(counts)
+
+
+class Memory_Cursor():
+    def __init__(self, collection, docs, projection, plan):
+        self.collection = collection
+        self.docs = docs
+        self.projection = projection
+        self.plan = plan
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=1):
+        self.docs = sort_docs(self.docs, key_or_list, direction)
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def explain(self):
+        return {"queryPlanner": {"namespace": self.collection.name, "winningPlan": self.plan}}
+
+    def __iter__(self):
+        docs = self.docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        for doc in docs:
+            yield project(doc, self.projection)
+
+    def to_list(self):
+        return list(self)
+
+
+# Collections are shared with the GUI thread while a loader writes from its worker thread
+def locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class Memory_Collection():
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.RLock()
+        self.docs = {}
+        # key -> (unique, {value: set of _id})
+        self.indexes = {"_id": (True, {})}
+        # Insertion order, so index hits come back in natural order like a scan would
+        self.order = {}
+        self.seq = 0
+        self.ops = 0
+
+    # Index maintenance
+    @locked
+    def create_index(self, keys, unique=False, **kwargs):
+        key = keys if isinstance(keys, str) else ",".join(k for k, _ in keys)
+        # A compound index also serves queries on its leading field
+        if "," in key:
+            self.create_index(key.split(",")[0])
+        if key not in self.indexes:
+            self.indexes[key] = (unique, {})
+            for _id, doc in self.docs.items():
+                self._index_add(key, doc, _id)
+        return key.replace(",", "_") + "_1"
+
+    def index_information(self):
+        return {key: {"key": [(k, 1) for k in key.split(",")], "unique": unique} for key, (unique, _) in self.indexes.items()}
+
+    def _index_values(self, key, doc):
+        if "," in key:
+            parts = [tuple(sorted(v for v in get_values(doc, k) if hashable(v))) or (None,) for k in key.split(",")]
+            values = {()}
+            for part in parts:
+                values = {prefix + (value,) for prefix in values for value in part}
+            return values
+        return {v for v in get_values(doc, key) if hashable(v)} or {None}
+
+    def _index_add(self, key, doc, _id):
+        unique, entries = self.indexes[key]
+        for value in self._index_values(key, doc):
+            holders = entries.setdefault(value, set())
+            if unique and holders - {_id}:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {key} dup key: {value!r}")
+            holders.add(_id)
+
+    def _index_remove(self, doc, _id):
+        for key, (_, entries) in self.indexes.items():
+            for value in self._index_values(key, doc):
+                holders = entries.get(value)
+                if holders is not None:
+                    holders.discard(_id)
+                    if not holders:
+                        del entries[value]
+
+    def _store(self, doc):
+        _id = doc["_id"]
+        added = []
+        try:
+            for key in self.indexes:
+                self._index_add(key, doc, _id)
+                added.append(key)
+        except DuplicateKeyError:
+            for key in added:
+                for value in self._index_values(key, doc):
+                    holders = self.indexes[key][1].get(value)
+                    if holders is not None:
+                        holders.discard(_id)
+                        if not holders:
+                            del self.indexes[key][1][value]
+            raise
+        self.docs[_id] = doc
+        if _id not in self.order:
+            self.order[_id] = self.seq
+            self.seq += 1
+
+    # Query planning: use an index for an equality or $in on an indexed field
+    def _candidates(self, query):
+        query = query or {}
+        # Full equality on a compound index
+        for key, (_, entries) in self.indexes.items():
+            fields = key.split(",")
+            if len(fields) > 1 and all(f in query and hashable(query[f]) and not isinstance(query[f], dict) for f in fields):
+                ids = entries.get(tuple(query[f] for f in fields), set())
+                docs = [self.docs[_id] for _id in sorted(ids, key=self.order.__getitem__)]
+                return docs, {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": key}}
+
+        for key, cond in query.items():
+            if key.startswith("$") or key not in self.indexes:
+                continue
+            if isinstance(cond, dict) and any(op.startswith("$") for op in cond):
+                if set(cond) != {"$in"}:
+                    continue
+                values = cond["$in"]
+            else:
+                values = [cond]
+            if not all(hashable(v) for v in values):
+                continue
+            entries = self.indexes[key][1]
+            ids = set()
+            for value in values:
+                ids |= entries.get(value, set())
+            docs = [self.docs[_id] for _id in sorted(ids, key=self.order.__getitem__)]
+            return docs, {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": key}}
+        return list(self.docs.values()), {"stage": "COLLSCAN"}
+
+    @locked
+    def _find(self, query):
+        self.ops += 1
+        candidates, plan = self._candidates(query)
+        return [doc for doc in candidates if matches(doc, query or {})], plan
+
+    # Reads
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0, **kwargs):
+        docs, plan = self._find(filter)
+        cursor = Memory_Cursor(self, docs, projection, plan)
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        for doc in self.find(filter, projection, sort=sort, limit=1):
+            return doc
+        return None
+
+    def count_documents(self, filter=None, **kwargs):
+        if not filter:
+            self.ops += 1
+            return len(self.docs)
+        return len(self._find(filter)[0])
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+    def distinct(self, key, filter=None):
+        values = []
+        for doc in self._find(filter)[0]:
+            for value in get_values(doc, key):
+                if value not in values:
+                    values.append(value)
+        return values
+
+    # $match, $unwind, $group, $project, $sort, $skip, $limit and $count, enough for load_data_structure
+    def aggregate(self, pipeline, **kwargs):
+        pipeline = list(pipeline)
+        # A leading $match uses the indexes like find does
+        query = pipeline.pop(0)["$match"] if pipeline and "$match" in pipeline[0] else {}
+        docs = [copy_value(doc) for doc in self._find(query)[0]]
+        for stage in pipeline:
+            docs = run_stage(docs, stage)
+        return iter(docs)
+
+    # Writes
+    @locked
+    def insert_one(self, doc, **kwargs):
+        self.ops += 1
+        doc = copy_value(doc)
+        doc.setdefault("_id", ObjectId())
+        self._store(doc)
+        return Result(inserted_id=doc["_id"], inserted_count=1)
+
+    def insert_many(self, docs, ordered=True, **kwargs):
+        ids = [self.insert_one(doc).inserted_id for doc in docs]
+        result = Result(inserted_count=len(ids))
+        result.inserted_ids = ids
+        return result
+
+    @locked
+    def _update(self, query, update, upsert, array_filters, many):
+        docs = self._find(query)[0]
+        if not many:
+            docs = docs[:1]
+        result = Result(matched_count=len(docs))
+        for doc in docs:
+            new_doc = copy_value(doc)
+            if is_replacement(update):
+                new_doc = {"_id": doc["_id"], **copy_value(update)}
+            else:
+                apply_update(new_doc, update, array_filters)
+            if new_doc != doc:
+                self._index_remove(doc, doc["_id"])
+                try:
+                    self._store(new_doc)
+                except DuplicateKeyError:
+                    self._store(doc)
+                    raise
+                result.modified_count += 1
+
+        if not docs and upsert:
+            new_doc = {}
+            fields = equality_fields(query)
+            if is_replacement(update):
+                # A replacement takes only the _id from the filter
+                if "_id" in fields:
+                    new_doc["_id"] = fields["_id"]
+                new_doc.update(copy_value(update))
+            else:
+                apply_update(new_doc, {"$set": fields})
+                apply_update(new_doc, update, array_filters, inserting=True)
+            new_doc.setdefault("_id", ObjectId())
+            self._store(new_doc)
+            result.upserted_id = new_doc["_id"]
+            result.upserted_count = 1
+        return result
+
+    def update_one(self, filter, update, upsert=False, array_filters=None, **kwargs):
+        self.ops += 1
+        return self._update(filter, update, upsert, array_filters, many=False)
+
+    def update_many(self, filter, update, upsert=False, array_filters=None, **kwargs):
+        self.ops += 1
+        return self._update(filter, update, upsert, array_filters, many=True)
+
+    def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        self.ops += 1
+        return self._update(filter, replacement, upsert, None, many=False)
+
+    @locked
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=False, array_filters=None, **kwargs):
+        docs, _ = self._find(filter)
+        if sort:
+            docs = sort_docs(docs, sort)
+        if not docs:
+            if not upsert:
+                return None
+            result = self._update(filter, update, True, array_filters, many=False)
+            return project(self.docs[result.upserted_id], projection) if return_document else None
+        before = docs[0]
+        self._update({"_id": before["_id"]}, update, False, array_filters, many=False)
+        return project(self.docs[before["_id"]] if return_document else before, projection)
+
+    def delete_one(self, filter, **kwargs):
+        return self._delete(filter, many=False)
+
+    def delete_many(self, filter, **kwargs):
+        return self._delete(filter, many=True)
+
+    @locked
+    def _delete(self, query, many):
+        docs = self._find(query)[0]
+        if not many:
+            docs = docs[:1]
+        for doc in docs:
+            self._index_remove(doc, doc["_id"])
+            del self.docs[doc["_id"]]
+            del self.order[doc["_id"]]
+        return Result(deleted_count=len(docs))
+
+    @locked
+    def drop(self):
+        self.docs.clear()
+        self.order.clear()
+        self.indexes = {"_id": (True, {})}
+
+    @locked
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        result = Result()
+        errors = []
+        for request in requests:
+            try:
+                if isinstance(request, InsertOne):
+                    self.insert_one(request.document)
+                    result.inserted_count += 1
+                    continue
+                if isinstance(request, (DeleteOne, DeleteMany)):
+                    result.deleted_count += self._delete(request.filter, many=isinstance(request, DeleteMany)).deleted_count
+                    continue
+                if isinstance(request, ReplaceOne):
+                    partial = self.replace_one(request.filter, request.replacement, upsert=request.upsert)
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    partial = self._update(request.filter, request.update, request.upsert,
+                                           request.array_filters, many=isinstance(request, UpdateMany))
+                    self.ops += 1
+                else:
+                    raise TypeError(f"{request!r} is not a valid request, build it with the ops from storage")
+                result.matched_count += partial.matched_count
+                result.modified_count += partial.modified_count
+                result.upserted_count += partial.upserted_count
+            except DuplicateKeyError as e:
+                if ordered:
+                    raise
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        return result
+
+
+# Helpers shared by the in-memory collection
+def object_id_hook(value):
+    if len(value) == 1 and "$oid" in value:
+        return ObjectId(value["$oid"])
+    return value
+
+
+def hashable(value):
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+
+def copy_value(value):
+    if isinstance(value, dict):
+        return {key: copy_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [copy_value(item) for item in value]
+    return value
+
+
+def get_values(doc, path):
+    values = [doc]
+    for segment in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict):
+                if segment in value:
+                    next_values.append(value[segment])
+            elif isinstance(value, list):
+                if segment.isdigit() and int(segment) < len(value):
+                    next_values.append(value[int(segment)])
+                for item in value:
+                    if isinstance(item, dict) and segment in item:
+                        next_values.append(item[segment])
+        values = next_values
+    # Arrays match on their elements as well as on the whole array
+    flat = []
+    for value in values:
+        flat.append(value)
+        if isinstance(value, list):
+            flat.extend(value)
+    return flat
+
+
+def compare_key(value):
+    if value is None or value is _MISSING:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (3, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, ObjectId):
+        return (4, str(value))
+    return (5, str(value))
+
+
+def match_condition(values, cond):
+    if isinstance(cond, re.Pattern):
+        return any(isinstance(v, str) and cond.search(v) for v in values)
+    if not (isinstance(cond, dict) and cond and all(op.startswith("$") for op in cond)):
+        return (cond in values) if values else cond is None
+
+    for op, arg in cond.items():
+        if op == "$eq":
+            ok = (arg in values) if values else arg is None
+        elif op == "$ne":
+            ok = not ((arg in values) if values else arg is None)
+        elif op == "$in":
+            ok = any((a in values) if values else a is None for a in arg)
+        elif op == "$nin":
+            ok = not any((a in values) if values else a is None for a in arg)
+        elif op == "$exists":
+            ok = bool(values) == bool(arg)
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            target = compare_key(arg)
+            candidates = [compare_key(v) for v in values
+                          if not isinstance(v, (list, dict)) and compare_key(v)[0] == target[0]]
+            ok = any({"$gt": c > target, "$gte": c >= target, "$lt": c < target, "$lte": c <= target}[op]
+                     for c in candidates)
+        elif op == "$regex":
+            pattern = re.compile(arg, re.I if "i" in cond.get("$options", "") else 0) if isinstance(arg, str) else arg
+            ok = any(isinstance(v, str) and pattern.search(v) for v in values)
+        elif op == "$options":
+            continue
+        elif op == "$elemMatch":
+            ok = any(isinstance(v, dict) and matches(v, arg) for v in values)
+        elif op == "$size":
+            ok = any(isinstance(v, list) and len(v) == arg for v in values)
+        elif op == "$not":
+            ok = not match_condition(values, arg)
+        else:
+            raise NotImplementedError(f"Unsupported query operator {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub) for sub in cond):
+                return False
+        elif not match_condition(get_values(doc, key), cond):
+            return False
+    return True
+
+
+def sort_docs(docs, key_or_list, direction=1):
+    keys = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+    docs = list(docs)
+    for key, order in reversed(keys):
+        def sort_key(doc, key=key):
+            values = [v for v in get_values(doc, key) if not isinstance(v, list)]
+            if not values:
+                return compare_key(None)
+            return max(map(compare_key, values)) if order < 0 else min(map(compare_key, values))
+        docs.sort(key=sort_key, reverse=order < 0)
+    return docs
+
+
+def project(doc, projection):
+    if not projection:
+        return copy_value(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {key: 1 for key in projection}
+    include = {key: value for key, value in projection.items() if key != "_id" and value}
+    if include:
+        result = {}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for key in include:
+            copy_path(doc, result, key.split("."))
+        return result
+    result = copy_value(doc)
+    for key, value in projection.items():
+        if not value:
+            remove_path(result, key.split("."))
+    return result
+
+
+def copy_path(source, target, segments):
+    head, rest = segments[0], segments[1:]
+    if isinstance(source, list):
+        return [copy_path(item, {}, segments) for item in source if isinstance(item, dict)]
+    if head not in source:
+        return target
+    if not rest:
+        target[head] = copy_value(source[head])
+    elif isinstance(source[head], list):
+        existing = target.get(head) or [{} for item in source[head] if isinstance(item, dict)]
+        items = [item for item in source[head] if isinstance(item, dict)]
+        target[head] = [copy_path(item, sub, rest) for item, sub in zip(items, existing)]
+    elif isinstance(source[head], dict):
+        target[head] = copy_path(source[head], target.get(head, {}), rest)
+    return target
+
+
+def remove_path(target, segments):
+    if isinstance(target, list):
+        for item in target:
+            remove_path(item, segments)
+        return
+    if not isinstance(target, dict) or segments[0] not in target:
+        return
+    if len(segments) == 1:
+        del target[segments[0]]
+    else:
+        remove_path(target[segments[0]], segments[1:])
+
+
+# Fields an upsert copies from its filter: plain and $eq conditions, dotted paths included
+def equality_fields(query):
+    fields = {}
+    for key, value in query.items():
+        if key.startswith("$") or isinstance(value, re.Pattern):
+            continue
+        if isinstance(value, dict) and value and all(op.startswith("$") for op in value):
+            if "$eq" in value:
+                fields[key] = value["$eq"]
+            continue
+        fields[key] = value
+    return fields
+
+
+def is_replacement(update):
+    return not any(key.startswith("$") for key in update)
+
+
+def element_matches(element, identifier, conditions):
+    for key, cond in conditions.items():
+        if key == identifier:
+            if not match_condition([element] + (element if isinstance(element, list) else []), cond):
+                return False
+        elif key.startswith(identifier + "."):
+            if not isinstance(element, dict) or not match_condition(get_values(element, key[len(identifier) + 1:]), cond):
+                return False
+    return True
+
+
+def resolve_targets(doc, segments, array_filters):
+    # Yields (container, key) pairs for a dotted update path, expanding $[] and $[identifier]
+    targets = [(doc, segments)]
+    resolved = []
+    while targets:
+        container, segments = targets.pop()
+        head, rest = segments[0], segments[1:]
+        if head.startswith("$[") and head.endswith("]"):
+            if not isinstance(container, list):
+                continue
+            identifier = head[2:-1]
+            conditions = {}
+            for array_filter in array_filters or []:
+                if any(key == identifier or key.startswith(identifier + ".") for key in array_filter):
+                    conditions.update(array_filter)
+            indexes = [i for i, item in enumerate(container)
+                       if not identifier or element_matches(item, identifier, conditions)]
+            if not rest:
+                resolved.extend((container, i) for i in indexes)
+            else:
+                targets.extend((container[i], rest) for i in indexes)
+            continue
+
+        key = int(head) if isinstance(container, list) and head.isdigit() else head
+        if not rest:
+            resolved.append((container, key))
+            continue
+        if isinstance(container, dict):
+            if key not in container or not isinstance(container[key], (dict, list)):
+                container[key] = {}
+            targets.append((container[key], rest))
+        elif isinstance(container, list) and isinstance(key, int) and key < len(container):
+            targets.append((container[key], rest))
+    return resolved
+
+
+def apply_update(doc, update, array_filters=None, inserting=False):
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            for container, key in resolve_targets(doc, path.split("."), array_filters):
+                current = container.get(key, _MISSING) if isinstance(container, dict) else container[key]
+                if op in ("$set", "$setOnInsert"):
+                    container[key] = copy_value(value)
+                elif op == "$unset":
+                    if isinstance(container, dict):
+                        container.pop(key, None)
+                    else:
+                        container[key] = None
+                elif op == "$inc":
+                    container[key] = (0 if current is _MISSING else current) + value
+                elif op == "$min":
+                    container[key] = value if current is _MISSING or compare_key(value) < compare_key(current) else current
+                elif op == "$max":
+                    container[key] = value if current is _MISSING or compare_key(value) > compare_key(current) else current
+                elif op in ("$push", "$addToSet"):
+                    items = [] if current is _MISSING else current
+                    new_items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                    for item in new_items:
+                        if op == "$push" or item not in items:
+                            items.append(copy_value(item))
+                    container[key] = items
+                elif op == "$pull":
+                    if current is not _MISSING:
+                        container[key] = [item for item in current
+                                          if not (matches(item, value) if isinstance(value, dict) and isinstance(item, dict) else item == value)]
+                else:
+                    raise NotImplementedError(f"Unsupported update operator {op}")
+
+
+# Aggregation, one stage at a time over a list of documents
+def field_value(doc, path):
+    value = doc
+    for segment in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(segment, _MISSING)
+        elif isinstance(value, list):
+            value = [item[segment] for item in value if isinstance(item, dict) and segment in item]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def evaluate(doc, expr):
+    if isinstance(expr, str) and expr.startswith("$"):
+        return field_value(doc, expr[1:])
+    if isinstance(expr, list):
+        return [evaluate(doc, item) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1 and next(iter(expr)).startswith("$"):
+        op, arg = next(iter(expr.items()))
+        if op == "$literal":
+            return arg
+        if op == "$zip":
+            inputs = [evaluate(doc, item) for item in arg["inputs"]]
+            if any(value is _MISSING or value is None for value in inputs):
+                return None
+            if arg.get("useLongestLength"):
+                defaults = arg.get("defaults") or [None] * len(inputs)
+                length = max(map(len, inputs), default=0)
+                return [[value[i] if i < len(value) else default for value, default in zip(inputs, defaults)]
+                        for i in range(length)]
+            return [list(row) for row in zip(*inputs)]
+        if op == "$arrayToObject":
+            pairs = evaluate(doc, arg[0] if isinstance(arg, list) and len(arg) == 1 else arg)
+            if pairs is _MISSING or pairs is None:
+                return None
+            # [[k, v], ...] or [{"k": k, "v": v}, ...]
+            return dict((pair["k"], pair["v"]) if isinstance(pair, dict) else pair for pair in pairs)
+        if op == "$size":
+            return len(evaluate(doc, arg[0] if isinstance(arg, list) else arg))
+        raise NotImplementedError(f"Unsupported expression operator {op}")
+    return {key: evaluate(doc, value) for key, value in expr.items()}
+
+
+def accumulate(op, values):
+    values = [value for value in values if value is not _MISSING]
+    if op == "$push":
+        return values
+    if op == "$addToSet":
+        unique = []
+        for value in values:
+            if value not in unique:
+                unique.append(value)
+        return unique
+    if op == "$first":
+        return values[0] if values else None
+    if op == "$last":
+        return values[-1] if values else None
+    numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    if op == "$sum":
+        return sum(numbers)
+    if op == "$avg":
+        return sum(numbers) / len(numbers) if numbers else None
+    if op in ("$min", "$max"):
+        values = [value for value in values if value is not None]
+        if not values:
+            return None
+        return (min if op == "$min" else max)(values, key=compare_key)
+    raise NotImplementedError(f"Unsupported accumulator {op}")
+
+
+def run_stage(docs, stage):
+    (op, spec), = stage.items()
+    if op == "$match":
+        return [doc for doc in docs if matches(doc, spec)]
+    if op == "$unwind":
+        if isinstance(spec, str):
+            spec = {"path": spec}
+        path = spec["path"][1:]
+        keep = spec.get("preserveNullAndEmptyArrays", False)
+        unwound = []
+        for doc in docs:
+            value = field_value(doc, path)
+            if isinstance(value, list) and value:
+                for item in value:
+                    copy = copy_value(doc)
+                    for container, key in resolve_targets(copy, path.split("."), None):
+                        container[key] = copy_value(item)
+                    unwound.append(copy)
+            elif isinstance(value, list) or value is _MISSING or value is None:
+                if keep:
+                    # An empty array is dropped from the output document, null stays
+                    if isinstance(value, list):
+                        remove_path(doc, path.split("."))
+                    unwound.append(doc)
+            else:
+                unwound.append(doc)
+        return unwound
+    if op == "$group":
+        groups = {}
+        for doc in docs:
+            key = evaluate(doc, spec["_id"])
+            key = None if key is _MISSING else key
+            groups.setdefault(json_util.dumps(key, sort_keys=True), (key, []))[1].append(doc)
+        grouped = []
+        for key, members in groups.values():
+            result = {"_id": key}
+            for field, accumulator in spec.items():
+                if field != "_id":
+                    (acc_op, expr), = accumulator.items()
+                    result[field] = accumulate(acc_op, [evaluate(doc, expr) for doc in members])
+            grouped.append(result)
+        return grouped
+    if op == "$project":
+        computed = {key: value for key, value in spec.items() if not isinstance(value, (bool, int))}
+        # Computed fields make it an inclusion projection, like listing them with 1
+        projection = {**{key: 1 for key in computed}, **{key: value for key, value in spec.items() if key not in computed}}
+        projected = []
+        for doc in docs:
+            result = project(doc, projection)
+            for path, expr in computed.items():
+                value = evaluate(doc, expr)
+                for container, key in resolve_targets(result, path.split("."), None):
+                    if value is _MISSING:
+                        container.pop(key, None)
+                    else:
+                        container[key] = value
+            projected.append(result)
+        return projected
+    if op == "$sort":
+        return sort_docs(docs, list(spec.items()))
+    if op == "$skip":
+        return docs[spec:]
+    if op == "$limit":
+        return docs[:spec]
+    if op == "$count":
+        return [{spec: len(docs)}] if docs else []
+    raise NotImplementedError(f"Unsupported aggregation stage {op}")
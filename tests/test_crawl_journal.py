@@ -0,0 +1,24 @@
+import logging
+from crawl_journal import Crawl_Journal
+from storage import Memory_Collection
+
+
+def test_resume_returns_committed_keys_and_logs(caplog):
+    collection = Memory_Collection("t_cj")
+    journal = Crawl_Journal(collection)
+    assert journal.begin("statistics") == set()
+    journal.record("statistics", ["ash_prime_set", "nova_prime_set"])
+
+    with caplog.at_level(logging.INFO, logger="crawl_journal"):
+        assert Crawl_Journal(collection).begin("statistics") == {"ash_prime_set", "nova_prime_set"}
+    assert caplog.messages == ["Resuming statistics: 2 already committed"]
+
+
+def test_finished_stage_starts_over(capsys):
+    journal = Crawl_Journal(Memory_Collection("t_cj"))
+    journal.begin("raw")
+    journal.record("raw", ["ash_prime_set"])
+    journal.finish("raw")
+    assert journal.begin("raw") == set()
+    # Library code reports through logging, nothing on stdout
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,92 @@
+import asyncio
+import aiohttp
+import pytest
+from aiohttp import web
+from load_optimized import Data_Fetch_Conditions, Initialize_Database
+from storage import Memory_Storage
+
+
+# Local server whose first `slow` requests stall past the client timeout
+async def serve(slow, statuses=()):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        if len(calls) <= slow:
+            await asyncio.sleep(1)
+        if len(calls) <= len(statuses):
+            return web.Response(status=statuses[len(calls) - 1])
+        return web.json_response({"payload": {"ok": len(calls)}})
+
+    app = web.Application()
+    app.router.add_get("/v1/items/{name}/statistics", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/v1", calls
+
+
+def fetcher(api_base, max_retries=3):
+    dfc = Data_Fetch_Conditions(rate=1000, burst=100, max_retries=max_retries, cache_path=None, api_base=api_base,
+                                database=Initialize_Database(Memory_Storage(load=False)))
+    dfc.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=0.2))
+    return dfc
+
+
+def counter(dfc, name):
+    return sum(value for (key, _), value in dfc.metrics.counters.items() if key == name)
+
+
+def test_timeouts_are_retried_with_backoff():
+    async def run():
+        runner, api_base, calls = await serve(slow=2)
+        dfc = fetcher(api_base)
+        try:
+            result = await dfc.fetch_one(f"{api_base}/items/ash_prime_set/statistics")
+        finally:
+            await dfc.close()
+            await runner.cleanup()
+        return dfc, result, calls
+
+    dfc, result, calls = asyncio.run(run())
+    assert result == {"payload": {"ok": 3}}
+    assert len(calls) == 3
+    assert counter(dfc, "http_errors_total") == 2
+    assert counter(dfc, "http_retries_total") == 2
+    assert dfc.throughput_report()["127.0.0.1"]["throttled"] == 2
+
+
+def test_timeouts_give_up_after_max_retries():
+    async def run():
+        runner, api_base, calls = await serve(slow=10)
+        dfc = fetcher(api_base, max_retries=1)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await dfc.fetch_one(f"{api_base}/items/ash_prime_set/statistics")
+        finally:
+            await dfc.close()
+            await runner.cleanup()
+        return dfc, calls
+
+    dfc, calls = asyncio.run(run())
+    assert len(calls) == 2
+    assert counter(dfc, "http_errors_total") == 2
+
+
+def test_server_errors_are_not_retried_twice():
+    async def run():
+        runner, api_base, calls = await serve(slow=0, statuses=(503, 503))
+        dfc = fetcher(api_base, max_retries=1)
+        try:
+            with pytest.raises(aiohttp.ClientResponseError):
+                await dfc.fetch_one(f"{api_base}/items/ash_prime_set/statistics")
+        finally:
+            await dfc.close()
+            await runner.cleanup()
+        return dfc, calls
+
+    dfc, calls = asyncio.run(run())
+    assert len(calls) == 2
+    assert counter(dfc, "http_retries_total") == 1
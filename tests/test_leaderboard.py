@@ -0,0 +1,41 @@
+from leaderboard import Relic_Leaderboard
+from load_optimized import Initialize_Database
+from relic_ev import REFINEMENTS, METRICS
+from storage import Memory_Storage
+
+
+def relic(name, price):
+    return {"relic_name": name, "relic_id": f"{name}-id", "relic_detail": {"relic_p48h": 1.0, "part_rewards": [
+        {"part_id": f"{name}-part", "part_url": f"{name}_part", "rarity": "common", "price_48h": price, "ducats": 15}]}}
+
+
+def database(*relics):
+    database = Initialize_Database(Memory_Storage(load=False))
+    if relics:
+        database.relics_collection.insert_many(list(relics))
+    return database
+
+
+def test_empty_or_other_relics_is_stale():
+    db = database(relic("axi_a1_relic", 10.0), relic("lith_b2_relic", 20.0))
+    leaderboard = Relic_Leaderboard(db)
+    assert leaderboard.stale()
+    leaderboard.refresh()
+    assert not leaderboard.stale()
+    db.relics_collection.insert_one(relic("meso_c3_relic", 5.0))
+    assert leaderboard.stale()
+    assert not Relic_Leaderboard(database()).stale()
+
+
+def test_refresh_writes_only_moved_ranks_and_drops_the_tail():
+    db = database(relic("axi_a1_relic", 10.0), relic("axi_a2_relic", 20.0))
+    leaderboard = Relic_Leaderboard(db)
+    leaderboard.refresh()
+    assert [row["relic_name"] for row in leaderboard.top("Axi", "plat")] == ["axi_a2_relic", "axi_a1_relic"]
+    assert leaderboard.refresh() == 0
+
+    db.relics_collection.delete_many({"relic_name": "axi_a2_relic"})
+    leaderboard.refresh()
+    assert [row["relic_name"] for row in leaderboard.top("Axi", "plat")] == ["axi_a1_relic"]
+    # One rank left on every All and Axi board, the other eras never had any
+    assert db.leaderboard_collection.count_documents({}) == 2 * len(REFINEMENTS) * len(METRICS)
@@ -0,0 +1,35 @@
+import asyncio
+from types import SimpleNamespace
+from catalog import Catalog
+from crawl_journal import Crawl_Journal
+from load_optimized import Database_Upload, Initialize_Database
+from storage import Memory_Storage
+
+ITEMS = [("axi_a1_relic", "a1-id"), ("axi_a2_relic", "a2-id")]
+
+
+def upload(rd_not_corrupted=True):
+    database = Initialize_Database(Memory_Storage(load=False))
+    # Only axi_a1_relic has its t_rd row
+    database.raw_collection.insert_one({"item_id": "a1-id", "url_name": "axi_a1_relic", "price_90d": 5.0, "price_48h": 6.0})
+    upload = Database_Upload()
+    upload.init_DFC = SimpleNamespace(catalog=Catalog(ITEMS), database=database, journal=Crawl_Journal(database.journal_collection),
+                                      rc_not_corrupted=False, rc_not_missing=False, ps_not_corrupted=True,
+                                      rd_not_corrupted=rd_not_corrupted, toggle_pu_rc=False)
+    return upload
+
+
+def test_relics_without_a_t_rd_row_are_left_for_the_next_run():
+    loader = upload()
+    asyncio.run(loader.load_relics())
+    database = loader.init_DFC.database
+    assert [doc["relic_name"] for doc in database.relics_collection.find()] == ["axi_a1_relic"]
+    # The stage stays open with only the written relic committed
+    assert loader.init_DFC.journal.begin("relics") == {"axi_a1_relic"}
+    assert not loader.init_DFC.rc_not_corrupted
+
+
+def test_relics_wait_for_a_complete_t_rd():
+    loader = upload(rd_not_corrupted=False)
+    asyncio.run(loader.load_relics())
+    assert loader.init_DFC.database.relics_collection.count_documents({}) == 0
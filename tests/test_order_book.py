@@ -0,0 +1,94 @@
+import random
+from order_book import Order_Book, Order_Books
+
+
+def order(order_id, side, price, quantity=1, user="u", status="ingame"):
+    return {"id": order_id, "side": side, "price": price, "quantity": quantity, "user": user, "status": status}
+
+
+def api_order(order_id, order_type, platinum, user, status="ingame", visible=True):
+    return {"id": order_id, "order_type": order_type, "platinum": platinum, "quantity": 1, "visible": visible,
+            "user": {"ingame_name": user, "status": status}}
+
+
+# depth/best/top recomputed from the live orders
+def expected_depth(book, side, online):
+    levels = {}
+    for o in book.orders.values():
+        if o["side"] == side and (not online or o["status"] in ("ingame", "online")):
+            levels[o["price"]] = levels.get(o["price"], 0) + o["quantity"]
+    return sorted(levels.items(), reverse=side == "buy")
+
+
+def test_best_and_depth_after_removals():
+    book = Order_Book("ash_prime_set")
+    book.add(order("s1", "sell", 50))
+    book.add(order("s2", "sell", 45, 2))
+    book.add(order("s3", "sell", 45))
+    book.add(order("b1", "buy", 40))
+    book.add(order("b2", "buy", 42, status="offline"))
+    assert book.best_ask()["id"] == "s2"
+    assert book.depth("sell") == [(45, 3), (50, 1)]
+    assert book.best_bid()["id"] == "b2" and book.best_bid(online=True)["id"] == "b1"
+    assert book.spread() == 3
+
+    book.remove("s2")
+    assert book.depth("sell") == [(45, 1), (50, 1)]
+    book.remove("s3")
+    assert book.best_ask()["id"] == "s1"
+    assert book.depth("sell") == [(50, 1)]
+    # The emptied level opens again
+    book.add(order("s4", "sell", 45))
+    assert book.depth("sell") == [(45, 1), (50, 1)]
+    assert book.remove("missing") is None
+
+
+def test_status_changes_move_orders_between_views():
+    books = Order_Books()
+    books.load("ash_prime_set", [api_order("s1", "sell", 50, "alice"), api_order("s2", "sell", 40, "bob", "offline"),
+                                 api_order("s3", "sell", 30, "carol", visible=False)])
+    book = books["ash_prime_set"]
+    assert len(book) == 2
+    assert book.best_ask(online=True)["id"] == "s1"
+    assert book.best_ask()["id"] == "s2"
+
+    books.apply({"type": "status", "user": "bob", "status": "ingame"})
+    assert book.best_ask(online=True)["id"] == "s2"
+    assert book.depth("sell", online=True) == [(40, 1), (50, 1)]
+    books.apply({"type": "status", "user": "alice", "status": "offline"})
+    assert [o["id"] for o in book.top("sell", online=True)] == ["s2"]
+    assert [o["id"] for o in book.top("sell")] == ["s2", "s1"]
+
+    books.apply({"type": "remove", "item": "ash_prime_set", "order_id": "s2"})
+    assert book.best_ask(online=True) is None
+    assert book.depth("sell", online=True) == []
+    # A removed order no longer follows its user's status
+    books.apply({"type": "status", "user": "bob", "status": "online"})
+    assert "s2" not in book.orders
+
+
+def test_random_updates_match_a_recount():
+    rng = random.Random(3)
+    book = Order_Book("nova_prime_set")
+    ids = []
+    for step in range(3000):
+        action = rng.random()
+        if action < 0.5 or not ids:
+            order_id = f"o{step}"
+            ids.append(order_id)
+            book.add(order(order_id, rng.choice(("buy", "sell")), rng.randint(1, 40), rng.randint(1, 3),
+                           status=rng.choice(("ingame", "online", "offline"))))
+        elif action < 0.8:
+            book.remove(ids.pop(rng.randrange(len(ids))))
+        else:
+            book.set_status(rng.choice(ids), rng.choice(("ingame", "offline")))
+        if step % 50 == 0:
+            for side in ("buy", "sell"):
+                for online in (False, True):
+                    expected = expected_depth(book, side, online)
+                    assert book.depth(side, 7, online) == expected[:7]
+                    top = book.top(side, 5, online)
+                    assert [o["price"] for o in top] == sorted((o["price"] for o in book.orders.values()
+                                                                if o["side"] == side and (not online or o["status"] != "offline")),
+                                                               reverse=side == "buy")[:5]
+    assert book.depth("sell", 0) == []
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from price_estimator import Price_Estimator, weighted_median
+
+
+def stats(points):
+    return [{"avg_price": price, "volume": volume} for price, volume in points]
+
+
+def payload(closed, live=()):
+    return {"payload": {"statistics_closed": {"90days": stats(closed)}, "statistics_live": {"48hours": stats(live)}}}
+
+
+def test_weighted_median():
+    prices = np.array([[1.0, 2.0, 3.0, 100.0], [5.0, 1.0, np.nan, np.nan], [np.nan] * 4])
+    weights = np.array([[1.0, 1.0, 5.0, 1.0], [1.0, 3.0, 0, 0], [0.0] * 4])
+    median = weighted_median(prices, weights)
+    assert median[:2].tolist() == [3.0, 1.0]
+    assert np.isnan(median[2])
+
+
+def test_outliers_beyond_clip_mads_are_dropped():
+    # Robust sigma = 1.4826 * MAD(1) = 1.48, 3 sigmas keep 98..102 and drop 400 and 5
+    window = Price_Estimator(clip=3.0, min_scale=0).estimate_window([stats([(98, 10), (99, 10), (100, 10), (101, 10),
+                                                                          (102, 10), (400, 10), (5, 10)])])
+    assert window["points"][0] == 5 and window["clipped"][0] == 2
+    assert window["price"][0] == pytest.approx(100)
+    assert window["volume"][0] == 50
+
+
+def test_clipped_mean_is_volume_weighted():
+    # The center is the median by volume, a price carrying most of the volume is the center, not an outlier
+    window = Price_Estimator(min_scale=0).estimate_window([stats([(100, 30), (104, 10), (1000, 500)])])
+    assert window["points"][0] == 1 and window["price"][0] == pytest.approx(1000)
+    window = Price_Estimator(min_scale=0).estimate_window([stats([(100, 30), (104, 10), (102, 20), (1000, 5)])])
+    assert window["clipped"][0] == 1
+    assert window["price"][0] == pytest.approx((100 * 30 + 104 * 10 + 102 * 20) / 60)
+
+
+def test_scale_floor_keeps_a_flat_series():
+    # MAD of a flat series is 0, without the floor the one tick off by 1 would be clipped
+    flat = stats([(50, 10)] * 9 + [(51, 10)])
+    assert Price_Estimator(min_scale=0).estimate_window([flat])["clipped"][0] == 1
+    assert Price_Estimator(min_scale=0.05).estimate_window([flat])["clipped"][0] == 0
+
+
+def test_missing_volumes_weigh_points_equally():
+    window = Price_Estimator(min_scale=0).estimate_window([[{"avg_price": p} for p in (10, 11, 12)]])
+    assert window["price"][0] == pytest.approx(11)
+    assert window["volume"][0] == 0
+    assert 0 < window["confidence"][0] < 0.5
+
+
+def test_confidence_grows_with_points_and_volume():
+    estimator = Price_Estimator()
+    few, many, thin = estimator.estimate_window([stats([(100, 10)] * 2), stats([(100, 10)] * 60), stats([(100, 1)] * 60)])["confidence"]
+    assert 0 < few < many < 1
+    assert thin < many
+
+
+def test_estimate_fields_per_payload():
+    results = [payload([(100, 10), (102, 10), (98, 10)], [(90, 3)]), payload([], [])]
+    fields = Price_Estimator().estimate(results)
+    assert fields[0]["est_90d"] == pytest.approx(100) and fields[0]["est_48h"] == pytest.approx(90)
+    assert fields[1] == {"est_90d": None, "conf_90d": 0.0, "est_48h": None, "conf_48h": 0.0}
@@ -0,0 +1,24 @@
+import pytest
+from rate_limiter import Token_Bucket, parse_retry_after
+
+
+@pytest.mark.parametrize("rate", [3.0, 1000.0])
+def test_aimd_scales_with_the_configured_rate(rate):
+    bucket = Token_Bucket(rate, 3)
+    for _ in range(20):
+        bucket.backoff()
+    assert bucket.rate == pytest.approx(rate * 0.1)
+    # From the floor back to the full rate in the same number of successes whatever the rate
+    for _ in range(90):
+        bucket.success()
+    assert bucket.rate == pytest.approx(rate)
+    bucket.success()
+    assert bucket.rate == rate
+    assert bucket.report()["throttled"] == 20
+
+
+def test_retry_after_blocks_the_bucket():
+    bucket = Token_Bucket(3.0, 3)
+    bucket.backoff(parse_retry_after("2"))
+    assert bucket.tokens == 0 and bucket.blocked_until > bucket.updated + 1.9
+    assert parse_retry_after("soon") is None
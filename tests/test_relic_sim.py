@@ -0,0 +1,30 @@
+from relic_ev import Relic_EV_Engine
+from relic_sim import Squad_Simulator
+
+
+def relic(name, prices):
+    rarities = ["common"] * 3 + ["uncommon"] * 2 + ["rare"]
+    rewards = [{"part_url": f"{name}_part_{i}", "part_id": f"{name}{i}", "rarity": rarity, "price_48h": price, "ducats": 15}
+               for i, (rarity, price) in enumerate(zip(rarities, prices))]
+    return {"relic_name": name, "relic_id": name, "relic_detail": {"part_rewards": rewards}}
+
+
+def engine():
+    return Relic_EV_Engine([relic("axi_a1_relic", [1, 2, 3, 10, 20, 80]), relic("lith_b2_relic", [5, 5, 5, 5, 5, 5])])
+
+
+def test_process_pool_matches_sequential_run():
+    squad = ["axi_a1_relic", "axi_a1_relic", "lith_b2_relic", "lith_b2_relic"]
+    sequential = Squad_Simulator(engine(), workers=1, chunk_size=10_000)
+    parallel = Squad_Simulator(engine(), workers=2, parallel_threshold=0, chunk_size=10_000)
+    try:
+        # Same seeds per chunk, the spawned workers give the very same sums
+        assert parallel.run(squad, trials=40_000, seed=7) == sequential.run(squad, trials=40_000, seed=7)
+        assert parallel.pool is not None
+        # A run from the background thread reuses the pool
+        pool = parallel.pool
+        assert parallel.submit(squad, trials=40_000, seed=7).result()["trials"] == 40_000
+        assert parallel.pool is pool
+    finally:
+        parallel.close()
+        sequential.close()
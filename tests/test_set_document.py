@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+import pytest
+from catalog import Catalog
+from load_optimized import Database_Upload
+
+ITEMS = [("frost_prime_set", "set-id"), ("frost_prime_blueprint", "bp-id"), ("frost_prime_systems", "sys-id"),
+         ("axi_f1_relic", "relic-id")]
+
+
+def item(url_name, _id, ducats, tax, set_root):
+    return {"id": _id, "url_name": url_name, "ducats": ducats, "trading_tax": tax, "quantity_for_set": 1,
+            "set_root": set_root, "en": {"item_name": url_name.replace("_", " ").title()}}
+
+
+def upload():
+    upload = Database_Upload()
+    upload.init_DFC = SimpleNamespace(catalog=Catalog(ITEMS), id_to_name={_id: name for name, _id in ITEMS})
+    return upload
+
+
+def payloads(root_first):
+    root = item("frost_prime_set", "set-id", 145, 6000, True)
+    parts = [item("frost_prime_blueprint", "bp-id", 100, 4000, False), item("frost_prime_systems", "sys-id", 45, 2000, False)]
+    items_in_set = [root] + parts if root_first else parts + [root]
+    sources = {"frost_prime_blueprint": [{"relic": "relic-id", "rarity": "rare"}]}
+    return [{"payload": {"dropsources": sources.get(name, [])}, "include": {"item": {"items_in_set": items_in_set}}}
+            for name, _ in ITEMS[:3]]
+
+
+@pytest.mark.parametrize("root_first", [True, False])
+def test_set_fields_come_from_the_root_wherever_it_is(root_first):
+    urls = [(name, f"https://api/items/{name}/dropsources?include=item") for name, _ in ITEMS[:3]]
+    lists = [{"url_name": name, "price_90d": 10.0 + i, "price_48h": 20.0 + i} for i, (name, _) in enumerate(ITEMS[:3])]
+    doc = upload().set_document(urls, payloads(root_first), lists)
+
+    assert (doc["set_id"], doc["ducats"], doc["trading_tax"]) == ("set-id", 145, 6000)
+    assert doc["price_set"] == {"set_p90d": 10.0, "set_p48h": 20.0}
+    assert [part["item_id"] for part in doc["parts_in_set"]] == ["bp-id", "sys-id"]
+    assert doc["parts_in_set"][0]["ppn_source_and_rarity"] == [("axi_f1_relic", "rare")]
+    assert doc["parts_in_set"][1]["price"] == {"price_90": 12.0, "price_48": 22.0}
+
+
+def test_set_missing_from_items_in_set_gives_no_document():
+    urls = [("frost_prime_set", "u")]
+    result = {"payload": {"dropsources": []},
+              "include": {"item": {"items_in_set": [item("frost_prime_blueprint", "bp-id", 100, 4000, False)]}}}
+    assert upload().set_document(urls, [result], [{"price_90d": 1, "price_48h": 1}]) == {}
+
+
+def test_set_with_a_part_missing_from_t_rd_is_incomplete():
+    urls = [(name, f"https://api/items/{name}/dropsources?include=item") for name, _ in ITEMS[:3]]
+    lists = [{"url_name": name, "price_90d": 1.0, "price_48h": 2.0} for name, _ in ITEMS[:3]]
+    complete = upload()
+    results = payloads(True)
+    assert complete.set_complete(results, complete.set_document(urls, results, lists))
+
+    # No t_rd row for the systems, the API still lists them in items_in_set
+    doc = complete.set_document(urls[:2], results[:2], lists[:2])
+    assert [part["item_url"] for part in doc["parts_in_set"]] == ["frost_prime_blueprint"]
+    assert not complete.set_complete(results[:2], doc)
+    assert not complete.set_complete(results, {})
@@ -0,0 +1,226 @@
+import pymongo
+import pytest
+from storage import Memory_Collection, Memory_Storage, InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteOne, DeleteMany
+
+
+def collection(docs):
+    c = Memory_Collection("test")
+    c.insert_many(docs)
+    return c
+
+
+def strip_ids(docs):
+    return [{key: value for key, value in doc.items() if key != "_id"} for doc in docs]
+
+
+# The pipeline load_data_structure runs per relic
+def relic_pipeline(relic_name):
+    return [
+        {"$match": {f"ppn_sources_and_rarity.{relic_name}": {"$exists": True}}},
+        {"$group": {"_id": relic_name, "url_names": {"$push": "$item_url"},
+                    "value": {"$push": f"$ppn_sources_and_rarity.{relic_name}"}}},
+        {"$project": {"tuple_value": {"$arrayToObject": {"$zip": {"inputs": ["$url_names", "$value"]}}}}},
+    ]
+
+
+def test_relic_reward_pipeline():
+    parts = collection([
+        {"item_url": "ash_prime_systems", "ppn_sources_and_rarity": {"axi_a1_relic": "rare", "lith_b2_relic": "common"}},
+        {"item_url": "ash_prime_chassis", "ppn_sources_and_rarity": {"axi_a1_relic": "common"}},
+        {"item_url": "nova_prime_set", "ppn_sources_and_rarity": {}},
+    ])
+    assert list(parts.aggregate(relic_pipeline("axi_a1_relic"))) == [
+        {"_id": "axi_a1_relic", "tuple_value": {"ash_prime_systems": "rare", "ash_prime_chassis": "common"}}]
+    assert list(parts.aggregate(relic_pipeline("meso_c3_relic"))) == []
+
+
+def test_unwind():
+    c = collection([{"a": 1, "tags": ["x", "y"]}, {"a": 2, "tags": []}, {"a": 3, "tags": None}, {"a": 4}])
+    assert strip_ids(c.aggregate([{"$unwind": "$tags"}])) == [{"a": 1, "tags": "x"}, {"a": 1, "tags": "y"}]
+    kept = strip_ids(c.aggregate([{"$unwind": {"path": "$tags", "preserveNullAndEmptyArrays": True}}]))
+    assert kept == [{"a": 1, "tags": "x"}, {"a": 1, "tags": "y"}, {"a": 2}, {"a": 3, "tags": None}, {"a": 4}]
+
+
+def test_group_accumulators():
+    c = collection([{"k": "a", "n": 1}, {"k": "b", "n": 5}, {"k": "a", "n": 3}, {"k": "a"}])
+    groups = list(c.aggregate([
+        {"$group": {"_id": "$k", "sum": {"$sum": "$n"}, "avg": {"$avg": "$n"}, "min": {"$min": "$n"},
+                    "max": {"$max": "$n"}, "first": {"$first": "$n"}, "all": {"$push": "$n"}, "set": {"$addToSet": "$k"}}},
+        {"$sort": {"_id": 1}},
+    ]))
+    assert groups == [
+        {"_id": "a", "sum": 4, "avg": 2, "min": 1, "max": 3, "first": 1, "all": [1, 3], "set": ["a"]},
+        {"_id": "b", "sum": 5, "avg": 5, "min": 5, "max": 5, "first": 5, "all": [5], "set": ["b"]},
+    ]
+
+
+def test_project_and_paging():
+    c = collection([{"a": i, "b": {"c": i * 10}} for i in range(5)])
+    docs = list(c.aggregate([{"$sort": {"a": -1}}, {"$skip": 1}, {"$limit": 2},
+                             {"$project": {"_id": 0, "a": 1, "c": "$b.c", "x.y": {"$literal": 1}}}]))
+    assert docs == [{"a": 3, "c": 30, "x": {"y": 1}}, {"a": 2, "c": 20, "x": {"y": 1}}]
+    assert list(c.aggregate([{"$match": {"a": {"$gte": 2}}}, {"$count": "n"}])) == [{"n": 3}]
+
+
+def test_unsupported_stage_is_named():
+    with pytest.raises(NotImplementedError, match=r"\$lookup"):
+        list(collection([{"a": 1}]).aggregate([{"$lookup": {}}]))
+
+
+def test_bulk_write_ops():
+    c = collection([{"k": 1, "v": 0}, {"k": 2, "v": 0}, {"k": 3, "v": 0}])
+    result = c.bulk_write([
+        InsertOne({"k": 4, "v": 0}),
+        UpdateOne({"k": 1}, {"$inc": {"v": 1}}),
+        UpdateOne({"k": 9}, {"$set": {"v": 9}}, upsert=True),
+        UpdateMany({"k": {"$gte": 2}}, {"$set": {"seen": True}}),
+        ReplaceOne({"k": 3}, {"k": 3, "v": 3}),
+        DeleteOne({"k": 4}),
+        DeleteMany({"seen": True, "k": 2}),
+    ])
+    assert result.inserted_count == 1 and result.upserted_count == 1 and result.deleted_count == 2
+    assert sorted((doc["k"], doc["v"]) for doc in c.find()) == [(1, 1), (3, 3), (9, 9)]
+
+
+def test_ops_are_pymongo_ops():
+    # Mongo_Storage hands the same requests to pymongo
+    assert isinstance(UpdateOne({"k": 1}, {"$set": {"v": 1}}, upsert=True), pymongo.UpdateOne)
+    assert isinstance(ReplaceOne({"k": 1}, {"k": 1}), pymongo.ReplaceOne)
+    with pytest.raises(TypeError):
+        collection([]).bulk_write([pymongo.InsertOne({"k": 1})])
+
+
+# Query operators, each expectation is what mongod returns for the same filter
+DOCS = [
+    {"n": 1, "tags": ["x", "y"], "parts": [{"id": "p1", "q": 2}, {"id": "p2", "q": 1}], "name": "Ash Prime"},
+    {"n": 2, "tags": ["y"], "parts": [{"id": "p3", "q": 1}], "name": "nova prime", "a": None},
+    {"n": 3, "tags": [], "name": "Volt", "a": "text"},
+    {"n": 4, "name": "Rhino", "a": 5},
+]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ({"tags": "x"}, [1]),
+    ({"tags": ["y"]}, [2]),
+    ({"a": None}, [1, 2]),
+    ({"a": {"$ne": None}}, [3, 4]),
+    ({"a": {"$exists": False}}, [1]),
+    ({"a": {"$exists": True}}, [2, 3, 4]),
+    ({"a": {"$gt": 1}}, [4]),
+    ({"a": {"$gte": "a"}}, [3]),
+    ({"tags": {"$ne": "x"}}, [2, 3, 4]),
+    ({"tags": {"$in": ["x", "z"]}}, [1]),
+    ({"tags": {"$nin": ["y"]}}, [3, 4]),
+    ({"tags": {"$size": 0}}, [3]),
+    ({"tags.0": "y"}, [2]),
+    ({"parts.id": "p3"}, [2]),
+    ({"parts.q": {"$gt": 1}}, [1]),
+    ({"parts": {"$elemMatch": {"id": "p2", "q": 1}}}, [1]),
+    ({"parts": {"$elemMatch": {"id": "p1", "q": 1}}}, []),
+    ({"name": {"$regex": "prime", "$options": "i"}}, [1, 2]),
+    ({"n": {"$not": {"$lt": 3}}}, [3, 4]),
+    ({"$or": [{"n": 1}, {"a": 5}]}, [1, 4]),
+    ({"$and": [{"n": {"$gt": 1}}, {"n": {"$lt": 4}}]}, [2, 3]),
+    ({"$nor": [{"n": 1}, {"tags": "y"}]}, [3, 4]),
+])
+def test_query_operators(query, expected):
+    c = collection(DOCS)
+    assert sorted(doc["n"] for doc in c.find(query)) == expected
+
+
+def test_indexed_queries_match_scans():
+    scanned = collection(DOCS)
+    indexed = collection(DOCS)
+    indexed.create_index("tags")
+    indexed.create_index("parts.id")
+    indexed.create_index("a")
+    for query in ({"tags": "y"}, {"tags": {"$in": ["x", "y"]}}, {"parts.id": "p1"}, {"a": None}, {"a": 5}):
+        assert [doc["n"] for doc in indexed.find(query)] == [doc["n"] for doc in scanned.find(query)]
+
+
+def test_sort_puts_missing_first_and_limits():
+    c = collection(DOCS)
+    assert [doc["n"] for doc in c.find({}, sort=[("a", 1), ("n", -1)])] == [2, 1, 4, 3]
+    assert [doc["n"] for doc in c.find({}).sort("n", -1).skip(1).limit(2)] == [3, 2]
+
+
+def test_projection():
+    c = collection(DOCS)
+    assert c.find_one({"n": 1}, {"_id": 0, "parts.id": 1, "n": 1}) == {"n": 1, "parts": [{"id": "p1"}, {"id": "p2"}]}
+    assert set(c.find_one({"n": 4}, {"name": 0})) == {"_id", "n", "a"}
+
+
+def test_update_operators():
+    c = collection([{"k": 1, "v": 1, "list": [1, 2, 2], "sub": {"x": 1}}])
+    c.update_one({"k": 1}, {"$set": {"sub.y.z": 2}, "$inc": {"v": 2, "new": 1}, "$unset": {"sub.x": ""},
+                            "$min": {"low": 5}, "$max": {"v": 0}})
+    c.update_one({"k": 1}, {"$push": {"list": {"$each": [3, 3]}}, "$addToSet": {"set": {"$each": [1, 1, 2]}}})
+    c.update_one({"k": 1}, {"$pull": {"list": 2}})
+    doc = c.find_one({"k": 1}, {"_id": 0})
+    assert doc == {"k": 1, "v": 3, "list": [1, 3, 3], "sub": {"y": {"z": 2}}, "new": 1, "low": 5, "set": [1, 2]}
+
+
+def test_array_filters():
+    c = collection([{"k": 1, "rewards": [{"id": "a", "p": 1}, {"id": "b", "p": 1}, {"id": "a", "p": 1}]}])
+    c.update_many({"rewards.id": "a"}, {"$set": {"rewards.$[r].p": 9}}, array_filters=[{"r.id": "a"}])
+    assert [reward["p"] for reward in c.find_one({"k": 1})["rewards"]] == [9, 1, 9]
+    c.update_one({"k": 1}, {"$inc": {"rewards.$[].p": 1}})
+    assert [reward["p"] for reward in c.find_one({"k": 1})["rewards"]] == [10, 2, 10]
+
+
+def test_upserts():
+    c = collection([])
+    result = c.update_one({"k": 1, "n": {"$gt": 0}}, {"$set": {"v": 1}, "$setOnInsert": {"created": True}}, upsert=True)
+    assert result.upserted_count == 1
+    # Equality fields of the filter become fields of the new document, operator conditions do not
+    assert c.find_one({}, {"_id": 0}) == {"k": 1, "v": 1, "created": True}
+    c.update_one({"k": 1}, {"$set": {"v": 2}, "$setOnInsert": {"created": False}}, upsert=True)
+    assert c.find_one({}, {"_id": 0}) == {"k": 1, "v": 2, "created": True}
+    c.update_one({"k": 2}, {"$set": {"v": 3}})
+    assert c.count_documents({}) == 1
+    # A replacement keeps only the filter's _id
+    c.replace_one({"k": 3}, {"v": 4}, upsert=True)
+    assert c.find_one({"v": 4}, {"_id": 0}) == {"v": 4}
+    c.replace_one({"_id": 7, "k": 4}, {"v": 5}, upsert=True)
+    assert c.find_one({"v": 5}) == {"_id": 7, "v": 5}
+    c.update_one({"a.b": 1}, {"$set": {"c": 1}}, upsert=True)
+    assert c.find_one({"c": 1}, {"_id": 0}) == {"a": {"b": 1}, "c": 1}
+
+
+def test_find_one_and_update_returns_before_or_after():
+    c = collection([{"k": 1, "v": 1}, {"k": 2, "v": 1}])
+    before = c.find_one_and_update({"v": 1}, {"$inc": {"v": 1}}, sort=[("k", -1)])
+    assert (before["k"], before["v"]) == (2, 1)
+    after = c.find_one_and_update({"v": 1}, {"$inc": {"v": 1}}, return_document=pymongo.ReturnDocument.AFTER)
+    assert (after["k"], after["v"]) == (1, 2)
+    assert c.find_one_and_update({"v": 1}, {"$inc": {"v": 1}}) is None
+
+
+def test_unique_index_rejects_duplicates_and_keeps_the_old_document():
+    c = collection([{"k": 1}, {"k": 2}])
+    c.create_index("k", unique=True)
+    with pytest.raises(pymongo.errors.DuplicateKeyError):
+        c.insert_one({"k": 1})
+    with pytest.raises(pymongo.errors.DuplicateKeyError):
+        c.update_one({"k": 2}, {"$set": {"k": 1}})
+    assert sorted(doc["k"] for doc in c.find()) == [1, 2]
+    assert [doc["k"] for doc in c.find({"k": 2})] == [2]
+
+
+def test_refresh_relic_prices_merges_only_the_prices():
+    storage = Memory_Storage(load=False)
+    storage["t_rd"].insert_many([
+        {"item_id": "relic-id", "url_name": "axi_a1_relic", "price_90d": 5.0, "price_48h": 6.0},
+        {"item_id": "sys-id", "url_name": "ash_prime_systems", "price_90d": 10.0, "price_48h": 12.0,
+         "set_prefix": "ash", "estimates": {"median": 11.0}, "epoch_t": 1.0},
+    ])
+    storage["t_rc"].insert_one({"relic_id": "relic-id", "relic_detail": {"part_rewards": [
+        {"part_id": "sys-id", "part_name": "Ash Prime Systems", "rarity": "rare"},
+        {"part_id": "gone-id", "part_name": "Forma Blueprint", "rarity": "common", "price_90d": 1.0}]}})
+    storage.refresh_relic_prices()
+
+    detail = storage["t_rc"].find_one({})["relic_detail"]
+    assert (detail["relic_p90d"], detail["relic_p48h"]) == (5.0, 6.0)
+    assert detail["part_rewards"] == [
+        {"part_id": "sys-id", "part_name": "Ash Prime Systems", "rarity": "rare", "price_90d": 10.0, "price_48h": 12.0},
+        {"part_id": "gone-id", "part_name": "Forma Blueprint", "rarity": "common", "price_90d": 1.0}]
@@ -0,0 +1,59 @@
+import pytest
+from trade_chat import Chat_Catalog, Trade_Chat_Parser, parse_price
+
+URL_NAMES = ["aya", "axi_a1_relic", "lith_g1_relic", "ash_prime_blueprint", "forma_blueprint"]
+
+
+def parse(line):
+    return [(offer["intent"], offer["url_name"], offer["refinement"], offer["quantity"], offer["price"], offer["price_max"])
+            for offer in Trade_Chat_Parser(Chat_Catalog(URL_NAMES)).parse(line)]
+
+
+@pytest.mark.parametrize("text, price", [("900", 900), ("1k2", 1200), ("1k25", 1250), ("1,5k", 1500), ("1.5k", 1500)])
+def test_parse_price(text, price):
+    assert parse_price(text) == price
+
+
+def test_quantity_and_price():
+    offers = Trade_Chat_Parser().parse("[12:04] Tenno: WTS [Aya] 6:25p")
+    assert [(offer["sender"], offer["item"], offer["quantity"], offer["price"]) for offer in offers] == [("Tenno", "Aya", 6, 25)]
+
+
+def test_k_prices():
+    assert parse("WTB [Ash Prime Blueprint] 1k2 [Axi A1] 1,5k [Lith G1] 1.5k") == [
+        ("WTB", "ash_prime_blueprint", None, 1, 1200, 1200),
+        ("WTB", "axi_a1_relic", None, 1, 1500, 1500),
+        ("WTB", "lith_g1_relic", None, 1, 1500, 1500)]
+
+
+def test_price_range():
+    assert parse("WTS [Aya] 1k2 ~ 1k8") == [("WTS", "aya", None, 1, 1200, 1800)]
+
+
+def test_refinement_applies_to_the_next_price_only():
+    assert parse("WTS [Axi A1] rad 20p [Lith G1] 15p") == [
+        ("WTS", "axi_a1_relic", "radiant", 1, 20, 20),
+        ("WTS", "lith_g1_relic", None, 1, 15, 15)]
+
+
+def test_priced_items_are_priced_again():
+    assert parse("WTS [Aya] (6:25p, rad 6:35p)") == [
+        ("WTS", "aya", None, 6, 25, 25),
+        ("WTS", "aya", "radiant", 6, 35, 35)]
+
+
+def test_intent_switch_mid_line():
+    assert parse("WTS [Axi A1] 10p WTB [Lith G1] 5p [Aya]") == [
+        ("WTS", "axi_a1_relic", None, 1, 10, 10),
+        ("WTB", "lith_g1_relic", None, 1, 5, 5),
+        ("WTB", "aya", None, 1, None, None)]
+
+
+def test_catalog_resolves_names_without_their_suffix():
+    catalog = Chat_Catalog(URL_NAMES)
+    assert catalog.resolve("Axi A1") == "axi_a1_relic"
+    assert catalog.resolve("Axi A1 Relic") == "axi_a1_relic"
+    assert catalog.resolve("Forma") == "forma_blueprint"
+    # "Ash Prime" is the warframe, not its blueprint
+    assert catalog.resolve("Ash Prime") is None
+    assert catalog.resolve("Ash Prime Blueprint") == "ash_prime_blueprint"
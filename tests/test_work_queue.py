@@ -0,0 +1,157 @@
+import asyncio
+from types import SimpleNamespace
+from storage import Memory_Collection, Memory_Storage
+from load_optimized import Initialize_Database
+from work_queue import Work_Queue, Queue_Worker
+
+
+def make_queue(lease_seconds=60, max_attempts=3):
+    queue = Work_Queue(Memory_Collection("t_wq"), lease_seconds, max_attempts)
+    queue.begin()
+    return queue
+
+
+def test_live_lease_is_not_shared():
+    queue = make_queue()
+    queue.seed("statistics", [("a", "1"), ("b", "2")])
+    first = queue.lease("w1", "statistics", 1)
+    second = queue.lease("w2", "statistics", 5)
+    assert [job["key"] for job in first] == ["a"]
+    assert [job["key"] for job in second] == ["b"]
+    assert queue.lease("w3", "statistics", 5) == []
+
+
+def test_expired_lease_is_taken_over():
+    # A negative lease is already expired when it is taken, like a worker that died right away
+    queue = make_queue(lease_seconds=-1)
+    queue.seed("statistics", [("a", "1")])
+    [job] = queue.lease("dead", "statistics")
+    [again] = queue.lease("alive", "statistics")
+    assert again["_id"] == job["_id"]
+    assert again["worker"] == "alive" and again["attempts"] == 2
+    # The dead worker's late ack does not count, the new holder's does
+    assert not queue.ack(job, "dead")
+    assert queue.ack(again, "alive")
+    assert queue.counts("statistics")["done"] == 1
+
+
+def test_reap_fails_expired_jobs_out_of_attempts():
+    queue = make_queue(lease_seconds=-1, max_attempts=2)
+    queue.seed("statistics", [("a", "1")])
+    queue.lease("w1", "statistics")
+    queue.lease("w2", "statistics")
+    assert queue.lease("w3", "statistics") == []
+    assert queue.outstanding("statistics") == 1
+    queue.reap("statistics")
+    assert queue.outstanding("statistics") == 0
+    assert queue.counts("statistics")["failed"] == 1
+
+
+def test_fail_retries_until_out_of_attempts():
+    queue = make_queue(max_attempts=2)
+    queue.seed("statistics", [("a", "1")])
+    [job] = queue.lease("w1", "statistics")
+    queue.fail(job, "w1", ValueError("boom"))
+    assert queue.counts("statistics")["pending"] == 1
+    [job] = queue.lease("w1", "statistics")
+    queue.fail(job, "w1", ValueError("boom"))
+    assert queue.counts("statistics")["failed"] == 1
+
+
+def test_blocked_jobs_wait_for_their_dependencies():
+    queue = make_queue()
+    queue.seed("statistics", [("ash_prime_set", "s"), ("ash_prime_systems", "p")])
+    queue.seed("prime_set", [("ash", "s")], {"ash": ["statistics:ash_prime_set", "statistics:ash_prime_systems"]})
+    assert queue.lease("w1", "prime_set") == []
+    first, second = queue.lease("w1", "statistics", 2)
+    queue.ack(first, "w1")
+    assert queue.release("prime_set") == 0
+    assert queue.lease("w1", "prime_set") == []
+    queue.ack(second, "w1")
+    assert queue.release("prime_set") == 1
+    assert [job["key"] for job in queue.lease("w1", "prime_set")] == ["ash"]
+
+
+def test_failed_dependency_fails_the_blocked_job():
+    queue = make_queue(max_attempts=1)
+    queue.seed("statistics", [("ash_prime_set", "s")])
+    queue.seed("prime_set", [("ash", "s")], {"ash": ["statistics:ash_prime_set", "statistics:missing"]})
+    [job] = queue.lease("w1", "statistics")
+    queue.ack(job, "w1")
+    queue.release("prime_set")
+    assert queue.counts("prime_set")["failed"] == 1
+    assert queue.outstanding("prime_set") == 0
+
+
+def test_stale_complete_does_not_end_a_new_worker():
+    collection = Memory_Collection("t_wq")
+    old = Work_Queue(collection)
+    old.begin()
+    old.finish()
+    worker = Work_Queue(collection)
+    # A worker started before the next coordinator has joined no run yet
+    joined = worker.running()
+    assert joined is None and not worker.finished(joined)
+
+    new = Work_Queue(collection)
+    assert not new.begin()
+    assert new.run != old.run
+    joined = worker.running()
+    assert joined == new.run and not worker.finished(joined)
+    # The old coordinator finishing again does not touch the new run
+    old.finish()
+    assert not worker.finished(joined)
+    new.finish()
+    assert worker.finished(joined)
+
+
+def test_begin_resumes_a_started_run():
+    collection = Memory_Collection("t_wq")
+    first = Work_Queue(collection)
+    first.begin()
+    first.seed("statistics", [("a", "1")])
+    second = Work_Queue(collection)
+    assert second.begin()
+    assert second.run == first.run
+    assert second.outstanding("statistics") == 1
+
+
+def test_resumed_run_retries_failed_jobs():
+    queue = make_queue(max_attempts=1)
+    queue.seed("statistics", [("ash_prime_set", "s")])
+    queue.seed("prime_set", [("ash", "s")], {"ash": ["statistics:ash_prime_set"]})
+    [job] = queue.lease("w1", "statistics")
+    queue.fail(job, "w1", ValueError("boom"))
+    queue.release("prime_set")
+    assert queue.counts("prime_set")["failed"] == 1
+
+    resumed = Work_Queue(queue.collection, max_attempts=1)
+    assert resumed.begin()
+    assert resumed.retry_failed() == 2
+    assert resumed.counts("statistics")["pending"] == 1
+    assert resumed.counts("prime_set")["blocked"] == 1
+    assert [job["key"] for job in resumed.lease("w1", "statistics")] == ["ash_prime_set"]
+
+
+def test_bad_payload_fails_only_its_job():
+    async def fetch_one(url):
+        return {"payload": url.split("/")[-2]}
+
+    def process_statistics(result):
+        if result["payload"] == "bad":
+            raise KeyError("statistics_closed")
+        return (1.0, 2.0)
+
+    written = []
+    worker = Queue_Worker(Initialize_Database(Memory_Storage(load=False)), "w1")
+    worker.queue.begin()
+    worker.upload = SimpleNamespace(
+        init_DFC=SimpleNamespace(api_base="http://api", fetch_one=fetch_one, process_statistics=process_statistics),
+        statistics_fields=lambda key, p_90, p_48: {"url_name": key},
+        write_statistics=lambda updates, payloads: written.extend(updates))
+    worker.queue.seed("statistics", [("good", "1"), ("bad", "2")])
+    asyncio.run(worker.run_statistics(worker.queue.lease("w1", "statistics", 2)))
+
+    assert written == [("1", {"url_name": "good"})]
+    assert worker.stats == {"done": 1, "failed": 1, "lost": 0}
+    assert worker.queue.counts("statistics")["pending"] == 1
@@ -0,0 +1,144 @@
+import re
+
+INTENTS = {"wtb": "WTB", "wts": "WTS", "wtt": "WTT"}
+REFINEMENT_WORDS = {"int": "intact", "intact": "intact", "exc": "exceptional", "exceptional": "exceptional",
+                    "flaw": "flawless", "flawless": "flawless", "rad": "radiant", "radiant": "radiant"}
+
+PRICE = r"\d+(?:[.,]\d+)?k\d*|\d+"
+ITEM = re.compile(r"\[([^\[\]]{1,80})\]")
+# Text between two bracketed items, lower-cased: intents, refinement words and prices
+GAP_TOKEN = re.compile(rf"""
+    \b(wt[bst])\b
+  | \b(int|intact|exc|exceptional|flaw|flawless|rad|radiant)\b
+  | (?<![\w.])(?:(\d+)\s*[:x]\s*)?({PRICE})\s*(?:p(?:l(?:at)?)?\b)?(?:\s*(?:~|-|to)\s*({PRICE})\s*(?:p(?:l(?:at)?)?\b)?)?(?![\w.])
+""", re.VERBOSE)
+# Optional log prefix: "[12:04] name: message" or "name: message"
+PREFIX = re.compile(r"^(?:\[\d{1,2}:\d{2}(?::\d{2})?\]\s*)?(?:(?P<sender>[\w.\-]+):\s)?")
+NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+# "1k2" -> 1200, "1.5k" -> 1500, "900" -> 900
+def parse_price(text):
+    text = text.lower()
+    if "k" not in text:
+        return int(text)
+    whole, _, rest = text.partition("k")
+    price = float(whole.replace(",", ".")) * 1000
+    if rest:
+        price += int(rest) * 10 ** (3 - len(rest)) if len(rest) <= 3 else int(rest)
+    return int(price)
+
+
+# Bracketed chat names -> url_name from t_rd, also without the "blueprint"/"relic" suffix players leave out
+class Chat_Catalog():
+    def __init__(self, url_names):
+        self.names = {}
+        for url_name in url_names:
+            self.names.setdefault(url_name, url_name)
+            for suffix in ("_blueprint", "_relic"):
+                if url_name.endswith(suffix) and not url_name.endswith("_prime" + suffix):
+                    self.names.setdefault(url_name[:-len(suffix)], url_name)
+        self.memo = {}
+
+    @classmethod
+    def from_database(cls, database):
+        return cls(doc["url_name"] for doc in database.raw_collection.find({}, {"url_name": 1}))
+
+    def resolve(self, text):
+        if text not in self.memo:
+            self.memo[text] = self.names.get(NON_WORD.sub("_", text.lower()).strip("_"))
+        return self.memo[text]
+
+
+# Parses WTB/WTS/WTT chat into offers. A price applies to the items listed since the last price,
+# or to the last priced items again ("[Aya] (6:25p, rad 6:35p)"); a refinement word qualifies the next price.
+class Trade_Chat_Parser():
+    def __init__(self, catalog=None, max_gaps=100_000):
+        self.catalog = catalog
+        # Chat repeats the same few fragments (" 15p ", " rad 20-25p ", " WTS "), each is tokenized once
+        self.gaps = {}
+        self.max_gaps = max_gaps
+
+    def scan(self, gap):
+        tokens = []
+        for intent, refinement, quantity, low, high in GAP_TOKEN.findall(gap.lower()):
+            if intent:
+                tokens.append(("intent", INTENTS[intent]))
+            elif refinement:
+                tokens.append(("refinement", REFINEMENT_WORDS[refinement]))
+            else:
+                low = parse_price(low)
+                tokens.append(("price", int(quantity) if quantity else 1, low, parse_price(high) if high else low))
+        if len(self.gaps) >= self.max_gaps:
+            self.gaps.clear()
+        self.gaps[gap] = tokens
+        return tokens
+
+    def offer(self, intent, sender, item, refinement, quantity, low, high):
+        return {"intent": intent, "sender": sender, "item": item, "url_name": self.resolve(item),
+                "refinement": refinement, "quantity": quantity, "price": low, "price_max": high}
+
+    def resolve(self, item):
+        return self.catalog.resolve(item) if self.catalog else None
+
+    def parse(self, line):
+        # Every offer names an item, nothing to do without brackets
+        if "[" not in line:
+            return []
+        prefix = PREFIX.match(line)
+        sender = prefix.group("sender")
+        if sender and sender.lower() in INTENTS:
+            sender = None
+            body = line
+        else:
+            body = line[prefix.end():]
+
+        offers = []
+        offer = self.offer
+        intent = None
+        refinement = None
+        pending = []
+        priced = []
+        # [gap, item, gap, item, ..., gap]
+        parts = ITEM.split(body)
+        parts.append(None)
+        gaps = self.gaps
+        for gap, name in zip(parts[::2], parts[1::2]):
+            tokens = gaps.get(gap)
+            if tokens is None:
+                tokens = self.scan(gap)
+            for token in tokens:
+                kind = token[0]
+                if kind == "price":
+                    targets = pending or priced
+                    if not targets:
+                        continue
+                    _, quantity, low, high = token
+                    for item in targets:
+                        offers.append(offer(intent, sender, item, refinement, quantity, low, high))
+                    priced = targets
+                    pending = []
+                    refinement = None
+                elif kind == "refinement":
+                    refinement = token[1]
+                else:
+                    for item in pending:
+                        offers.append(offer(intent, sender, item, refinement, 1, None, None))
+                    intent = token[1]
+                    refinement = None
+                    pending = []
+                    priced = []
+            if name is not None and intent is not None:
+                pending.append(name.strip())
+        for item in pending:
+            offers.append(offer(intent, sender, item, refinement, 1, None, None))
+        return offers
+
+    # Generator over any iterable of lines
+    def stream(self, lines):
+        for line in lines:
+            yield from self.parse(line)
+
+    def parse_log(self, path, encoding="utf-8"):
+        with open(path, encoding=encoding, errors="replace") as f:
+            yield from self.stream(f)
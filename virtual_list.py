@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import customtkinter as ctk
+
+
+# List-like view over a paged query, only a few pages are held at once
+class Paged_Source():
+    def __init__(self, fetch_page, size, page_size=100, max_pages=4):
+        self.fetch_page = fetch_page
+        self.size = size
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = OrderedDict()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        page, offset = divmod(i, self.page_size)
+        if page in self.pages:
+            self.pages.move_to_end(page)
+        else:
+            self.pages[page] = self.fetch_page(page, self.page_size)
+            if len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+        rows = self.pages[page]
+        return rows[offset] if offset < len(rows) else None
+
+
+# Scrolling list that keeps one widget per visible row and rebinds them to the data as it scrolls.
+# data is any sized, indexable source; format_row turns an item into the row's text.
+class Virtual_List(ctk.CTkFrame):
+    def __init__(self, master, row_height=28, format_row=str, command=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.row_height = row_height
+        self.format_row = format_row
+        self.command = command
+        self.data = []
+        self.first = 0
+        self.rows = []
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        self.frm_rows = ctk.CTkFrame(self, fg_color="transparent")
+        self.frm_rows.grid(row=0, column=0, sticky="nsew")
+        self.frm_rows.grid_columnconfigure(0, weight=1)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.frm_rows.bind("<Configure>", self.on_resize)
+        self.bind_wheel(self.frm_rows)
+
+    def bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self.on_wheel)
+        widget.bind("<Button-4>", lambda _: self.scroll_to(self.first - 3))
+        widget.bind("<Button-5>", lambda _: self.scroll_to(self.first + 3))
+
+    # Swaps the data source, the row widgets stay
+    def set_data(self, data, format_row=None):
+        self.data = data
+        if format_row is not None:
+            self.format_row = format_row
+        self.first = 0
+        self.redraw()
+
+    def visible_count(self):
+        return max(1, self.frm_rows.winfo_height() // self.row_height)
+
+    # The pool only grows to the number of rows that fit on screen
+    def on_resize(self, _event=None):
+        needed = self.visible_count()
+        while len(self.rows) < needed:
+            i = len(self.rows)
+            label = ctk.CTkLabel(self.frm_rows, text="", anchor="w", height=self.row_height)
+            label.grid(row=i, column=0, sticky="ew")
+            label.bind("<Button-1>", lambda _, i=i: self.on_click(i))
+            self.bind_wheel(label)
+            self.rows.append(label)
+        self.scroll_to(self.first)
+
+    def on_click(self, i):
+        index = self.first + i
+        if self.command is not None and index < len(self.data):
+            self.command(self.data[index])
+
+    def on_wheel(self, event):
+        self.scroll_to(self.first - (1 if event.delta > 0 else -1) * 3)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(round(float(amount) * len(self.data)))
+        elif unit == "pages":
+            self.scroll_to(self.first + int(amount) * self.visible_count())
+        else:
+            self.scroll_to(self.first + int(amount))
+
+    def scroll_to(self, first):
+        self.first = max(0, min(first, len(self.data) - self.visible_count()))
+        self.redraw()
+
+    def redraw(self):
+        total = len(self.data)
+        shown = min(len(self.rows), self.visible_count())
+        for i, label in enumerate(self.rows):
+            index = self.first + i
+            item = self.data[index] if i < shown and index < total else None
+            label.configure(text="" if item is None else self.format_row(item))
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + shown) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
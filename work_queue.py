@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from pymongo import ReturnDocument
+from load_optimized import Initialize_Database, Database_Upload
+from storage import default_storage, UpdateOne, ReplaceOne
+from relic_index import Relic_Index
+from leaderboard import Relic_Leaderboard
+
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 5
+# Job kinds in crawl order, prime_set jobs read the t_rd rows the statistics jobs wrote
+KINDS = ("statistics", "prime_set")
+CONTROL = "__run__"
+logger = logging.getLogger(__name__)
+
+
+# Jobs in t_wq: {"job": "<kind>:<key>", "kind", "key", "item_id", "run", "after", "status", "worker", "lease_until",
+# "attempts"}. A lease is taken with one find_one_and_update, so two workers never hold the same live lease. A worker
+# that dies keeps its jobs only until lease_until, then any other worker can take them again.
+# The control document {"job": CONTROL, "run", "status"} names the current run, "started" or "complete".
+class Work_Queue():
+    def __init__(self, collection, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.run = None
+
+    def control(self):
+        return self.collection.find_one({"job": CONTROL})
+
+    def status(self):
+        control = self.control()
+        return control["status"] if control else None
+
+    # Starts a run, or resumes one whose coordinator died; returns True when resuming
+    def begin(self):
+        control = self.control()
+        if control is not None and control["status"] == "started" and control.get("run"):
+            self.run = control["run"]
+            return True
+        self.run = uuid.uuid4().hex
+        self.collection.delete_many({})
+        self.collection.insert_one({"job": CONTROL, "run": self.run, "status": "started", "epoch_t": time.time()})
+        return False
+
+    def finish(self):
+        self.collection.update_one({"job": CONTROL, "run": self.run},
+                                   {"$set": {"status": "complete", "epoch_t": time.time()}})
+
+    # Id of the run in progress, None when there is none
+    def running(self):
+        control = self.control()
+        return control.get("run") if control and control["status"] == "started" else None
+
+    # Only the completion of that very run counts, a "complete" left by an earlier crawl does not
+    def finished(self, run):
+        control = self.control()
+        return run is not None and control is not None and control["status"] == "complete" and control.get("run") == run
+
+    # items: (key, item_id); after: key -> job names that must be done first. Such jobs start out
+    # "blocked" until release() sees their dependencies done. Seeding twice adds nothing, jobs already
+    # there keep their state.
+    def seed(self, kind, items, after=None):
+        after = after or {}
+        ops = []
+        for key, item_id in items:
+            depends = after.get(key, [])
+            ops.append(UpdateOne({"job": f"{kind}:{key}"},
+                                 {"$setOnInsert": {"kind": kind, "key": key, "item_id": item_id, "run": self.run,
+                                                   "after": depends, "status": "blocked" if depends else "pending",
+                                                   "worker": None, "lease_until": 0, "attempts": 0}}, upsert=True))
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    # Blocked jobs whose dependencies are all done become pending, those with a failed or missing
+    # dependency fail, they could never run. Returns the number of jobs released.
+    def release(self, kind):
+        blocked = list(self.collection.find({"kind": kind, "status": "blocked"}))
+        if not blocked:
+            return 0
+        names = list({name for job in blocked for name in job["after"]})
+        states = {job["job"]: job["status"] for job in self.collection.find({"job": {"$in": names}}, {"job": 1, "status": 1})}
+        ops = []
+        released = 0
+        for job in blocked:
+            waiting = [states.get(name) for name in job["after"]]
+            if all(state == "done" for state in waiting):
+                ops.append(UpdateOne({"_id": job["_id"], "status": "blocked"}, {"$set": {"status": "pending"}}))
+                released += 1
+            elif any(state in ("failed", None) for state in waiting):
+                missing = [name for name, state in zip(job["after"], waiting) if state != "done"]
+                ops.append(UpdateOne({"_id": job["_id"], "status": "blocked"},
+                                     {"$set": {"status": "failed", "error": f"dependencies not done: {missing}"}}))
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+        return released
+
+    # Up to limit jobs of one kind: pending ones, or leased ones whose lease ran out
+    def lease(self, worker, kind, limit=1):
+        jobs = []
+        for _ in range(limit):
+            now = time.time()
+            job = self.collection.find_one_and_update(
+                {"kind": kind, "attempts": {"$lt": self.max_attempts},
+                 "$or": [{"status": "pending"}, {"status": "leased", "lease_until": {"$lt": now}}]},
+                {"$set": {"status": "leased", "worker": worker, "lease_until": now + self.lease_seconds},
+                 "$inc": {"attempts": 1}},
+                return_document=ReturnDocument.AFTER)
+            if job is None:
+                break
+            jobs.append(job)
+        return jobs
+
+    # False when the lease was lost to another worker, its result was written anyway and is the same
+    def ack(self, job, worker):
+        result = self.collection.update_one({"_id": job["_id"], "worker": worker, "status": "leased"},
+                                            {"$set": {"status": "done", "lease_until": 0, "done_t": time.time()}})
+        return result.modified_count == 1
+
+    def fail(self, job, worker, error):
+        status = "failed" if job["attempts"] >= self.max_attempts else "pending"
+        self.collection.update_one({"_id": job["_id"], "worker": worker, "status": "leased"},
+                                   {"$set": {"status": status, "lease_until": 0, "error": repr(error)}})
+
+    # Expired leases out of attempts are given up on, they would never be leased again
+    def reap(self, kind):
+        self.collection.update_many({"kind": kind, "status": "leased", "lease_until": {"$lt": time.time()},
+                                     "attempts": {"$gte": self.max_attempts}}, {"$set": {"status": "failed"}})
+
+    # On resume, failed jobs get a fresh set of attempts, those with dependencies wait on them again
+    def retry_failed(self):
+        ops = [UpdateOne({"_id": job["_id"], "status": "failed"},
+                         {"$set": {"status": "blocked" if job.get("after") else "pending", "attempts": 0, "lease_until": 0}})
+               for job in self.collection.find({"kind": {"$in": list(KINDS)}, "status": "failed"})]
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def outstanding(self, kind):
+        return self.collection.count_documents({"kind": kind, "status": {"$in": ["blocked", "pending", "leased"]}})
+
+    def counts(self, kind):
+        return {status: self.collection.count_documents({"kind": kind, "status": status})
+                for status in ("blocked", "pending", "leased", "done", "failed")}
+
+
+# One crawl worker: its own session, rate budget and HTTP cache, results written with idempotent upserts
+class Queue_Worker():
+    def __init__(self, database=None, worker_id=None, batch=8, poll_interval=0.5, lease_seconds=LEASE_SECONDS,
+                 **dfc_options):
+        self.database = database or Initialize_Database()
+        self.queue = Work_Queue(self.database.work_queue_collection, lease_seconds)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self.batch = batch
+        self.poll_interval = poll_interval
+        self.dfc_options = dfc_options
+        self.upload = None
+        self.stats = {"done": 0, "failed": 0, "lost": 0}
+
+    async def run(self):
+        self.upload = Database_Upload(database=self.database, **self.dfc_options)
+        await self.upload.instantiate_DFC()
+        # The run this worker took part in, it stops once that run is complete. Started before the
+        # coordinator, it waits for the next run instead of leaving on the last one's "complete".
+        joined = self.queue.running()
+        try:
+            while True:
+                for kind in KINDS:
+                    jobs = self.queue.lease(self.worker_id, kind, self.batch)
+                    if jobs:
+                        joined = jobs[0].get("run") or joined
+                        await getattr(self, f"run_{kind}")(jobs)
+                        break
+                else:
+                    joined = self.queue.running() or joined
+                    if self.queue.finished(joined):
+                        break
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            await self.upload.init_DFC.close()
+        return self.stats
+
+    def settle(self, jobs, results):
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.warning("%s: %r", job["job"], result)
+                self.queue.fail(job, self.worker_id, result)
+                self.stats["failed"] += 1
+            elif self.queue.ack(job, self.worker_id):
+                self.stats["done"] += 1
+            else:
+                self.stats["lost"] += 1
+
+    async def run_statistics(self, jobs):
+        dfc = self.upload.init_DFC
+        results = await asyncio.gather(*(dfc.fetch_one(f"{dfc.api_base}/items/{job['key']}/statistics") for job in jobs),
+                                       return_exceptions=True)
+        results = list(results)
+        updates = []
+        payloads = []
+        for i, (job, result) in enumerate(zip(jobs, results)):
+            if isinstance(result, Exception):
+                continue
+            # A payload that does not process fails its own job, not the batch
+            try:
+                updates.append((job["item_id"], self.upload.statistics_fields(job["key"], *dfc.process_statistics(result))))
+            except Exception as error:
+                results[i] = error
+                continue
+            payloads.append(result)
+        if updates:
+            self.upload.write_statistics(updates, payloads)
+        self.settle(jobs, results)
+
+    async def prime_set(self, job):
+        dfc = self.upload.init_DFC
+        lists = list(self.database.raw_collection.find({"set_prefix": job["key"]}))
+        urls = [(part["url_name"], f"{dfc.api_base}/items/{part['url_name']}/dropsources?include=item") for part in lists]
+        results = await dfc.fetch_all(urls)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+        prime_set = self.upload.set_document(urls, results, lists)
+        if not self.upload.set_complete(results, prime_set):
+            raise LookupError(f"Incomplete t_rd rows for {job['key']}_prime_set")
+        self.database.prime_sets_collection.replace_one({"set_id": prime_set["set_id"]},
+                                                        {"set_id": prime_set["set_id"], **prime_set}, upsert=True)
+
+    async def run_prime_set(self, jobs):
+        results = await asyncio.gather(*(self.prime_set(job) for job in jobs), return_exceptions=True)
+        self.settle(jobs, results)
+
+
+# Seeds the queue from filtered_data, each prime_set job after the statistics jobs of its set and parts,
+# waits for the queue to drain, then builds t_rc and t_lb from what the workers wrote. Needs no HTTP
+# beyond the /items listing.
+class Crawl_Coordinator():
+    def __init__(self, database=None, poll_interval=1.0, lease_seconds=LEASE_SECONDS, **dfc_options):
+        self.database = database or Initialize_Database()
+        self.queue = Work_Queue(self.database.work_queue_collection, lease_seconds)
+        self.poll_interval = poll_interval
+        self.dfc_options = dfc_options
+
+    async def wait(self):
+        while True:
+            outstanding = 0
+            for kind in KINDS:
+                self.queue.reap(kind)
+                self.queue.release(kind)
+                outstanding += self.queue.outstanding(kind)
+            if not outstanding:
+                return {kind: self.queue.counts(kind) for kind in KINDS}
+            await asyncio.sleep(self.poll_interval)
+
+    async def run(self):
+        upload = Database_Upload(database=self.database, **self.dfc_options)
+        await upload.instantiate_DFC()
+        await upload.init_DFC.close()
+        catalog = upload.init_DFC.catalog
+
+        if self.queue.begin():
+            logger.info("Resuming crawl run %s from t_wq, %d failed jobs retried", self.queue.run, self.queue.retry_failed())
+        self.queue.seed("statistics", upload.init_DFC.filtered_data)
+        # A set document reads the t_rd rows of the set and every part
+        sets = [(catalog.set_prefix(name), _id) for name, _id in catalog.by_category["set"]]
+        after = {prefix: [f"statistics:{name}" for name, _ in catalog.members[prefix]] for prefix, _ in sets}
+        self.queue.seed("prime_set", sets, after)
+        report = await self.wait()
+        # t_rc and t_lb are built only from a complete crawl, the run stays started for the next coordinator to resume
+        failed = {kind: report[kind]["failed"] for kind in KINDS if report[kind]["failed"]}
+        if failed:
+            logger.warning("Crawl run %s left resumable, failed jobs: %s", self.queue.run, failed)
+            return report
+        report["relics"] = self.write_relics(upload)
+        Relic_Leaderboard(self.database).refresh()
+        self.queue.finish()
+        return report
+
+    def write_relics(self, upload):
+        relic_index = Relic_Index(self.database)
+        relic_index.rebuild()
+        ops = [ReplaceOne({"relic_id": doc["item_id"]},
+                          upload.relic_document(relic_index, doc["url_name"], doc["item_id"], doc), upsert=True)
+               for doc in self.database.raw_collection.find({"category": "relic"})]
+        if ops:
+            self.database.relics_collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed crawl over the t_wq work queue")
+    parser.add_argument("role", choices=("coordinator", "worker"))
+    parser.add_argument("--db-name", default="optimized_db")
+    parser.add_argument("--api-base", default=None)
+    parser.add_argument("--rate", type=float, default=None, help="this worker's requests/s")
+    parser.add_argument("--burst", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=6)
+    parser.add_argument("--batch", type=int, default=8, help="jobs leased at a time")
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help="seconds before an unacked job is reclaimed")
+    # Several processes on one sqlite file would queue on its write lock, workers cache nothing by default
+    parser.add_argument("--cache-path", default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    dfc_options = {"api_base": args.api_base, "cache_path": args.cache_path, "concurrency": args.concurrency}
+    if args.rate is not None:
+        dfc_options["rate"] = args.rate
+    if args.burst is not None:
+        dfc_options["burst"] = args.burst
+    database = Initialize_Database(default_storage(args.db_name))
+    if args.role == "coordinator":
+        print(asyncio.run(Crawl_Coordinator(database, lease_seconds=args.lease, **dfc_options).run()))
+    else:
+        print(asyncio.run(Queue_Worker(database, batch=args.batch, lease_seconds=args.lease, **dfc_options).run()))
+
+
+if __name__ == "__main__":
+    main()